@@ -117,6 +117,16 @@ def limited(items, request, max_limit=CONF.osapi_max_limit):
                     will cause exc.HTTPBadRequest() exceptions to be raised.
     :kwarg max_limit: The maximum number of items to return from 'items'
     """
+    offset, limit = get_offset_and_limit(request, max_limit)
+    range_end = offset + limit
+    return items[offset:range_end]
+
+
+def get_offset_and_limit(request, max_limit=CONF.osapi_max_limit):
+    """Return the offset, limit tuple requested, as used by limited().
+
+    This lets callers push the slicing done by limited() into their query.
+    """
     try:
         offset = int(request.GET.get('offset', 0))
     except ValueError:
@@ -138,8 +148,7 @@ def limited(items, request, max_limit=CONF.osapi_max_limit):
         raise webob.exc.HTTPBadRequest(explanation=msg)
 
     limit = min(max_limit, limit or max_limit)
-    range_end = offset + limit
-    return items[offset:range_end]
+    return offset, limit
 
 
 def limited_by_marker(items, request, max_limit=CONF.osapi_max_limit):
@@ -46,13 +46,23 @@ class VolumeHostAttributeController(wsgi.Controller):
             volume = resp_obj.obj['volume']
             self._add_volume_trees(req, context, volume)
 
-    # @wsgi.extends
-    # def detail(self, req, resp_obj):
-    #     context = req.environ['cinder.context']
-    #     if authorize(context):
-    #         resp_obj.attach(xml=VolumeListHostAttributeTemplate())
-    #         for vol in list(resp_obj.obj['volumes']):
-    #             self._add_volume_trees(req, context, vol)
+    @wsgi.extends
+    def detail(self, req, resp_obj):
+        context = req.environ['cinder.context']
+        if authorize(context):
+            resp_obj.attach(xml=VolumeListHostAttributeTemplate())
+            key = "%s:tree" % Extended_volume_trees.alias
+            resp_volumes = list(resp_obj.obj['volumes'])
+            # The volumes the listing already loaded, in one lookup
+            cached_volumes = req.get_db_volumes() or {}
+            db_volumes = [cached_volumes[vol['id']] for vol in resp_volumes
+                          if vol['id'] in cached_volumes]
+            # one call per backend host rather than one per volume.
+            volumes_snapshots = self.volume_api.get_volumes_snapshots(
+                context, db_volumes)
+            for vol in resp_volumes:
+                if vol['id'] in volumes_snapshots:
+                    vol[key] = {"snapshots": volumes_snapshots[vol['id']]}
 
 
 class Extended_volume_trees(extensions.ExtensionDescriptor):
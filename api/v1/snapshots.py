@@ -140,6 +140,7 @@ class SnapshotsController(wsgi.Controller):
         search_opts = req.GET.copy()
         search_opts.pop('limit', None)
         search_opts.pop('offset', None)
+        offset, limit = common.get_offset_and_limit(req)
 
         # filter out invalid option
         allowed_search_options = ('status', 'volume_id', 'display_name')
@@ -147,10 +148,11 @@ class SnapshotsController(wsgi.Controller):
                                             allowed_search_options)
 
         snapshots = self.volume_api.get_all_snapshots(context,
-                                                      search_opts=search_opts)
-        limited_list = common.limited(snapshots, req)
-        req.cache_db_snapshots(limited_list)
-        res = [entity_maker(context, snapshot) for snapshot in limited_list]
+                                                      search_opts=search_opts,
+                                                      limit=limit,
+                                                      offset=offset)
+        req.cache_db_snapshots(snapshots)
+        res = [entity_maker(context, snapshot) for snapshot in snapshots]
         return {'snapshots': res}
 
     @wsgi.serializers(xml=SnapshotTemplate)
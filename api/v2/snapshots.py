@@ -139,10 +139,14 @@ class SnapshotsController(wsgi.Controller):
         """Returns a list of snapshots, transformed through entity_maker."""
         context = req.environ['cinder.context']
 
-        # pop out limit and offset , they are not search_opts
+        # pop out the pagination and sort parameters, they are not
+        # search_opts
         search_opts = req.GET.copy()
+        marker = search_opts.pop('marker', None)
         search_opts.pop('limit', None)
         search_opts.pop('offset', None)
+        sort_keys, sort_dirs = common.get_sort_params(search_opts)
+        offset, limit = common.get_offset_and_limit(req)
 
         # filter out invalid option
         allowed_search_options = ('status', 'volume_id', 'name')
@@ -155,10 +159,14 @@ class SnapshotsController(wsgi.Controller):
             del search_opts['name']
 
         snapshots = self.volume_api.get_all_snapshots(context,
-                                                      search_opts=search_opts)
-        limited_list = common.limited(snapshots, req)
-        req.cache_db_snapshots(limited_list)
-        res = [entity_maker(context, snapshot) for snapshot in limited_list]
+                                                      search_opts=search_opts,
+                                                      marker=marker,
+                                                      limit=limit,
+                                                      sort_keys=sort_keys,
+                                                      sort_dirs=sort_dirs,
+                                                      offset=offset)
+        req.cache_db_snapshots(snapshots)
+        res = [entity_maker(context, snapshot) for snapshot in snapshots]
         return {'snapshots': res}
 
     @wsgi.response(202)
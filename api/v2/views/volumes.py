@@ -26,6 +26,9 @@ class ViewBuilder(common.ViewBuilder):
 
     _collection_name = "volumes"
 
+    # Volume fields the summary view reads; summary listings load nothing else
+    summary_fields = ('id', 'display_name')
+
     def __init__(self):
         """Initialize view builder."""
         super(ViewBuilder, self).__init__()
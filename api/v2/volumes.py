@@ -126,7 +126,7 @@ class CommonDeserializer(wsgi.MetadataXMLDeserializer):
         attributes = ['name', 'description', 'size',
                       'volume_type', 'availability_zone', 'imageRef',
                       'image_id', 'snapshot_id', 'source_volid',
-                      'consistencygroup_id']
+                      'consistencygroup_id', 'count']
         for attr in attributes:
             if volume_node.getAttribute(attr):
                 volume[attr] = volume_node.getAttribute(attr)
@@ -237,11 +237,13 @@ class VolumeController(wsgi.Controller):
             except (ValueError, SyntaxError):
                 LOG.debug('Could not evaluate value %s, assuming string', v)
 
+        fields = None if is_detail else self._view_builder.summary_fields
         volumes = self.volume_api.get_all(context, marker, limit,
                                           sort_keys=sort_keys,
                                           sort_dirs=sort_dirs,
                                           filters=filters,
-                                          viewable_admin_meta=True)
+                                          viewable_admin_meta=True,
+                                          fields=fields)
 
         volumes = [dict(vol.iteritems()) for vol in volumes]
 
@@ -420,6 +422,10 @@ class VolumeController(wsgi.Controller):
         multiattach = volume.get('multiattach', False)
         kwargs['multiattach'] = multiattach
 
+        if 'count' in volume:
+            return self._create_batch(req, context, volume['count'], size,
+                                      volume, kwargs)
+
         new_volume = self.volume_api.create(context,
                                             size,
                                             volume.get('display_name'),
@@ -434,6 +440,30 @@ class VolumeController(wsgi.Controller):
 
         return retval
 
+    def _create_batch(self, req, context, count, size, volume, kwargs):
+        """Create count identical volumes with one scheduler request."""
+        sources = [kwargs.pop(key) for key in ('snapshot', 'source_volume',
+                                                'source_replica',
+                                                'consistencygroup')]
+        if any(source is not None for source in sources):
+            msg = _("count can only be used to create empty volumes or "
+                    "volumes from an image.")
+            raise exc.HTTPBadRequest(explanation=msg)
+
+        try:
+            new_volumes = self.volume_api.create_volumes(
+                context, count, size, volume.get('display_name'),
+                volume.get('display_description'), **kwargs)
+        except exception.InvalidInput as error:
+            raise exc.HTTPBadRequest(explanation=error.msg)
+
+        # TODO(vish): Instance should be None at db layer instead of
+        #             trying to lazy load, but for now we turn it into
+        #             a dict to avoid an error.
+        volumes = [self._view_builder.detail(req, dict(new_volume.iteritems()))
+                   ['volume'] for new_volume in new_volumes]
+        return wsgi.ResponseObject({'volumes': volumes}, xml=VolumesTemplate)
+
     def _get_volume_filter_options(self):
         """Return volume search options allowed by non-admin."""
         return ('name', 'status', 'metadata')
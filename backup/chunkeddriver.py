@@ -22,11 +22,18 @@
 """
 
 import abc
+import bisect
+import collections
+import contextlib
 import hashlib
 import json
 import os
 
 import eventlet
+from eventlet import queue
+from eventlet import semaphore
+from eventlet import tpool
+from oslo_concurrency import lockutils
 from oslo_config import cfg
 from oslo_log import log as logging
 from oslo_utils import excutils
@@ -34,9 +41,11 @@ from oslo_utils import units
 import six
 
 from cinder.backup import driver
+from cinder import context
 from cinder import exception
 from cinder.i18n import _, _LE, _LI, _LW
 from cinder.openstack.common import loopingcall
+from cinder import utils
 from cinder.volume import utils as volume_utils
 
 LOG = logging.getLogger(__name__)
@@ -45,10 +54,147 @@ chunkedbackup_service_opts = [
     cfg.StrOpt('backup_compression_algorithm',
                default='zlib',
                help='Compression algorithm (None to disable)'),
+    cfg.IntOpt('backup_pipeline_workers',
+               default=0,
+               help='Number of native threads used to hash and compress '
+                    'backup chunks in parallel. 0 backs up chunks '
+                    'sequentially.'),
+    cfg.IntOpt('backup_pipeline_writers',
+               default=4,
+               help='Number of backup objects written concurrently when '
+                    'backup_pipeline_workers is enabled.'),
+    cfg.IntOpt('backup_pipeline_max_chunks',
+               default=8,
+               help='Maximum number of chunks read from the volume but not '
+                    'yet written to the backup repository when '
+                    'backup_pipeline_workers is enabled. This bounds the '
+                    'memory used by a backup.'),
+    cfg.IntOpt('backup_restore_prefetch',
+               default=0,
+               help='Number of backup objects fetched and decompressed '
+                    'ahead concurrently during a restore. When set, only '
+                    'the objects whose data survives in the final volume '
+                    'are fetched from an incremental backup chain. 0 '
+                    'restores every object of the chain one at a time.'),
+    cfg.BoolOpt('backup_dedup',
+                default=False,
+                help='Store backup data in a content-addressed chunk store '
+                     'shared by all backups in the same container, so data '
+                     'any of them already stored is not written again. '
+                     'Stored chunks are reference counted and removed when '
+                     'the last backup using them is deleted. The chunk '
+                     'index of a container is only locked on the local '
+                     'host, so this requires a single running cinder-backup '
+                     'service: deduplicated backups and deletes are refused '
+                     'while other backup services are up.'),
 ]
 
 CONF = cfg.CONF
 CONF.register_opts(chunkedbackup_service_opts)
+CONF.import_opt('backup_topic', 'cinder.common.config')
+
+
+class ChunkIndex(object):
+    """Content-addressed index of the deduplicated chunks of a container.
+
+    Maps the name of each chunk object to the sha256 of the chunk's
+    uncompressed data, how the chunk is stored and the number of backup
+    metadata entries referring to it.  Chunk objects are named after the
+    hash and the backup that stored them, so concurrent backups never write
+    or remove each other's objects before their references are counted.
+
+    A backup works on a copy of the index read when it starts and records
+    the references it takes; merge() counts them into the current index.
+    """
+
+    VERSION = '1.0'
+    OBJECT_PREFIX = 'dedup-'
+    INDEX_NAME = 'dedup_index'
+
+    def __init__(self, chunks=None, tag=None):
+        self.chunks = chunks if chunks is not None else {}
+        self.tag = tag
+        self._names = dict((chunk['sha256'], object_name)
+                           for object_name, chunk in self.chunks.items())
+        # References taken and chunks stored since the index was read
+        self.references = collections.Counter()
+        self.added = {}
+
+    @classmethod
+    def from_json(cls, index_json, tag=None):
+        return cls(json.loads(index_json)['chunks'], tag)
+
+    def to_json(self):
+        return json.dumps({'version': self.VERSION, 'chunks': self.chunks},
+                          sort_keys=True)
+
+    @classmethod
+    def is_chunk_object(cls, object_name):
+        return object_name.startswith(cls.OBJECT_PREFIX)
+
+    def reference(self, key, offset, length):
+        """Return a metadata entry for a stored chunk, or None if unknown."""
+        object_name = self._names.get(key)
+        if object_name is None:
+            return None
+        chunk = self.chunks[object_name]
+        self.references[object_name] += 1
+        return {object_name: {'offset': offset,
+                              'length': length,
+                              'compression': chunk['compression'],
+                              'md5': chunk['md5']}}
+
+    def add(self, key, obj):
+        """Add a chunk being stored with metadata entry obj.
+
+        Returns the name of the object to store the chunk in.
+        """
+        object_name = '%s%s-%s' % (self.OBJECT_PREFIX, key, self.tag)
+        chunk = {'sha256': key,
+                 'length': obj['length'],
+                 'compression': obj['compression'],
+                 'md5': obj['md5'],
+                 'refs': 0}
+        self.chunks[object_name] = chunk
+        self.added[object_name] = chunk
+        self._names[key] = object_name
+        self.references[object_name] += 1
+        return object_name
+
+    def merge(self, other):
+        """Count the references taken in other into this index.
+
+        Returns the chunk objects other refers to that were released in
+        the meantime, in which case nothing is merged.
+        """
+        released = [object_name for object_name in other.references
+                    if object_name not in self.chunks and
+                    object_name not in other.added]
+        if released:
+            return released
+        for object_name, refs in other.references.items():
+            chunk = self.chunks.get(object_name)
+            if chunk is None:
+                chunk = dict(other.added[object_name], refs=0)
+                self.chunks[object_name] = chunk
+                self._names.setdefault(chunk['sha256'], object_name)
+            chunk['refs'] += refs
+        return []
+
+    def release(self, object_names):
+        """Drop references to chunk objects; return those now unused."""
+        unused = []
+        for object_name in object_names:
+            chunk = self.chunks.get(object_name)
+            if chunk is None:
+                continue
+            chunk['refs'] -= 1
+            if chunk['refs'] <= 0:
+                del self.chunks[object_name]
+                if self._names.get(chunk['sha256']) == object_name:
+                    del self._names[chunk['sha256']]
+                unused.append(object_name)
+        return unused
 
 
 @six.add_metaclass(abc.ABCMeta)
@@ -97,6 +243,11 @@ class ChunkedBackupDriver(driver.BackupDriver):
         self.backup_compression_algorithm = CONF.backup_compression_algorithm
         self.compressor = \
             self._get_compressor(CONF.backup_compression_algorithm)
+        self.pipeline_workers = CONF.backup_pipeline_workers
+        self.pipeline_writers = max(CONF.backup_pipeline_writers, 1)
+        self.pipeline_max_chunks = max(CONF.backup_pipeline_max_chunks, 1)
+        self.restore_prefetch = CONF.backup_restore_prefetch
+        self.dedup = CONF.backup_dedup
 
     # To create your own "chunked" backup driver, implement the following
     # abstract methods.
@@ -247,6 +398,76 @@ class ChunkedBackupDriver(driver.BackupDriver):
         LOG.debug('_read_sha256file finished (%s).', sha256file)
         return sha256file
 
+    def _chunk_index_lock(self, container):
+        return lockutils.lock('backup-dedup-%s' % container.replace('/', '_'),
+                              lock_file_prefix='cinder-', external=True)
+
+    def _check_dedup_host(self):
+        """Refuse to update chunk indexes next to other backup services.
+
+        The chunk index lock is local to this host, so concurrent updates
+        from other hosts sharing a container would lose references.
+        """
+        ctxt = context.get_admin_context()
+        services = self.db.service_get_all_by_topic(ctxt, CONF.backup_topic)
+        hosts = set(service['host'] for service in services
+                    if utils.service_is_up(service))
+        if len(hosts) > 1:
+            err = (_('Deduplicated backups require a single running backup '
+                     'service, found %(count)d: %(hosts)s.')
+                   % {'count': len(hosts), 'hosts': ', '.join(sorted(hosts))})
+            raise exception.InvalidBackup(reason=err)
+
+    def _read_chunk_index(self, container, tag=None):
+        if not self.get_container_entries(container, ChunkIndex.INDEX_NAME):
+            return ChunkIndex(tag=tag)
+        with self.get_object_reader(container,
+                                    ChunkIndex.INDEX_NAME) as reader:
+            return ChunkIndex.from_json(reader.read(), tag)
+
+    def _write_chunk_index(self, container, chunk_index):
+        with self.get_object_writer(container,
+                                    ChunkIndex.INDEX_NAME) as writer:
+            writer.write(chunk_index.to_json())
+
+    def _merge_chunk_index(self, container, chunk_index):
+        """Count the references taken by a backup into the stored index."""
+        with self._chunk_index_lock(container):
+            stored_index = self._read_chunk_index(container)
+            released = stored_index.merge(chunk_index)
+            if released:
+                err = (_('%d deduplicated chunks used by the backup were '
+                         'removed by a concurrent delete, retry the backup.')
+                       % len(released))
+                raise exception.InvalidBackup(reason=err)
+            self._write_chunk_index(container, stored_index)
+        # The stored index now refers to the chunks this backup wrote.
+        chunk_index.added = {}
+
+    @contextlib.contextmanager
+    def _backup_chunk_index(self, backup, container):
+        """Yield the chunk index a backup takes its references from.
+
+        Yields None when deduplication is disabled.  Chunk objects written
+        by a backup that fails before its references are merged are
+        removed; no other backup can refer to them yet.
+        """
+        if not self.dedup:
+            yield None
+            return
+        self._check_dedup_host()
+        chunk_index = self._read_chunk_index(container, backup['id'])
+        try:
+            yield chunk_index
+        except Exception:
+            with excutils.save_and_reraise_exception():
+                for object_name in chunk_index.added:
+                    try:
+                        self.delete_object(container, object_name)
+                    except Exception:
+                        LOG.warning(_LW('Failed to remove chunk %s of a '
+                                        'failed backup.'), object_name)
+
     def _prepare_backup(self, backup):
         """Prepare the backup process and return the backup metadata."""
         backup_id = backup['id']
@@ -285,14 +506,66 @@ class ChunkedBackupDriver(driver.BackupDriver):
         return (object_meta, object_sha256, extra_metadata, container,
                 volume_size_bytes)
 
+    def _calculate_sha256s(self, data):
+        """Return the sha256 of every hash block of data."""
+        shalist = []
+        off = 0
+        datalen = len(data)
+        while off < datalen:
+            chunk_start = off
+            chunk_end = chunk_start + self.sha_block_size_bytes
+            if chunk_end > datalen:
+                chunk_end = datalen
+            chunk = data[chunk_start:chunk_end]
+            sha = hashlib.sha256(chunk).hexdigest()
+            shalist.append(sha)
+            off += self.sha_block_size_bytes
+        return shalist
+
+    def _changed_extents(self, shalist, parent_backup_shalist, shaindex,
+                         datalen):
+        """Return the (start, end) extents of data changed since the parent.
+
+        shaindex is the index in the parent's sha256 list of the first hash
+        block of data.
+        """
+        extents = []
+        extent_off = -1
+        for idx, sha in enumerate(shalist):
+            if sha != parent_backup_shalist[shaindex + idx]:
+                if extent_off == -1:
+                    # Start of new extent.
+                    extent_off = idx * self.sha_block_size_bytes
+            else:
+                if extent_off != -1:
+                    # We've reached the end of extent.
+                    extents.append((extent_off,
+                                    idx * self.sha_block_size_bytes))
+                    extent_off = -1
+
+        # The last extent extends to the end of data buffer.
+        if extent_off != -1:
+            extents.append((extent_off, datalen))
+        return extents
+
     def _backup_chunk(self, backup, container, data, data_offset,
-                      object_meta, extra_metadata):
+                      object_meta, extra_metadata, chunk_index=None):
         """Backup data chunk based on the object metadata and offset."""
         object_prefix = object_meta['prefix']
         object_list = object_meta['list']
 
         object_id = object_meta['id']
         object_name = '%s-%05d' % (object_prefix, object_id)
+        if chunk_index is not None:
+            key = hashlib.sha256(data).hexdigest()
+            obj = chunk_index.reference(key, data_offset, len(data))
+            if obj is not None:
+                LOG.debug('chunk at offset %d is already stored.',
+                          data_offset)
+                object_list.append(obj)
+                object_meta['id'] = object_id + 1
+                eventlet.sleep(0)
+                return
         obj = {}
         obj[object_name] = {}
         obj[object_name]['offset'] = data_offset
@@ -316,13 +589,18 @@ class ChunkedBackupDriver(driver.BackupDriver):
             LOG.debug('not compressing data')
             obj[object_name]['compression'] = 'none'
 
+        md5 = hashlib.md5(data).hexdigest()
+        obj[object_name]['md5'] = md5
+        if chunk_index is not None:
+            # Deduplicated chunks are stored under the name the index gives.
+            chunk_object_name = chunk_index.add(key, obj[object_name])
+            obj = {chunk_object_name: obj[object_name]}
+            object_name = chunk_object_name
         LOG.debug('About to put_object')
         with self.get_object_writer(
                 container, object_name, extra_metadata=extra_metadata
         ) as writer:
             writer.write(data)
-        md5 = hashlib.md5(data).hexdigest()
-        obj[object_name]['md5'] = md5
         LOG.debug('backup MD5 for %(object_name)s: %(md5)s',
                   {'object_name': object_name, 'md5': md5})
         object_list.append(obj)
@@ -333,7 +611,150 @@ class ChunkedBackupDriver(driver.BackupDriver):
         LOG.debug('Calling eventlet.sleep(0)')
         eventlet.sleep(0)
 
-    def _finalize_backup(self, backup, container, object_meta, object_sha256):
+    def _process_chunk(self, data, shaindex, parent_backup_shalist):
+        """Hash, split and compress one chunk of volume data.
+
+        This runs in a native thread so it must not touch eventlet or
+        logging. Returns the chunk's sha256 list and a list of
+        (offset in chunk, length, data to store, md5 of data to store,
+        sha256 of the segment if deduplicating) segments to back up.
+        """
+        shalist = self._calculate_sha256s(data)
+        if parent_backup_shalist is not None:
+            extents = self._changed_extents(shalist, parent_backup_shalist,
+                                            shaindex, len(data))
+        else:
+            extents = [(0, len(data))]
+
+        segments = []
+        for extent_off, extent_end in extents:
+            segment = data[extent_off:extent_end]
+            if self.compressor is not None:
+                stored = self.compressor.compress(segment)
+            else:
+                stored = segment
+            key = hashlib.sha256(segment).hexdigest() if self.dedup else None
+            segments.append((extent_off, len(segment), stored,
+                             hashlib.md5(stored).hexdigest(), key))
+        return shalist, segments
+
+    def _backup_data_pipelined(self, container, volume_file, object_meta,
+                               sha256_list, extra_metadata,
+                               parent_backup_shalist, chunk_done,
+                               chunk_index=None):
+        """Back up volume data with a bounded producer/consumer pipeline.
+
+        A reader greenthread reads chunks off the volume, a pool of native
+        threads hashes and compresses them and a pool of greenthreads writes
+        the resulting objects. Results are assembled in chunk order so the
+        object list and sha256 list end up exactly as the sequential path
+        would build them. At most pipeline_max_chunks chunks are held in
+        memory at any time.
+        """
+        if self.compressor is not None:
+            algorithm = CONF.backup_compression_algorithm.lower()
+        else:
+            algorithm = 'none'
+        object_prefix = object_meta['prefix']
+        workers = eventlet.GreenPool(self.pipeline_workers)
+        writers = eventlet.GreenPool(self.pipeline_writers)
+        budget = semaphore.Semaphore(self.pipeline_max_chunks)
+        chunks = queue.Queue()
+        errors = []
+
+        def _read_chunks():
+            shaindex = 0
+            try:
+                while True:
+                    budget.acquire()
+                    data_offset = volume_file.tell()
+                    data = tpool.execute(volume_file.read,
+                                         self.chunk_size_bytes)
+                    if data == '':
+                        budget.release()
+                        break
+                    worker = workers.spawn(tpool.execute,
+                                           self._process_chunk, data,
+                                           shaindex, parent_backup_shalist)
+                    chunks.put((data_offset, worker))
+                    shaindex += ((len(data) + self.sha_block_size_bytes - 1)
+                                 // self.sha_block_size_bytes)
+            except Exception as err:
+                chunks.put((None, err))
+            else:
+                chunks.put(None)
+
+        def _write_object(object_name, data, remaining):
+            try:
+                with self.get_object_writer(
+                        container, object_name, extra_metadata=extra_metadata
+                ) as writer:
+                    writer.write(data)
+            except Exception as err:
+                LOG.exception(_LE('Failed to write backup object %s.'),
+                              object_name)
+                errors.append(err)
+            finally:
+                remaining[0] -= 1
+                if remaining[0] == 0:
+                    budget.release()
+
+        reader = eventlet.spawn(_read_chunks)
+        try:
+            while True:
+                item = chunks.get()
+                if item is None:
+                    break
+                data_offset, worker = item
+                if data_offset is None:
+                    raise worker
+                shalist, segments = worker.wait()
+                sha256_list.extend(shalist)
+
+                writes = []
+                for extent_off, length, data, md5, key in segments:
+                    offset = data_offset + extent_off
+                    if chunk_index is not None:
+                        obj = chunk_index.reference(key, offset, length)
+                        if obj is not None:
+                            object_meta['list'].append(obj)
+                            object_meta['id'] += 1
+                            continue
+                    obj = {'offset': offset,
+                           'length': length,
+                           'compression': algorithm,
+                           'md5': md5}
+                    if chunk_index is not None:
+                        object_name = chunk_index.add(key, obj)
+                    else:
+                        object_name = '%s-%05d' % (object_prefix,
+                                                   object_meta['id'])
+                    object_meta['id'] += 1
+                    object_meta['list'].append({object_name: obj})
+                    LOG.debug('backup MD5 for %(object_name)s: %(md5)s',
+                              {'object_name': object_name, 'md5': md5})
+                    writes.append((object_name, data))
+
+                remaining = [len(writes)]
+                if not writes:
+                    budget.release()
+                for object_name, data in writes:
+                    writers.spawn_n(_write_object, object_name, data,
+                                    remaining)
+
+                chunk_done()
+                if errors:
+                    raise errors[0]
+            writers.waitall()
+            if errors:
+                raise errors[0]
+        except Exception:
+            with excutils.save_and_reraise_exception():
+                reader.kill()
+                writers.waitall()
+
+    def _finalize_backup(self, backup, container, object_meta, object_sha256,
+                         chunk_index=None):
         """Write the backup's metadata to the backup repository."""
         object_list = object_meta['list']
         object_id = object_meta['id']
@@ -344,6 +765,10 @@ class ChunkedBackupDriver(driver.BackupDriver):
                                backup['volume_id'],
                                container,
                                sha256_list)
+        if chunk_index is not None:
+            # Count this backup's references before its metadata refers to
+            # the chunks, so failing in between can only leak chunks.
+            self._merge_chunk_index(container, chunk_index)
         self._write_metadata(backup,
                              backup['volume_id'],
                              container,
@@ -401,6 +826,7 @@ class ChunkedBackupDriver(driver.BackupDriver):
         # Read the shafile of the parent backup if backup['parent_id']
         # is given.
         parent_backup_shafile = None
+        parent_backup_shalist = None
         parent_backup = None
         if backup['parent_id']:
             parent_backup = self.db.backup_get(self.context,
@@ -425,123 +851,113 @@ class ChunkedBackupDriver(driver.BackupDriver):
         (object_meta, object_sha256, extra_metadata, container,
          volume_size_bytes) = self._prepare_backup(backup)
 
-        counter = 0
-        total_block_sent_num = 0
-
-        # There are two mechanisms to send the progress notification.
-        # 1. The notifications are periodically sent in a certain interval.
-        # 2. The notifications are sent after a certain number of chunks.
-        # Both of them are working simultaneously during the volume backup,
-        # when swift is taken as the backup backend.
-        def _notify_progress():
-            self._send_progress_notification(self.context, backup,
-                                             object_meta,
-                                             total_block_sent_num,
-                                             volume_size_bytes)
-        timer = loopingcall.FixedIntervalLoopingCall(
-            _notify_progress)
-        if self.enable_progress_timer:
-            timer.start(interval=self.backup_timer_interval)
-
-        sha256_list = object_sha256['sha256s']
-        shaindex = 0
-        while True:
-            data_offset = volume_file.tell()
-            data = volume_file.read(self.chunk_size_bytes)
-            if data == '':
-                break
-
-            # Calculate new shas with the datablock.
-            shalist = []
-            off = 0
-            datalen = len(data)
-            while off < datalen:
-                chunk_start = off
-                chunk_end = chunk_start + self.sha_block_size_bytes
-                if chunk_end > datalen:
-                    chunk_end = datalen
-                chunk = data[chunk_start:chunk_end]
-                sha = hashlib.sha256(chunk).hexdigest()
-                shalist.append(sha)
-                off += self.sha_block_size_bytes
-            sha256_list.extend(shalist)
-
-            # If parent_backup is not None, that means an incremental
-            # backup will be performed.
-            if parent_backup:
-                # Find the extent that needs to be backed up.
-                extent_off = -1
-                for idx, sha in enumerate(shalist):
-                    if sha != parent_backup_shalist[shaindex]:
-                        if extent_off == -1:
-                            # Start of new extent.
-                            extent_off = idx * self.sha_block_size_bytes
-                    else:
-                        if extent_off != -1:
-                            # We've reached the end of extent.
-                            extent_end = idx * self.sha_block_size_bytes
+        with self._backup_chunk_index(backup, container) as chunk_index:
+            progress = {'counter': 0, 'total_block_sent_num': 0}
+
+            # There are two mechanisms to send the progress notification.
+            # 1. The notifications are periodically sent in a certain
+            #    interval.
+            # 2. The notifications are sent after a certain number of chunks.
+            # Both of them are working simultaneously during the volume
+            # backup, when swift is taken as the backup backend.
+            def _notify_progress():
+                self._send_progress_notification(
+                    self.context, backup, object_meta,
+                    progress['total_block_sent_num'], volume_size_bytes)
+            timer = loopingcall.FixedIntervalLoopingCall(
+                _notify_progress)
+            if self.enable_progress_timer:
+                timer.start(interval=self.backup_timer_interval)
+
+            sha256_list = object_sha256['sha256s']
+
+            def _chunk_done():
+                # Notifications
+                progress['total_block_sent_num'] += self.data_block_num
+                progress['counter'] += 1
+                if progress['counter'] == self.data_block_num:
+                    # Send the notification to Ceilometer when the chunk
+                    # number reaches the data_block_num.  The backup
+                    # percentage is put in the metadata as the extra
+                    # information.
+                    self._send_progress_notification(
+                        self.context, backup, object_meta,
+                        progress['total_block_sent_num'], volume_size_bytes)
+                    # Reset the counter
+                    progress['counter'] = 0
+
+            if self.pipeline_workers > 0:
+                try:
+                    self._backup_data_pipelined(container, volume_file,
+                                                object_meta, sha256_list,
+                                                extra_metadata,
+                                                parent_backup_shalist,
+                                                _chunk_done, chunk_index)
+                except Exception:
+                    with excutils.save_and_reraise_exception():
+                        timer.stop()
+            else:
+                shaindex = 0
+                while True:
+                    data_offset = volume_file.tell()
+                    data = volume_file.read(self.chunk_size_bytes)
+                    if data == '':
+                        break
+
+                    # Calculate new shas with the datablock.
+                    shalist = self._calculate_sha256s(data)
+                    sha256_list.extend(shalist)
+
+                    # If parent_backup is not None, that means an incremental
+                    # backup will be performed.
+                    if parent_backup:
+                        # Find the extents that need to be backed up.
+                        for extent_off, extent_end in self._changed_extents(
+                                shalist, parent_backup_shalist, shaindex,
+                                len(data)):
                             segment = data[extent_off:extent_end]
                             self._backup_chunk(backup, container, segment,
                                                data_offset + extent_off,
                                                object_meta,
-                                               extra_metadata)
-                            extent_off = -1
-                    shaindex += 1
-
-                # The last extent extends to the end of data buffer.
-                if extent_off != -1:
-                    extent_end = datalen
-                    segment = data[extent_off:extent_end]
-                    self._backup_chunk(backup, container, segment,
-                                       data_offset + extent_off,
-                                       object_meta, extra_metadata)
-                    extent_off = -1
-            else:  # Do a full backup.
-                self._backup_chunk(backup, container, data, data_offset,
-                                   object_meta, extra_metadata)
-
-            # Notifications
-            total_block_sent_num += self.data_block_num
-            counter += 1
-            if counter == self.data_block_num:
-                # Send the notification to Ceilometer when the chunk
-                # number reaches the data_block_num.  The backup percentage
-                # is put in the metadata as the extra information.
-                self._send_progress_notification(self.context, backup,
-                                                 object_meta,
-                                                 total_block_sent_num,
-                                                 volume_size_bytes)
-                # Reset the counter
-                counter = 0
-
-        # Stop the timer.
-        timer.stop()
-        # All the data have been sent, the backup_percent reaches 100.
-        self._send_progress_end(self.context, backup, object_meta)
-
-        object_sha256['sha256s'] = sha256_list
-        if backup_metadata:
-            try:
-                self._backup_metadata(backup, object_meta)
-            # Whatever goes wrong, we want to log, cleanup, and re-raise.
-            except Exception as err:
-                with excutils.save_and_reraise_exception():
-                    LOG.exception(_LE("Backup volume metadata failed: %s."),
-                                  err)
-                    self.delete(backup)
-
-        self._finalize_backup(backup, container, object_meta, object_sha256)
-
-    def _restore_v1(self, backup, volume_id, metadata, volume_file):
-        """Restore a v1 volume backup."""
-        backup_id = backup['id']
-        LOG.debug('v1 volume backup restore of %s started.', backup_id)
-        extra_metadata = metadata.get('extra_metadata')
-        container = backup['container']
-        metadata_objects = metadata['objects']
-        metadata_object_names = sum((obj.keys() for obj in metadata_objects),
-                                    [])
+                                               extra_metadata, chunk_index)
+                        shaindex += len(shalist)
+                    else:  # Do a full backup.
+                        self._backup_chunk(backup, container, data,
+                                           data_offset, object_meta,
+                                           extra_metadata, chunk_index)
+
+                    _chunk_done()
+
+            # Stop the timer.
+            timer.stop()
+            # All the data have been sent, the backup_percent reaches 100.
+            self._send_progress_end(self.context, backup, object_meta)
+
+            object_sha256['sha256s'] = sha256_list
+            if backup_metadata:
+                try:
+                    self._backup_metadata(backup, object_meta)
+                # Whatever goes wrong, we want to log, cleanup, and re-raise.
+                except Exception as err:
+                    with excutils.save_and_reraise_exception():
+                        LOG.exception(_LE("Backup volume metadata failed: "
+                                          "%s."), err)
+                        self.delete(backup)
+
+            self._finalize_backup(backup, container, object_meta,
+                                  object_sha256, chunk_index)
+
+    def _verify_restore_objects(self, backup, metadata):
+        """Check the backup's objects match the ones listed in metadata."""
+        metadata_object_names = sum(
+            (obj.keys() for obj in metadata['objects']), [])
         LOG.debug('metadata_object_names = %s.', metadata_object_names)
+        chunk_object_names = set(
+            object_name for object_name in metadata_object_names
+            if ChunkIndex.is_chunk_object(object_name))
+        metadata_object_names = [object_name for object_name in
+                                 metadata_object_names
+                                 if object_name not in chunk_object_names]
         prune_list = [self._metadata_filename(backup),
                       self._sha256_filename(backup)]
         object_names = [object_name for object_name in
@@ -551,6 +967,36 @@ class ChunkedBackupDriver(driver.BackupDriver):
             err = _('restore_backup aborted, actual object list '
                     'does not match object list stored in metadata.')
             raise exception.InvalidBackup(reason=err)
+        if chunk_object_names:
+            stored_chunks = set(self.get_container_entries(
+                backup['container'], ChunkIndex.OBJECT_PREFIX))
+            if not chunk_object_names <= stored_chunks:
+                err = _('restore_backup aborted, deduplicated chunks used '
+                        'by the backup are missing.')
+                raise exception.InvalidBackup(reason=err)
+
+    def _flush_volume_file(self, volume_file):
+        # force flush every write to avoid long blocking write on close
+        volume_file.flush()
+
+        # Be tolerant to IO implementations that do not support fileno()
+        try:
+            fileno = volume_file.fileno()
+        except IOError:
+            LOG.info(_LI("volume_file does not support "
+                         "fileno() so skipping "
+                         "fsync()"))
+        else:
+            os.fsync(fileno)
+
+    def _restore_v1(self, backup, volume_id, metadata, volume_file):
+        """Restore a v1 volume backup."""
+        backup_id = backup['id']
+        LOG.debug('v1 volume backup restore of %s started.', backup_id)
+        extra_metadata = metadata.get('extra_metadata')
+        container = backup['container']
+        metadata_objects = metadata['objects']
+        self._verify_restore_objects(backup, metadata)
 
         for metadata_object in metadata_objects:
             object_name = metadata_object.keys()[0]
@@ -579,18 +1025,7 @@ class ChunkedBackupDriver(driver.BackupDriver):
             else:
                 volume_file.write(body)
 
-            # force flush every write to avoid long blocking write on close
-            volume_file.flush()
-
-            # Be tolerant to IO implementations that do not support fileno()
-            try:
-                fileno = volume_file.fileno()
-            except IOError:
-                LOG.info(_LI("volume_file does not support "
-                             "fileno() so skipping "
-                             "fsync()"))
-            else:
-                os.fsync(fileno)
+            self._flush_volume_file(volume_file)
 
             # Restoring a backup to a volume can take some time. Yield so other
             # threads can run, allowing for among other things the service
@@ -599,6 +1034,129 @@ class ChunkedBackupDriver(driver.BackupDriver):
         LOG.debug('v1 volume backup restore of %s finished.',
                   backup_id)
 
+    def _restore_volume_metadata(self, volume_id, metadata):
+        volume_meta = metadata.get('volume_meta', None)
+        try:
+            if volume_meta:
+                self.put_metadata(volume_id, volume_meta)
+            else:
+                LOG.debug("No volume metadata in this backup.")
+        except exception.BackupMetadataUnsupportedVersion:
+            msg = _("Metadata restore failed due to incompatible version.")
+            LOG.error(msg)
+            raise exception.BackupOperationError(msg)
+
+    @staticmethod
+    def _build_extent_map(sources):
+        """Overlay object extents and return the ones that survive.
+
+        sources is an iterable of (offset, length, source) in the order the
+        data would be written, later sources overwriting earlier ones. The
+        result is a list of (start, end, source) extents sorted by start,
+        with no overlaps.
+        """
+        extents = []
+        for offset, length, source in sources:
+            start, end = offset, offset + length
+            if start >= end:
+                continue
+            first = bisect.bisect_left(extents, (start,))
+            if first > 0 and extents[first - 1][1] > start:
+                first -= 1
+            last = first
+            replacement = []
+            while last < len(extents) and extents[last][0] < end:
+                ext_start, ext_end, ext_source = extents[last]
+                if ext_start < start:
+                    replacement.append((ext_start, start, ext_source))
+                if ext_end > end:
+                    replacement.append((end, ext_end, ext_source))
+                last += 1
+            replacement.append((start, end, source))
+            replacement.sort(key=lambda extent: extent[0])
+            extents[first:last] = replacement
+        return extents
+
+    def _fetch_restore_object(self, container, object_name, compression,
+                              extra_metadata):
+        with self.get_object_reader(
+                container, object_name,
+                extra_metadata=extra_metadata) as reader:
+            body = reader.read()
+        decompressor = self._get_compressor(compression)
+        if decompressor is not None:
+            body = tpool.execute(decompressor.decompress, body)
+        return body
+
+    def _restore_extents(self, backup_list, metadata_list, volume_id,
+                         volume_file):
+        """Restore a backup chain from only the objects that survive in it.
+
+        backup_list and metadata_list are ordered from the full backup to
+        the newest incremental. The final extent map of the chain is
+        computed first so that objects completely overwritten by later
+        backups are never fetched. The remaining objects are fetched and
+        decompressed up to restore_prefetch at a time and written to the
+        volume in offset order.
+        """
+        # Sources are keyed by metadata entry, not object name, since a
+        # deduplicated chunk object can be listed at several offsets.
+        sources = []
+        object_info = {}
+        for index, (backup1, metadata) in enumerate(zip(backup_list,
+                                                        metadata_list)):
+            self._verify_restore_objects(backup1, metadata)
+            for position, metadata_object in enumerate(metadata['objects']):
+                object_name, obj = metadata_object.items()[0]
+                sources.append((obj['offset'], obj['length'],
+                                (index, position)))
+                object_info[(index, position)] = (object_name, obj)
+        extents = self._build_extent_map(sources)
+
+        # surviving extents of each object, objects in offset order.
+        objects = collections.OrderedDict()
+        for start, end, source in extents:
+            objects.setdefault(source, []).append((start, end))
+        LOG.debug('restoring %(backup_id)s to %(volume_id)s from '
+                  '%(needed)d of %(total)d objects.',
+                  {'backup_id': backup_list[-1]['id'],
+                   'volume_id': volume_id, 'needed': len(objects),
+                   'total': len(sources)})
+
+        pool = eventlet.GreenPool(self.restore_prefetch)
+        pending = collections.deque()
+        queued = iter(objects.items())
+
+        def _queue_next():
+            for source, source_extents in queued:
+                index = source[0]
+                object_name, obj = object_info[source]
+                pending.append((
+                    source, source_extents,
+                    pool.spawn(self._fetch_restore_object,
+                               backup_list[index]['container'], object_name,
+                               obj['compression'],
+                               metadata_list[index].get('extra_metadata'))))
+                return
+
+        try:
+            for _i in range(self.restore_prefetch):
+                _queue_next()
+            while pending:
+                source, source_extents, fetch = pending.popleft()
+                body = fetch.wait()
+                _queue_next()
+                object_offset = object_info[source][1]['offset']
+                for start, end in source_extents:
+                    volume_file.seek(start)
+                    volume_file.write(body[start - object_offset:
+                                           end - object_offset])
+                self._flush_volume_file(volume_file)
+        except Exception:
+            with excutils.save_and_reraise_exception():
+                for _source, _extents, fetch in pending:
+                    fetch.kill()
+
     def restore(self, backup, volume_id, volume_file):
         """Restore the given volume backup from backup repository."""
         backup_id = backup['id']
@@ -635,6 +1193,20 @@ class ChunkedBackupDriver(driver.BackupDriver):
             backup_list.append(prev_backup)
             current_backup = prev_backup
 
+        if self.restore_prefetch > 0:
+            metadata_list = [self._read_metadata(backup1)
+                             for backup1 in reversed(backup_list)]
+            if all(self.DRIVER_VERSION_MAPPING.get(
+                    metadata1['version']) == '_restore_v1'
+                    for metadata1 in metadata_list):
+                self._restore_extents(list(reversed(backup_list)),
+                                      metadata_list, volume_id, volume_file)
+                for metadata1 in metadata_list:
+                    self._restore_volume_metadata(volume_id, metadata1)
+                LOG.debug('restore %(backup_id)s to %(volume_id)s finished.',
+                          {'backup_id': backup_id, 'volume_id': volume_id})
+                return
+
         # Do a full restore first, then layer the incremental backups
         # on top of it in order.
         index = len(backup_list) - 1
@@ -643,17 +1215,7 @@ class ChunkedBackupDriver(driver.BackupDriver):
             index = index - 1
             metadata = self._read_metadata(backup1)
             restore_func(backup1, volume_id, metadata, volume_file)
-
-            volume_meta = metadata.get('volume_meta', None)
-            try:
-                if volume_meta:
-                    self.put_metadata(volume_id, volume_meta)
-                else:
-                    LOG.debug("No volume metadata in this backup.")
-            except exception.BackupMetadataUnsupportedVersion:
-                msg = _("Metadata restore failed due to incompatible version.")
-                LOG.error(msg)
-                raise exception.BackupOperationError(msg)
+            self._restore_volume_metadata(volume_id, metadata)
 
         LOG.debug('restore %(backup_id)s to %(volume_id)s finished.',
                   {'backup_id': backup_id, 'volume_id': volume_id})
@@ -667,24 +1229,79 @@ class ChunkedBackupDriver(driver.BackupDriver):
                    'cont': container,
                    'pre': backup['service_metadata']})
 
-        if container is not None:
-            object_names = []
-            try:
-                object_names = self._generate_object_names(backup)
-            except Exception:
-                LOG.warning(_LW('swift error while listing objects, continuing'
-                                ' with delete.'))
+        # Without an object prefix the backup never stored anything
+        if container is not None and backup['service_metadata']:
+            chunk_object_names = self._chunk_references(backup)
+            if chunk_object_names:
+                self._check_dedup_host()
+                # The backup's own objects, metadata included, go before the
+                # index is updated: failing in between leaks chunks rather
+                # than releasing the same references twice.
+                self._delete_backup_objects(backup, container)
+                with self._chunk_index_lock(container):
+                    chunk_index = self._read_chunk_index(container)
+                    unused = chunk_index.release(chunk_object_names)
+                    self._write_chunk_index(container, chunk_index)
+                # Unused chunks are no longer in the index, so backups that
+                # still refer to them fail to merge instead of losing data.
+                for object_name in unused:
+                    self.delete_object(container, object_name)
+                    eventlet.sleep(0)
+                LOG.debug('released %(refs)d chunk references, removed '
+                          '%(unused)d unused chunks.',
+                          {'refs': len(chunk_object_names),
+                           'unused': len(unused)})
+            else:
+                self._delete_backup_objects(backup, container)
+                if self.dedup:
+                    self._delete_unmerged_chunks(backup, container)
+
+        LOG.debug('delete %s finished.', backup['id'])
 
-            for object_name in object_names:
+    def _delete_unmerged_chunks(self, backup, container):
+        """Remove chunks stored by a backup interrupted before its merge."""
+        suffix = '-%s' % backup['id']
+        object_names = [object_name for object_name in
+                        self.get_container_entries(container,
+                                                   ChunkIndex.OBJECT_PREFIX)
+                        if object_name.endswith(suffix)]
+        if not object_names:
+            return
+        # Only the backup itself could have counted references to them
+        chunk_index = self._read_chunk_index(container)
+        for object_name in object_names:
+            if object_name not in chunk_index.chunks:
                 self.delete_object(container, object_name)
-                LOG.debug('deleted object: %(object_name)s'
-                          ' in container: %(container)s.',
-                          {
-                              'object_name': object_name,
-                              'container': container
-                          })
-                # Deleting a backup's objects can take some time.
-                # Yield so other threads can run
                 eventlet.sleep(0)
 
-        LOG.debug('delete %s finished.', backup['id'])
+    def _chunk_references(self, backup):
+        """Return the deduplicated chunk objects listed in a backup."""
+        try:
+            metadata = self._read_metadata(backup)
+        except Exception:
+            # Backups that failed before writing their metadata hold no
+            # chunk references.
+            return []
+        return [object_name for obj in metadata['objects']
+                for object_name in obj
+                if ChunkIndex.is_chunk_object(object_name)]
+
+    def _delete_backup_objects(self, backup, container):
+        object_names = []
+        try:
+            object_names = self._generate_object_names(backup)
+        except Exception:
+            LOG.warning(_LW('swift error while listing objects, continuing'
+                            ' with delete.'))
+
+        for object_name in object_names:
+            self.delete_object(container, object_name)
+            LOG.debug('deleted object: %(object_name)s'
+                      ' in container: %(container)s.',
+                      {
+                          'object_name': object_name,
+                          'container': container
+                      })
+            # Deleting a backup's objects can take some time.
+            # Yield so other threads can run
+            eventlet.sleep(0)
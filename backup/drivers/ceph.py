@@ -42,6 +42,7 @@ was deemed the safest action to take. It is therefore recommended to always
 restore to a new volume (default).
 """
 
+import contextlib
 import fcntl
 import os
 import re
@@ -49,6 +50,8 @@ import subprocess
 import time
 
 import eventlet
+from eventlet import queue
+from eventlet import tpool
 from oslo_config import cfg
 from oslo_log import log as logging
 from oslo_utils import encodeutils
@@ -60,6 +63,7 @@ from cinder import exception
 from cinder.i18n import _, _LE, _LI, _LW
 from cinder import utils
 import cinder.volume.drivers.rbd as rbd_driver
+from cinder.volume import utils as volume_utils
 
 try:
     import rados
@@ -88,12 +92,26 @@ service_opts = [
                help='RBD stripe count to use when creating a backup image.'),
     cfg.BoolOpt('restore_discard_excess_bytes', default=True,
                 help='If True, always discard excess bytes when restoring '
-                     'volumes i.e. pad with zeroes.')
+                     'volumes i.e. pad with zeroes.'),
+    cfg.BoolOpt('backup_ceph_native_diff_transfer', default=True,
+                help='If True, differential backups and restores are '
+                     'transferred with librbd by the backup service rather '
+                     'than by piping rbd export-diff into rbd import-diff.'),
+    cfg.IntOpt('backup_ceph_transfer_queue_depth', default=2,
+               help='Number of chunks read ahead of the chunk being written '
+                    'by full backups and restores. Each of them takes '
+                    'backup_ceph_chunk_size bytes of memory.'),
+    cfg.IntOpt('backup_ceph_diff_io_depth', default=8,
+               help='Number of extents read and written at the same time by '
+                    'differential transfers done with librbd.'),
 ]
 
 CONF = cfg.CONF
 CONF.register_opts(service_opts)
 
+# Extents are copied in pieces of at most the default RBD object size
+_DIFF_IO_SIZE = 4 * units.Mi
+
 
 class VolumeMetadataBackup(object):
 
@@ -232,26 +250,76 @@ class CephBackupDriver(driver.BackupDriver):
 
         return (old_format, features)
 
-    def _connect_to_rados(self, pool=None):
-        """Establish connection to the backup Ceph cluster."""
+    def _new_rados_client(self):
         client = self.rados.Rados(rados_id=self._ceph_backup_user,
                                   conffile=self._ceph_backup_conf)
         try:
             client.connect()
-            pool_to_open = encodeutils.safe_encode(pool or
-                                                   self._ceph_backup_pool)
-            ioctx = client.open_ioctx(pool_to_open)
-            return client, ioctx
         except self.rados.Error:
             # shutdown cannot raise an exception
             client.shutdown()
             raise
+        return client
+
+    def _get_rados_pool(self):
+        # NOTE: backup drivers are instantiated per request so connections
+        # are pooled process wide, per backup cluster.
+        key = (self.rados, self._ceph_backup_user, self._ceph_backup_conf)
+        return rbd_driver.get_connection_pool(key, self._new_rados_client,
+                                              self.rados.Error)
+
+    def _get_cluster_pool(self, user, conf):
+        """Return the connection pool of the Ceph cluster of user and conf."""
+        if (user, conf) == (self._ceph_backup_user, self._ceph_backup_conf):
+            return self._get_rados_pool()
+
+        def _connect():
+            client = self.rados.Rados(rados_id=user, conffile=conf)
+            try:
+                client.connect()
+            except self.rados.Error:
+                # shutdown cannot raise an exception
+                client.shutdown()
+                raise
+            return client
+
+        key = (self.rados, user, conf)
+        return rbd_driver.get_connection_pool(key, _connect, self.rados.Error)
+
+    @contextlib.contextmanager
+    def _open_rbd_image(self, name, pool, user, conf, snapshot=None,
+                        read_only=False):
+        """Open an RBD image of any Ceph cluster, given its user and conf."""
+        if user is not None:
+            user = encodeutils.safe_encode(user)
+        if conf is not None:
+            conf = encodeutils.safe_encode(conf)
+        if snapshot is not None:
+            snapshot = encodeutils.safe_encode(snapshot)
+        cluster_pool = self._get_cluster_pool(user, conf)
+        client, ioctx = cluster_pool.get(encodeutils.safe_encode(pool))
+        discard = False
+        try:
+            image = self.rbd.Image(ioctx, encodeutils.safe_encode(name),
+                                   snapshot=snapshot, read_only=read_only)
+            try:
+                yield image
+            finally:
+                image.close()
+        except self.rados.Error:
+            discard = True
+            raise
+        finally:
+            cluster_pool.put(client, ioctx, discard=discard)
+
+    def _connect_to_rados(self, pool=None):
+        """Establish connection to the backup Ceph cluster."""
+        pool_to_open = encodeutils.safe_encode(pool or self._ceph_backup_pool)
+        return self._get_rados_pool().get(pool_to_open)
 
-    def _disconnect_from_rados(self, client, ioctx):
-        """Terminate connection with the backup Ceph cluster."""
-        # closing an ioctx cannot raise an exception
-        ioctx.close()
-        client.shutdown()
+    def _disconnect_from_rados(self, client, ioctx, discard=False):
+        """Release connection with the backup Ceph cluster."""
+        self._get_rados_pool().put(client, ioctx, discard=discard)
 
     def _get_backup_base_name(self, volume_id, backup_id=None,
                               diff_format=False):
@@ -297,8 +365,31 @@ class CephBackupDriver(driver.BackupDriver):
                     volume.write(zeroes)
                     volume.flush()
 
-    def _transfer_data(self, src, src_name, dest, dest_name, length):
-        """Transfer data between files (Python IO objects)."""
+    @staticmethod
+    def _write_chunk(dest, data, sparse=False):
+        """Write a chunk to dest, or skip over it if sparse and all zeroes.
+
+        Returns True if the chunk was skipped.
+        """
+        if sparse and data.count('\0') == len(data):
+            dest.seek(dest.tell() + len(data))
+            return True
+        dest.write(data)
+        return False
+
+    def _transfer_data(self, src, src_name, dest, dest_name, length,
+                       sparse=False, progress=None):
+        """Transfer data between files (Python IO objects).
+
+        Chunks are read and written on native threads so that the transfer
+        doesn't block other greenthreads, with up to
+        backup_ceph_transfer_queue_depth chunks read ahead of the one being
+        written.  With sparse set, chunks of zeroes are skipped rather than
+        written, which is only right for a destination that reads back
+        zeroes where it wasn't written.  progress, if given, is called with
+        the number of bytes transferred so far and the rate in MB/s after
+        each chunk.
+        """
         LOG.debug("Transferring data between '%(src)s' and '%(dest)s'",
                   {'src': src_name, 'dest': dest_name})
 
@@ -306,43 +397,70 @@ class CephBackupDriver(driver.BackupDriver):
         LOG.debug("%(chunks)s chunks of %(bytes)s bytes to be transferred",
                   {'chunks': chunks, 'bytes': self.chunk_size})
 
-        for chunk in xrange(0, chunks):
-            before = time.time()
-            data = src.read(self.chunk_size)
-            # If we have reach end of source, discard any extraneous bytes from
-            # destination volume if trim is enabled and stop writing.
-            if data == '':
-                if CONF.restore_discard_excess_bytes:
-                    self._discard_bytes(dest, dest.tell(),
-                                        length - dest.tell())
-
-                return
+        sizes = [self.chunk_size] * chunks
+        rem = int(length % self.chunk_size)
+        if rem:
+            sizes.append(rem)
 
-            dest.write(data)
-            dest.flush()
-            delta = (time.time() - before)
-            rate = (self.chunk_size / delta) / 1024
-            LOG.debug("Transferred chunk %(chunk)s of %(chunks)s "
-                      "(%(rate)dK/s)",
-                      {'chunk': chunk + 1,
-                       'chunks': chunks,
-                       'rate': rate})
+        read_ahead = queue.LightQueue(
+            max(1, CONF.backup_ceph_transfer_queue_depth))
+        stop = []
 
-            # yield to any other pending backups
-            eventlet.sleep(0)
+        def _read_chunks():
+            try:
+                for size in sizes:
+                    if stop:
+                        return
+                    data = tpool.execute(src.read, size)
+                    read_ahead.put(data)
+                    if data == '':
+                        return
+            except Exception as e:
+                read_ahead.put(e)
+
+        reader = eventlet.spawn(_read_chunks)
+        start = time.time()
+        done = 0
+        try:
+            for chunk, size in enumerate(sizes):
+                data = read_ahead.get()
+                if isinstance(data, Exception):
+                    raise data
+                # If we have reach end of source, discard any extraneous
+                # bytes from destination volume if trim is enabled and stop
+                # writing.
+                if data == '':
+                    if CONF.restore_discard_excess_bytes:
+                        self._discard_bytes(dest, dest.tell(),
+                                            length - dest.tell())
+                    break
+
+                before = time.time()
+                skipped = tpool.execute(self._write_chunk, dest, data,
+                                        sparse)
+                now = time.time()
+                done += len(data)
+                rate = (len(data) / max(now - before, 0.001)) / 1024
+                LOG.debug("%(action)s chunk %(chunk)s of %(chunks)s "
+                          "(%(rate)dK/s)",
+                          {'action': 'Skipped zeroes' if skipped
+                           else 'Transferred',
+                           'chunk': chunk + 1,
+                           'chunks': len(sizes),
+                           'rate': rate})
+                if progress:
+                    progress(done, done / max(now - start, 0.001) / units.Mi)
+        finally:
+            # Let the reader finish the read it may be doing and stop
+            stop.append(True)
+            while True:
+                try:
+                    read_ahead.get_nowait()
+                except queue.Empty:
+                    break
+            reader.wait()
 
-        rem = int(length % self.chunk_size)
-        if rem:
-            LOG.debug("Transferring remaining %s bytes", rem)
-            data = src.read(rem)
-            if data == '':
-                if CONF.restore_discard_excess_bytes:
-                    self._discard_bytes(dest, dest.tell(), rem)
-            else:
-                dest.write(data)
-                dest.flush()
-                # yield to any other pending backups
-                eventlet.sleep(0)
+        tpool.execute(dest.flush)
 
     def _create_base_image(self, name, size, rados_client):
         """Create a base backup image.
@@ -513,6 +631,100 @@ class CephBackupDriver(driver.BackupDriver):
         stdout, stderr = p2.communicate()
         return p2.returncode, stderr
 
+    @property
+    def _supports_native_diff_transfer(self):
+        """Determine if diffs can be transferred with librbd in-process."""
+        return (CONF.backup_ceph_native_diff_transfer and
+                self.rbd is not None and
+                hasattr(self.rbd.Image, 'diff_iterate'))
+
+    def _copy_rbd_diff(self, src_image, dest_image, src_snap=None,
+                       from_snap=None):
+        """Copy the extents of src_image changed since from_snap.
+
+        Does what rbd import-diff does with the output of rbd export-diff:
+        the destination must have from_snap, gets the size of the source
+        and is snapshotted as src_snap once the extents are copied.
+        Extents are read and written by backup_ceph_diff_io_depth native
+        threads at a time.
+        """
+        if from_snap is not None:
+            snaps = dest_image.list_snaps() or []
+            if from_snap not in [snap['name'] for snap in snaps]:
+                msg = (_("Snapshot '%s' does not exist in the destination "
+                         "image") % from_snap)
+                raise exception.BackupRBDOperationFailed(msg)
+
+        size = src_image.size()
+        if dest_image.size() != size:
+            dest_image.resize(size)
+
+        extents = []
+
+        def iter_cb(offset, length, exists):
+            for start in xrange(offset, offset + length, _DIFF_IO_SIZE):
+                extents.append((start,
+                                min(_DIFF_IO_SIZE, offset + length - start),
+                                exists))
+
+        src_image.diff_iterate(0, size, from_snap, iter_cb)
+        total = sum(length for _offset, length, _exists in extents)
+        LOG.debug("%(extents)s extents of %(bytes)s bytes to be transferred",
+                  {'extents': len(extents), 'bytes': total})
+
+        def _copy_extent(offset, length, exists):
+            if exists:
+                dest_image.write(src_image.read(offset, length), offset)
+            else:
+                dest_image.discard(offset, length)
+
+        done = [0]
+
+        def _transfer_extent(offset, length, exists):
+            before = time.time()
+            tpool.execute(_copy_extent, offset, length, exists)
+            delta = max(time.time() - before, 0.001)
+            done[0] += length
+            LOG.debug("Transferred extent at offset %(offset)s of "
+                      "%(length)s bytes (%(rate)dK/s), %(done)s of "
+                      "%(total)s bytes done",
+                      {'offset': offset, 'length': length,
+                       'rate': (length / delta) / 1024,
+                       'done': done[0], 'total': total})
+
+        pool = eventlet.GreenPool(max(1, CONF.backup_ceph_diff_io_depth))
+        transfers = [pool.spawn(_transfer_extent, offset, length, exists)
+                     for offset, length, exists in extents]
+        errors = []
+        for transfer in transfers:
+            try:
+                transfer.wait()
+            except Exception as e:
+                errors.append(e)
+        if errors:
+            raise errors[0]
+
+        if src_snap:
+            dest_image.create_snap(encodeutils.safe_encode(src_snap))
+
+    def _rbd_native_diff_transfer(self, src_name, src_pool, dest_name,
+                                  dest_pool, src_user, src_conf, dest_user,
+                                  dest_conf, src_snap=None, from_snap=None):
+        """Copy only extents changed between two points, using librbd."""
+        try:
+            with self._open_rbd_image(src_name, src_pool, src_user, src_conf,
+                                      snapshot=src_snap,
+                                      read_only=True) as src_image:
+                with self._open_rbd_image(dest_name, dest_pool, dest_user,
+                                          dest_conf) as dest_image:
+                    self._copy_rbd_diff(src_image, dest_image,
+                                        src_snap=src_snap,
+                                        from_snap=from_snap)
+        except (self.rbd.Error, self.rados.Error) as e:
+            msg = _("RBD diff transfer failed - %s") % e
+            LOG.info(msg)
+            raise exception.BackupRBDOperationFailed(msg)
+
     def _rbd_diff_transfer(self, src_name, src_pool, dest_name, dest_pool,
                            src_user, src_conf, dest_user, dest_conf,
                            src_snap=None, from_snap=None):
@@ -526,6 +738,14 @@ class CephBackupDriver(driver.BackupDriver):
                   "'%(dest)s'",
                   {'src': src_name, 'dest': dest_name})
 
+        if self._supports_native_diff_transfer:
+            self._rbd_native_diff_transfer(src_name, src_pool, dest_name,
+                                           dest_pool, src_user, src_conf,
+                                           dest_user, dest_conf,
+                                           src_snap=src_snap,
+                                           from_snap=from_snap)
+            return
+
         # NOTE(dosaboy): Need to be tolerant of clusters/clients that do
         # not support these operations since at the time of writing they
         # were very new.
@@ -686,12 +906,13 @@ class CephBackupDriver(driver.BackupDriver):
         """Returns True if the volume_file is actually an RBD image."""
         return hasattr(volume_file, 'rbd_image')
 
-    def _full_backup(self, backup_id, volume_id, src_volume, src_name, length):
+    def _full_backup(self, backup_id, volume_id, src_volume, src_name, length,
+                     progress=None):
         """Perform a full backup of src volume.
 
         First creates a base backup image in our backup location then performs
         an chunked copy of all data from source volume to a new backup rbd
-        image.
+        image. Chunks of zeroes are left unwritten in the new image.
         """
         backup_name = self._get_backup_base_name(volume_id, backup_id)
 
@@ -718,7 +939,7 @@ class CephBackupDriver(driver.BackupDriver):
                                                        self._ceph_backup_conf)
                 rbd_fd = rbd_driver.RBDImageIOWrapper(rbd_meta)
                 self._transfer_data(src_volume, src_name, rbd_fd, backup_name,
-                                    length)
+                                    length, sparse=True, progress=progress)
             finally:
                 dest_rbd.close()
 
@@ -839,6 +1060,27 @@ class CephBackupDriver(driver.BackupDriver):
             msg = (_("Failed to backup volume metadata - %s") % e)
             raise exception.BackupOperationError(msg)
 
+    def _backup_progress(self, backup, length):
+        """Return a callback sending the progress of a full backup.
+
+        A notification with the percentage done and the transfer rate in
+        MB/s is sent every backup_object_number_per_notification chunks and
+        once the transfer is done.
+        """
+        interval = CONF.backup_object_number_per_notification * self.chunk_size
+        next_notification = [interval]
+
+        def _progress(done, rate):
+            if done < next_notification[0] and done < length:
+                return
+            next_notification[0] = done + interval
+            volume_utils.notify_about_backup_usage(
+                self.context, backup, "createprogress",
+                extra_usage_info={'backup_percent': done * 100 / length,
+                                  'transfer_rate_mbps': round(rate, 2)})
+
+        return _progress
+
     def backup(self, backup, volume_file, backup_metadata=True):
         """Backup volume and metadata (if available) to Ceph object store.
 
@@ -871,7 +1113,8 @@ class CephBackupDriver(driver.BackupDriver):
 
         if do_full_backup:
             self._full_backup(backup_id, volume_id, volume_file,
-                              volume_name, length)
+                              volume_name, length,
+                              progress=self._backup_progress(backup, length))
 
         self.db.backup_update(self.context, backup_id,
                               {'container': self._ceph_backup_pool})
@@ -35,6 +35,7 @@
                                None (to disable), zlib and bz2 (default: zlib)
 """
 
+import contextlib
 import hashlib
 import socket
 
@@ -153,7 +154,14 @@ class SwiftBackupDriver(chunkeddriver.ChunkedBackupDriver):
                               "but %(param)s not set"),
                           {'param': 'backup_swift_user'})
                 raise exception.ParameterNotFound(param='backup_swift_user')
-            self.conn = swift.Connection(
+        # Connections not in use by a request.  A swiftclient connection
+        # can't serve concurrent requests, and the chunked driver reads and
+        # writes objects from several greenthreads at once.
+        self._idle_conns = [self._connect()]
+
+    def _connect(self):
+        if CONF.backup_swift_auth == 'single_user':
+            return swift.Connection(
                 authurl=CONF.backup_swift_url,
                 auth_version=CONF.backup_swift_auth_version,
                 tenant_name=CONF.backup_swift_tenant,
@@ -161,17 +169,28 @@ class SwiftBackupDriver(chunkeddriver.ChunkedBackupDriver):
                 key=CONF.backup_swift_key,
                 retries=self.swift_attempts,
                 starting_backoff=self.swift_backoff)
+        return swift.Connection(retries=self.swift_attempts,
+                                preauthurl=self.swift_url,
+                                preauthtoken=self.context.auth_token,
+                                starting_backoff=self.swift_backoff)
+
+    @contextlib.contextmanager
+    def _connection(self):
+        """Check out a connection for the duration of a request."""
+        if self._idle_conns:
+            conn = self._idle_conns.pop()
         else:
-            self.conn = swift.Connection(retries=self.swift_attempts,
-                                         preauthurl=self.swift_url,
-                                         preauthtoken=self.context.auth_token,
-                                         starting_backoff=self.swift_backoff)
+            conn = self._connect()
+        try:
+            yield conn
+        finally:
+            self._idle_conns.append(conn)
 
     class SwiftObjectWriter(object):
-        def __init__(self, container, object_name, conn):
+        def __init__(self, container, object_name, connection):
             self.container = container
             self.object_name = object_name
-            self.conn = conn
+            self.connection = connection
             self.data = ''
 
         def __enter__(self):
@@ -186,9 +205,9 @@ class SwiftBackupDriver(chunkeddriver.ChunkedBackupDriver):
         def close(self):
             reader = six.StringIO(self.data)
             try:
-                etag = self.conn.put_object(self.container, self.object_name,
-                                            reader,
-                                            content_length=reader.len)
+                with self.connection() as conn:
+                    etag = conn.put_object(self.container, self.object_name,
+                                           reader, content_length=reader.len)
             except socket.error as err:
                 raise exception.SwiftConnectionFailed(reason=err)
             LOG.debug('swift MD5 for %(object_name)s: %(etag)s',
@@ -204,10 +223,10 @@ class SwiftBackupDriver(chunkeddriver.ChunkedBackupDriver):
             return md5
 
     class SwiftObjectReader(object):
-        def __init__(self, container, object_name, conn):
+        def __init__(self, container, object_name, connection):
             self.container = container
             self.object_name = object_name
-            self.conn = conn
+            self.connection = connection
 
         def __enter__(self):
             return self
@@ -217,8 +236,9 @@ class SwiftBackupDriver(chunkeddriver.ChunkedBackupDriver):
 
         def read(self):
             try:
-                (_resp, body) = self.conn.get_object(self.container,
-                                                     self.object_name)
+                with self.connection() as conn:
+                    (_resp, body) = conn.get_object(self.container,
+                                                    self.object_name)
             except socket.error as err:
                 raise exception.SwiftConnectionFailed(reason=err)
             return body
@@ -226,7 +246,8 @@ class SwiftBackupDriver(chunkeddriver.ChunkedBackupDriver):
     def put_container(self, container):
         """Create the container if needed. No failure if it pre-exists."""
         try:
-            self.conn.put_container(container)
+            with self._connection() as conn:
+                conn.put_container(container)
         except socket.error as err:
             raise exception.SwiftConnectionFailed(reason=err)
         return
@@ -234,9 +255,10 @@ class SwiftBackupDriver(chunkeddriver.ChunkedBackupDriver):
     def get_container_entries(self, container, prefix):
         """Get container entry names"""
         try:
-            swift_objects = self.conn.get_container(container,
-                                                    prefix=prefix,
-                                                    full_listing=True)[1]
+            with self._connection() as conn:
+                swift_objects = conn.get_container(container,
+                                                   prefix=prefix,
+                                                   full_listing=True)[1]
         except socket.error as err:
             raise exception.SwiftConnectionFailed(reason=err)
         swift_object_names = [swift_obj['name'] for swift_obj in swift_objects]
@@ -246,18 +268,21 @@ class SwiftBackupDriver(chunkeddriver.ChunkedBackupDriver):
         """Returns a writer object that stores a chunk of volume data in a
            Swift object store.
         """
-        return self.SwiftObjectWriter(container, object_name, self.conn)
+        return self.SwiftObjectWriter(container, object_name,
+                                      self._connection)
 
     def get_object_reader(self, container, object_name, extra_metadata=None):
         """Returns a reader object that retrieves a chunk of backed-up volume data
            from a Swift object store.
         """
-        return self.SwiftObjectReader(container, object_name, self.conn)
+        return self.SwiftObjectReader(container, object_name,
+                                      self._connection)
 
     def delete_object(self, container, object_name):
         """Deletes a backup object from a Swift object store."""
         try:
-            self.conn.delete_object(container, object_name)
+            with self._connection() as conn:
+                conn.delete_object(container, object_name)
         except socket.error as err:
             raise exception.SwiftConnectionFailed(reason=err)
 
@@ -33,6 +33,9 @@ Volume backups can be created, restored, deleted and listed.
 
 """
 
+import collections
+
+import eventlet
 from oslo_config import cfg
 from oslo_log import log as logging
 import oslo_messaging as messaging
@@ -46,6 +49,7 @@ from cinder import context
 from cinder import exception
 from cinder.i18n import _, _LE, _LI, _LW
 from cinder import manager
+from cinder.openstack.common import periodic_task
 from cinder import quota
 from cinder import rpc
 from cinder import utils
@@ -58,6 +62,14 @@ backup_manager_opts = [
                default='cinder.backup.drivers.swift',
                help='Driver to use for backups.',
                deprecated_name='backup_service'),
+    cfg.IntOpt('backup_max_jobs_per_backend',
+               default=2,
+               help='Maximum number of backups and restores run at the same '
+                    'time on the volumes of one volume backend.'),
+    cfg.IntOpt('backup_max_jobs_per_target',
+               default=4,
+               help='Maximum number of backups and restores run at the same '
+                    'time against one backup container.'),
 ]
 
 # This map doesn't need to be extended in the future since it's only
@@ -69,6 +81,119 @@ CONF = cfg.CONF
 CONF.register_opts(backup_manager_opts)
 QUOTAS = quota.QUOTAS
 
+_Job = collections.namedtuple('_Job', ['job_id', 'project_id', 'backend',
+                                       'target', 'func', 'args'])
+
+
+class BackupJobScheduler(object):
+    """Runs backup jobs in greenthreads with bounded concurrency.
+
+    A job starts once fewer than backend_limit jobs run on its volume
+    backend and fewer than target_limit against its backup target.  Jobs
+    waiting for a slot are queued per project.  A free slot goes to the
+    project with the fewest running jobs, and among those to the one served
+    longest ago, so that a project queueing many jobs doesn't hold up the
+    others.
+    """
+
+    def __init__(self, backend_limit, target_limit):
+        self.backend_limit = max(1, backend_limit)
+        self.target_limit = max(1, target_limit)
+        # Project id => deque of its queued jobs
+        self._queues = collections.OrderedDict()
+        self._running = {'project': {}, 'backend': {}, 'target': {}}
+        # Project id => turn at which it last had a job started
+        self._last_turn = {}
+        self._turn = 0
+        self._job_ids = set()
+        self._threads = set()
+
+    def submit(self, job_id, project_id, backend, target, func, *args):
+        """Queue func(*args) to run as the job job_id.
+
+        A job with no volume backend is only limited by its target.
+        Submitting a job that is already queued or running does nothing.
+        """
+        if job_id in self._job_ids:
+            LOG.debug("Backup job %s is already queued.", job_id)
+            return
+        self._job_ids.add(job_id)
+        job = _Job(job_id, project_id, backend, target, func, args)
+        self._queues.setdefault(project_id, collections.deque()).append(job)
+        self._dispatch()
+
+    def _has_slot(self, job):
+        running = self._running
+        if (job.backend is not None and
+                running['backend'].get(job.backend, 0) >= self.backend_limit):
+            return False
+        return running['target'].get(job.target, 0) < self.target_limit
+
+    def _count(self, job, delta):
+        for kind, key in (('project', job.project_id),
+                          ('backend', job.backend), ('target', job.target)):
+            if key is None:
+                continue
+            count = self._running[kind].get(key, 0) + delta
+            if count:
+                self._running[kind][key] = count
+            else:
+                self._running[kind].pop(key, None)
+
+    def _next_job(self):
+        running = self._running['project']
+        projects = sorted(self._queues,
+                          key=lambda p: (running.get(p, 0),
+                                         self._last_turn.get(p, 0)))
+        for project_id in projects:
+            jobs = self._queues[project_id]
+            for job in jobs:
+                if self._has_slot(job):
+                    jobs.remove(job)
+                    if not jobs:
+                        del self._queues[project_id]
+                    self._turn += 1
+                    self._last_turn[project_id] = self._turn
+                    return job
+        return None
+
+    def _dispatch(self):
+        job = self._next_job()
+        while job is not None:
+            self._count(job, 1)
+            self._threads.add(eventlet.spawn(self._run, job))
+            job = self._next_job()
+
+    def _run(self, job):
+        try:
+            job.func(*job.args)
+        except Exception:
+            LOG.exception(_LE("Backup job %s failed."), job.job_id)
+        finally:
+            self._threads.discard(eventlet.getcurrent())
+            self._job_ids.discard(job.job_id)
+            self._count(job, -1)
+            if (job.project_id not in self._queues and
+                    job.project_id not in self._running['project']):
+                self._last_turn.pop(job.project_id, None)
+            self._dispatch()
+
+    def wait(self):
+        """Wait until no job is queued or running."""
+        while self._threads:
+            self._threads.pop().wait()
+
+    def stats(self):
+        """Return the numbers of queued and running jobs."""
+        queued = dict((project_id, len(jobs))
+                      for project_id, jobs in self._queues.items())
+        return {'queued': sum(queued.values()),
+                'running': len(self._job_ids) - sum(queued.values()),
+                'queued_by_project': queued,
+                'running_by_project': dict(self._running['project']),
+                'running_by_backend': dict(self._running['backend']),
+                'running_by_target': dict(self._running['target'])}
+
 
 class BackupManager(manager.SchedulerDependentManager):
     """Manages backup of block storage devices."""
@@ -83,6 +208,8 @@ class BackupManager(manager.SchedulerDependentManager):
         self.volume_managers = {}
         self._setup_volume_drivers()
         self.backup_rpcapi = backup_rpcapi.BackupAPI()
+        self.jobs = BackupJobScheduler(CONF.backup_max_jobs_per_backend,
+                                       CONF.backup_max_jobs_per_target)
         super(BackupManager, self).__init__(service_name='backup',
                                             *args, **kwargs)
 
@@ -137,6 +264,10 @@ class BackupManager(manager.SchedulerDependentManager):
             raise exception.BackupFailedToGetVolumeBackend(msg)
         return self.volume_managers[backend]
 
+    def _get_backup_target(self, backup):
+        """Return the key of the backup target a backup job runs against."""
+        return backup['container'] or self.driver_name
+
     def _get_driver(self, backend=None):
         LOG.debug("Driver requested for volume_backend '%s'.",
                   backend)
@@ -193,6 +324,12 @@ class BackupManager(manager.SchedulerDependentManager):
             self._init_volume_driver(ctxt, mgr.driver)
 
         LOG.info(_LI("Cleaning up incomplete backup operations."))
+        backups = self.db.backup_get_all_by_host(ctxt, self.host)
+        # Restores whose volume is still waiting for them are resumed
+        restore_volume_ids = set(backup['restore_volume_id']
+                                 for backup in backups
+                                 if backup['status'] == 'restoring' and
+                                 backup['restore_volume_id'])
         volumes = self.db.volume_get_all_by_host(ctxt, self.host)
         for volume in volumes:
             volume_host = volume_utils.extract_host(volume['host'], 'backend')
@@ -217,31 +354,109 @@ class BackupManager(manager.SchedulerDependentManager):
                            attachment['instance_uuid'] is None):
                             mgr.detach_volume(ctxt, volume['id'],
                                               attachment['id'])
-                    self.db.volume_update(ctxt, volume['id'],
-                                          {'status': 'error_restoring'})
+                    if volume['id'] not in restore_volume_ids:
+                        self.db.volume_update(ctxt, volume['id'],
+                                              {'status': 'error_restoring'})
 
-        # TODO(smulcahy) implement full resume of backup and restore
-        # operations on restart (rather than simply resetting)
-        backups = self.db.backup_get_all_by_host(ctxt, self.host)
         for backup in backups:
             if backup['status'] == 'creating':
+                if self._resume_backup(ctxt, backup):
+                    continue
                 LOG.info(_LI('Resetting backup %s to error (was creating).'),
                          backup['id'])
                 err = 'incomplete backup reset on manager restart'
                 self.db.backup_update(ctxt, backup['id'], {'status': 'error',
                                                            'fail_reason': err})
             if backup['status'] == 'restoring':
+                if self._resume_restore(ctxt, backup):
+                    continue
                 LOG.info(_LI('Resetting backup %s to '
                              'available (was restoring).'),
                          backup['id'])
                 self.db.backup_update(ctxt, backup['id'],
-                                      {'status': 'available'})
+                                      {'status': 'available',
+                                       'restore_volume_id': None})
             if backup['status'] == 'deleting':
                 LOG.info(_LI('Resuming delete on backup: %s.'), backup['id'])
-                self.delete_backup(ctxt, backup['id'])
+                self.jobs.submit(backup['id'], backup['project_id'], None,
+                                 self._get_backup_target(backup),
+                                 self.delete_backup, ctxt, backup['id'])
+
+    def _get_waiting_volume(self, ctxt, volume_id, status):
+        """Return the volume if it still has the given status."""
+        try:
+            volume = self.db.volume_get(ctxt, volume_id)
+        except exception.VolumeNotFound:
+            return None
+        if volume['status'] != status:
+            return None
+        return volume
+
+    def _resume_backup(self, ctxt, backup):
+        """Queue again a backup interrupted by a restart.
+
+        What the interrupted backup stored is deleted first, since the
+        backup starts over.  Returns False if the backup can't be resumed
+        since its volume is no longer waiting for it, it was made by another
+        backup service or it couldn't be cleaned up.
+        """
+        if not self._get_waiting_volume(ctxt, backup['volume_id'],
+                                        'backing-up'):
+            return False
+        backup_service = self._map_service_to_driver(backup['service'])
+        if backup_service not in (None, self.driver_name):
+            return False
+        try:
+            backup_service = self.service.get_backup_driver(ctxt)
+            backup_service.delete(backup)
+        except Exception:
+            LOG.exception(_LE('Failed to clean up interrupted backup %s.'),
+                          backup['id'])
+            self.db.volume_update(ctxt, backup['volume_id'],
+                                  {'status': 'available'})
+            return False
+        LOG.info(_LI('Resuming backup %s.'), backup['id'])
+        try:
+            self.create_backup(ctxt, backup['id'])
+        except Exception:
+            LOG.exception(_LE('Failed to resume backup %s.'), backup['id'])
+        return True
+
+    def _resume_restore(self, ctxt, backup):
+        """Queue again a restore interrupted by a restart.
+
+        Returns False if the restore can't be resumed since the volume
+        being restored is unknown or no longer waiting for it.
+        """
+        volume_id = backup['restore_volume_id']
+        if not volume_id or not self._get_waiting_volume(ctxt, volume_id,
+                                                         'restoring-backup'):
+            return False
+        LOG.info(_LI('Resuming restore of backup %(backup_id)s to volume '
+                     '%(volume_id)s.'),
+                 {'backup_id': backup['id'], 'volume_id': volume_id})
+        try:
+            self.restore_backup(ctxt, backup['id'], volume_id)
+        except Exception:
+            LOG.exception(_LE('Failed to resume restore of backup %s.'),
+                          backup['id'])
+        return True
+
+    @periodic_task.periodic_task
+    def _report_backup_jobs(self, context):
+        """Log and notify the depth of the backup job queue."""
+        stats = self.jobs.stats()
+        LOG.debug("Backup jobs: %(queued)d queued, %(running)d running.",
+                  stats)
+        notifier = rpc.get_notifier('backup', self.host)
+        notifier.info(context, 'backup.jobs.stats', stats)
 
     def create_backup(self, context, backup_id):
-        """Create volume backups using configured backup service."""
+        """Create volume backups using configured backup service.
+
+        The backup is checked and queued here, and is run by the job
+        scheduler once its volume backend and backup target have a free slot.
+        """
         backup = self.db.backup_get(context, backup_id)
         volume_id = backup['volume_id']
         volume = self.db.volume_get(context, volume_id)
@@ -282,6 +497,15 @@ class BackupManager(manager.SchedulerDependentManager):
                                                        'fail_reason': err})
             raise exception.InvalidBackup(reason=err)
 
+        LOG.debug("Queueing backup %s.", backup_id)
+        self.jobs.submit(backup_id, backup['project_id'], backend,
+                         self._get_backup_target(backup), self._run_backup,
+                         context, backup, volume, backend)
+
+    def _run_backup(self, context, backup, volume, backend):
+        """Create a backup queued by create_backup."""
+        backup_id = backup['id']
+        volume_id = volume['id']
         try:
             # NOTE(flaper87): Verify the driver is enabled
             # before going forward. The exception will be caught,
@@ -309,7 +533,10 @@ class BackupManager(manager.SchedulerDependentManager):
         self._notify_about_backup_usage(context, backup, "create.end")
 
     def restore_backup(self, context, backup_id, volume_id):
-        """Restore volume backups from configured backup service."""
+        """Restore volume backups from configured backup service.
+
+        Like backups, restores are queued to the job scheduler.
+        """
         LOG.info(_LI('Restore backup started, backup: %(backup_id)s '
                      'volume: %(volume_id)s.'),
                  {'backup_id': backup_id, 'volume_id': volume_id})
@@ -367,6 +594,15 @@ class BackupManager(manager.SchedulerDependentManager):
             self.db.volume_update(context, volume_id, {'status': 'error'})
             raise exception.InvalidBackup(reason=err)
 
+        LOG.debug("Queueing restore of backup %s.", backup_id)
+        self.jobs.submit(backup_id, backup['project_id'], backend,
+                         self._get_backup_target(backup), self._run_restore,
+                         context, backup, volume, backend)
+
+    def _run_restore(self, context, backup, volume, backend):
+        """Restore a backup queued by restore_backup."""
+        backup_id = backup['id']
+        volume_id = volume['id']
         try:
             # NOTE(flaper87): Verify the driver is enabled
             # before going forward. The exception will be caught,
@@ -383,11 +619,13 @@ class BackupManager(manager.SchedulerDependentManager):
                 self.db.volume_update(context, volume_id,
                                       {'status': 'error_restoring'})
                 self.db.backup_update(context, backup_id,
-                                      {'status': 'available'})
+                                      {'status': 'available',
+                                       'restore_volume_id': None})
 
         self.db.volume_update(context, volume_id, {'status': 'available'})
         backup = self.db.backup_update(context, backup_id,
-                                       {'status': 'available'})
+                                       {'status': 'available',
+                                        'restore_volume_id': None})
         LOG.info(_LI('Restore backup finished, backup %(backup_id)s restored'
                      ' to volume %(volume_id)s.'),
                  {'backup_id': backup_id, 'volume_id': volume_id})
@@ -18,7 +18,15 @@
    and root_helper settings, so this provides that hook.
 """
 
+import random
+import time
+
 from oslo_concurrency import processutils as putils
+from oslo_log import log as logging
+from oslo_utils import strutils
+
+
+LOG = logging.getLogger(__name__)
 
 
 class Executor(object):
@@ -32,3 +40,76 @@ class Executor(object):
 
     def set_root_helper(self, helper):
         self._root_helper = helper
+
+
+class RootwrapDaemonExecute(object):
+    """Execute method that runs commands as root through a rootwrap daemon.
+
+    The daemon is started with daemon_cmd the first time a command runs as
+    root and stays resident, so that each command costs a request over its
+    local socket rather than a sudo and rootwrap process spawn.  Commands
+    that don't run as root, or that pass execute arguments the daemon
+    can't honour such as cwd or env_variables, are handed to execute.
+    """
+
+    # One daemon per daemon command, shared by every execute method
+    _clients = {}
+    # Arguments of processutils.execute the daemon handles; it replaces
+    # the root helper
+    _daemon_kwargs = frozenset(['run_as_root', 'root_helper',
+                                'process_input', 'check_exit_code',
+                                'delay_on_retry', 'attempts'])
+
+    def __init__(self, daemon_cmd, execute=putils.execute):
+        self.daemon_cmd = daemon_cmd
+        self._fallback_execute = execute
+
+    def _get_client(self):
+        try:
+            return self._clients[self.daemon_cmd]
+        except KeyError:
+            from oslo_rootwrap import client
+            new_client = client.Client(self.daemon_cmd.split())
+            return self._clients.setdefault(self.daemon_cmd, new_client)
+
+    def __call__(self, *cmd, **kwargs):
+        if not kwargs.get('run_as_root'):
+            return self._fallback_execute(*cmd, **kwargs)
+        unsupported = set(kwargs) - self._daemon_kwargs
+        if unsupported:
+            LOG.debug("Not running cmd through the rootwrap daemon, it "
+                      "doesn't support %s.", ', '.join(sorted(unsupported)))
+            return self._fallback_execute(*cmd, **kwargs)
+
+        process_input = kwargs.pop('process_input', None)
+        check_exit_code = kwargs.pop('check_exit_code', [0])
+        ignore_exit_code = False
+        if isinstance(check_exit_code, bool):
+            ignore_exit_code = not check_exit_code
+            check_exit_code = [0]
+        elif isinstance(check_exit_code, int):
+            check_exit_code = [check_exit_code]
+        delay_on_retry = kwargs.pop('delay_on_retry', True)
+        attempts = kwargs.pop('attempts', 1)
+
+        cmd = [str(c) for c in cmd]
+        sanitized_cmd = strutils.mask_password(' '.join(cmd))
+        client = self._get_client()
+        while attempts > 0:
+            attempts -= 1
+            LOG.debug('Running cmd (daemon): %s', sanitized_cmd)
+            try:
+                returncode, out, err = client.execute(cmd, process_input)
+                if not ignore_exit_code and returncode not in check_exit_code:
+                    raise putils.ProcessExecutionError(
+                        exit_code=returncode,
+                        stdout=strutils.mask_password(out),
+                        stderr=strutils.mask_password(err),
+                        cmd=sanitized_cmd)
+                return (out, err)
+            except putils.ProcessExecutionError:
+                if not attempts:
+                    raise
+                LOG.debug('%r failed. Retrying.', sanitized_cmd)
+                if delay_on_retry:
+                    time.sleep(random.randint(20, 200) / 100.0)
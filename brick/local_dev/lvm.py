@@ -17,6 +17,7 @@
 LVM class for performing LVM operations.
 """
 
+import collections
 import itertools
 import math
 import os
@@ -70,6 +71,9 @@ class LVM(executor.Executor):
         self._supports_snapshot_lv_activation = None
         self._supports_lvchange_ignoreskipactivation = None
         self.vg_provisioned_capacity = 0.0
+        # LVs of the VG by name, loaded by update_volume_group_info and
+        # kept up to date by the operations of this object
+        self._lv_index = None
 
         if create_vg and physical_volumes is not None:
             self.pv_list = physical_volumes
@@ -292,15 +296,97 @@ class LVM(executor.Executor):
 
         return lv_list
 
+    def _get_lv_inventory(self, lv_name=None):
+        """Get everything we track about the LVs of the VG in one lvs run.
+
+        :param lv_name: optional, gathers info for only the specified LV
+        :returns: List of Dictionaries with LV info, attributes and origin
+
+        """
+        cmd = LVM.LVM_CMD_PREFIX + ['lvs', '--noheadings', '--unit=g',
+                                    '-o', 'vg_name,name,size,lv_attr,'
+                                    'origin,data_percent',
+                                    '--separator', ':', '--nosuffix']
+        if lv_name is not None:
+            cmd.append("%s/%s" % (self.vg_name, lv_name))
+        else:
+            cmd.append(self.vg_name)
+
+        try:
+            (out, _err) = self._execute(*cmd,
+                                        root_helper=self._root_helper,
+                                        run_as_root=True)
+        except putils.ProcessExecutionError as err:
+            with excutils.save_and_reraise_exception(reraise=True) as ctx:
+                if "not found" in err.stderr or "Failed to find" in err.stderr:
+                    ctx.reraise = False
+                    LOG.info(_LI("Logical Volume not found when querying "
+                                 "LVM info. (vg_name=%(vg)s, lv_name=%(lv)s"),
+                             {'vg': self.vg_name, 'lv': lv_name})
+                    out = None
+
+        lv_list = []
+        for line in (out or '').splitlines():
+            fields = line.strip().split(':')
+            if len(fields) != 6:
+                continue
+            lv_list.append({'vg': fields[0],
+                            'name': fields[1],
+                            'size': fields[2],
+                            'attr': fields[3],
+                            'origin': fields[4],
+                            'data_percent': fields[5]})
+        return lv_list
+
+    def _load_lv_index(self):
+        self._lv_index = collections.OrderedDict(
+            (lv['name'], lv) for lv in self._get_lv_inventory())
+
+    def _lookup_lv(self, name):
+        """Return what we know of an LV, asking LVM on a miss."""
+        if self._lv_index is not None and name in self._lv_index:
+            return self._lv_index[name]
+        for lv in self._get_lv_inventory(name):
+            if lv['name'] == name:
+                if self._lv_index is not None:
+                    self._lv_index[name] = lv
+                return lv
+        return None
+
+    def _add_lv(self, name, size_str, attr, origin=''):
+        if self._lv_index is None:
+            return
+        # lvcreate and lvextend round sizes up to whole extents, only a
+        # size in GB is close enough to keep
+        if size_str[-1:].lower() != 'g':
+            self._lv_index.pop(name, None)
+            return
+        self._lv_index[name] = {'vg': self.vg_name,
+                                'name': name,
+                                'size': '%.2f' % float(size_str[:-1]),
+                                'attr': attr,
+                                'origin': origin,
+                                'data_percent': ''}
+
+    @staticmethod
+    def _lv_info(lv):
+        return {'vg': lv['vg'], 'name': lv['name'], 'size': lv['size']}
+
     def get_volumes(self, lv_name=None):
         """Get all LV's associated with this instantiation (VG).
 
+        LVs are read from the index of the VG when it is loaded, so only a
+        name that isn't in the index is looked up with LVM.
+
         :returns: List of Dictionaries with LV info
 
         """
-        return self.get_lv_info(self._root_helper,
-                                self.vg_name,
-                                lv_name)
+        if lv_name is not None:
+            lv = self._lookup_lv(lv_name)
+            return [self._lv_info(lv)] if lv is not None else []
+        if self._lv_index is None:
+            self._load_lv_index()
+        return [self._lv_info(lv) for lv in self._lv_index.values()]
 
     def get_volume(self, name):
         """Get reference object of volume specified by name.
@@ -393,7 +479,8 @@ class LVM(executor.Executor):
         """Update VG info for this instantiation.
 
         Used to update member fields of object and
-        provide a dict of info for caller.
+        provide a dict of info for caller.  This reloads the index of LVs
+        of the VG too, with a single lvs run.
 
         :returns: Dictionaries of VG info
 
@@ -409,45 +496,23 @@ class LVM(executor.Executor):
         self.vg_lv_count = int(vg_list[0]['lv_count'])
         self.vg_uuid = vg_list[0]['uuid']
 
+        self._load_lv_index()
+
         total_vols_size = 0.0
         if self.vg_thin_pool is not None:
-            # NOTE(xyang): If providing only self.vg_name,
-            # get_lv_info will output info on the thin pool and all
-            # individual volumes.
-            # get_lv_info(self._root_helper, 'stack-vg')
-            # sudo lvs --noheadings --unit=g -o vg_name,name,size
-            # --nosuffix stack-vg
-            # stack-vg stack-pool               9.51
-            # stack-vg volume-13380d16-54c3-4979-9d22-172082dbc1a1  1.00
-            # stack-vg volume-629e13ab-7759-46a5-b155-ee1eb20ca892  1.00
-            # stack-vg volume-e3e6281c-51ee-464c-b1a7-db6c0854622c  1.00
-            #
-            # If providing both self.vg_name and self.vg_thin_pool,
-            # get_lv_info will output only info on the thin pool, but not
-            # individual volumes.
-            # get_lv_info(self._root_helper, 'stack-vg', 'stack-pool')
-            # sudo lvs --noheadings --unit=g -o vg_name,name,size
-            # --nosuffix stack-vg/stack-pool
-            # stack-vg stack-pool               9.51
-            #
-            # We need info on both the thin pool and the volumes,
-            # therefore we should provide only self.vg_name, but not
-            # self.vg_thin_pool here.
-            for lv in self.get_lv_info(self._root_helper,
-                                       self.vg_name):
+            for lv in self._lv_index.values():
                 lvsize = lv['size']
-                # get_lv_info runs "lvs" command with "--nosuffix".
-                # This removes "g" from "1.00g" and only outputs "1.00".
-                # Running "lvs" command without "--nosuffix" will output
-                # "1.00g" if "g" is the unit.
-                # Remove the unit if it is in lv['size'].
-                if not lv['size'][-1].isdigit():
+                # The "lvs" command runs with "--nosuffix", which removes
+                # "g" from "1.00g" and only outputs "1.00". Remove the unit
+                # if it is in lv['size'] anyway.
+                if not lvsize[-1].isdigit():
                     lvsize = lvsize[:-1]
                 if lv['name'] == self.vg_thin_pool:
                     self.vg_thin_pool_size = lvsize
-                    tpfs = self._get_thin_pool_free_space(self.vg_name,
-                                                          self.vg_thin_pool)
-                    self.vg_thin_pool_free_space = tpfs
+                    consumed_space = (float(lvsize) / 100 *
+                                      float(lv['data_percent'] or 0))
+                    self.vg_thin_pool_free_space = round(
+                        float(lvsize) - consumed_space, 2)
                 else:
                     total_vols_size = total_vols_size + float(lvsize)
             total_vols_size = round(total_vols_size, 2)
@@ -511,6 +576,7 @@ class LVM(executor.Executor):
                       root_helper=self._root_helper,
                       run_as_root=True)
 
+        self._add_lv(name, size_str, 'twi-a-tz--')
         self.vg_thin_pool = name
         return size_str
 
@@ -551,6 +617,13 @@ class LVM(executor.Executor):
             LOG.error(_LE('StdErr  :%s') % err.stderr)
             raise
 
+        if lv_type == 'thin':
+            self._add_lv(name, size_str, 'Vwi-a-tz--')
+        elif mirror_count > 0:
+            self._add_lv(name, size_str, 'mwi-a-m---')
+        else:
+            self._add_lv(name, size_str, '-wi-a-----')
+
     @utils.retry(putils.ProcessExecutionError)
     def create_lv_snapshot(self, name, source_lv_name, lv_type='default'):
         """Creates a snapshot of a logical volume.
@@ -582,6 +655,17 @@ class LVM(executor.Executor):
             LOG.error(_LE('StdErr  :%s') % err.stderr)
             raise
 
+        size = source_lvref['size']
+        if not size[-1].isdigit():
+            size = size[:-1]
+        if lv_type == 'thin':
+            self._add_lv(name, '%sg' % size, 'Vwi-a-tz-k', source_lv_name)
+        else:
+            self._add_lv(name, '%sg' % size, 'swi-a-s---', source_lv_name)
+            source = (self._lv_index or {}).get(source_lv_name)
+            if source is not None:
+                source['attr'] = 'o' + source['attr'][1:]
+
     def _mangle_lv_name(self, name):
         # Linux LVM reserves name that starts with snapshot, so that
         # such volume name can't be created. Mangle it.
@@ -672,6 +756,23 @@ class LVM(executor.Executor):
             LOG.debug('Successfully deleted volume: %s after '
                       'udev settle.', name)
 
+        self._remove_lv(name)
+
+    def _remove_lv(self, name):
+        if self._lv_index is None:
+            return
+        lv = self._lv_index.pop(name, None)
+        # Removing an origin removes its old style snapshots along
+        for other in list(self._lv_index.values()):
+            if other['origin'] == name and other['attr'][:1] in ('s', 'S'):
+                del self._lv_index[other['name']]
+        origin = self._lv_index.get(lv['origin']) if lv else None
+        if origin is not None and not any(
+                other['origin'] == origin['name'] and
+                other['attr'][:1] in ('s', 'S')
+                for other in self._lv_index.values()):
+            origin['attr'] = '-' + origin['attr'][1:]
+
     def revert(self, snapshot_name):
         """Revert an LV from snapshot.
 
@@ -683,15 +784,9 @@ class LVM(executor.Executor):
                       run_as_root=True)
 
     def lv_has_snapshot(self, name):
-        cmd = LVM.LVM_CMD_PREFIX + ['lvdisplay', '--noheading', '-C', '-o',
-                                    'Attr', '%s/%s' % (self.vg_name, name)]
-        out, _err = self._execute(*cmd,
-                                  root_helper=self._root_helper,
-                                  run_as_root=True)
-        if out:
-            out = out.strip()
-            if (out[0] == 'o') or (out[0] == 'O'):
-                return True
+        lv = self._lookup_lv(name)
+        if lv is not None and lv['attr'][:1] in ('o', 'O'):
+            return True
         return False
 
     def extend_volume(self, lv_name, new_size):
@@ -709,6 +804,10 @@ class LVM(executor.Executor):
             LOG.error(_LE('StdErr  :%s') % err.stderr)
             raise
 
+        lv = (self._lv_index or {}).get(lv_name)
+        if lv is not None:
+            self._add_lv(lv_name, new_size, lv['attr'], lv['origin'])
+
     def vg_mirror_free_space(self, mirror_count):
         free_capacity = 0.0
 
@@ -746,3 +845,12 @@ class LVM(executor.Executor):
             LOG.error(_LE('StdOut  :%s') % err.stdout)
             LOG.error(_LE('StdErr  :%s') % err.stderr)
             raise
+
+        if self._lv_index is not None:
+            lv = self._lv_index.pop(lv_name, None)
+            if lv is not None:
+                lv['name'] = new_name
+                self._lv_index[new_name] = lv
+            for other in self._lv_index.values():
+                if other['origin'] == lv_name:
+                    other['origin'] = new_name
@@ -156,6 +156,11 @@ global_opts = [
                default='/etc/cinder/rootwrap.conf',
                help='Path to the rootwrap configuration file to use for '
                     'running commands as root'),
+    cfg.BoolOpt('use_rootwrap_daemon',
+                default=False,
+                help='Run commands as root through a resident '
+                     'cinder-rootwrap-daemon instead of starting sudo and '
+                     'cinder-rootwrap for each of them'),
     cfg.BoolOpt('monkey_patch',
                 default=False,
                 help='Enable monkey patching'),
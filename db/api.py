@@ -176,6 +176,11 @@ def volume_data_get_for_host(context, host, count_only=False):
                                          count_only)
 
 
+def volume_count_get_by_hosts(context, hosts):
+    """Get a dict of volume counts keyed by host for the given hosts."""
+    return IMPL.volume_count_get_by_hosts(context, hosts)
+
+
 def volume_data_get_for_project(context, project_id):
     """Get (volume_count, gigabytes) for project."""
     return IMPL.volume_data_get_for_project(context, project_id)
@@ -202,10 +207,11 @@ def volume_get(context, volume_id):
 
 
 def volume_get_all(context, marker, limit, sort_keys=None, sort_dirs=None,
-                   filters=None):
+                   filters=None, fields=None):
     """Get all volumes."""
     return IMPL.volume_get_all(context, marker, limit, sort_keys=sort_keys,
-                               sort_dirs=sort_dirs, filters=filters)
+                               sort_dirs=sort_dirs, filters=filters,
+                               fields=fields)
 
 
 def volume_get_all_by_host(context, host, filters=None):
@@ -219,12 +225,14 @@ def volume_get_all_by_group(context, group_id, filters=None):
 
 
 def volume_get_all_by_project(context, project_id, marker, limit,
-                              sort_keys=None, sort_dirs=None, filters=None):
+                              sort_keys=None, sort_dirs=None, filters=None,
+                              fields=None):
     """Get all volumes belonging to a project."""
     return IMPL.volume_get_all_by_project(context, project_id, marker, limit,
                                           sort_keys=sort_keys,
                                           sort_dirs=sort_dirs,
-                                          filters=filters)
+                                          filters=filters,
+                                          fields=fields)
 
 
 def volume_get_iscsi_target_num(context, volume_id):
@@ -280,14 +288,20 @@ def snapshot_get(context, snapshot_id):
     return IMPL.snapshot_get(context, snapshot_id)
 
 
-def snapshot_get_all(context):
+def snapshot_get_all(context, filters=None, marker=None, limit=None,
+                     sort_keys=None, sort_dirs=None, offset=None):
     """Get all snapshots."""
-    return IMPL.snapshot_get_all(context)
+    return IMPL.snapshot_get_all(context, filters, marker, limit, sort_keys,
+                                 sort_dirs, offset)
 
 
-def snapshot_get_all_by_project(context, project_id):
+def snapshot_get_all_by_project(context, project_id, filters=None,
+                                marker=None, limit=None, sort_keys=None,
+                                sort_dirs=None, offset=None):
     """Get all snapshots belonging to a project."""
-    return IMPL.snapshot_get_all_by_project(context, project_id)
+    return IMPL.snapshot_get_all_by_project(context, project_id, filters,
+                                            marker, limit, sort_keys,
+                                            sort_dirs, offset)
 
 
 def snapshot_get_by_host(context, host, filters=None):
@@ -770,10 +784,12 @@ def quota_usage_get_all_by_project(context, project_id):
 
 
 def quota_reserve(context, resources, quotas, deltas, expire,
-                  until_refresh, max_age, project_id=None):
+                  until_refresh, max_age, project_id=None,
+                  async_refresh=False):
     """Check quotas and create appropriate reservations."""
     return IMPL.quota_reserve(context, resources, quotas, deltas, expire,
-                              until_refresh, max_age, project_id=project_id)
+                              until_refresh, max_age, project_id=project_id,
+                              async_refresh=async_refresh)
 
 
 def reservation_commit(context, reservations, project_id=None):
@@ -27,6 +27,7 @@ import time
 import uuid
 import warnings
 
+from eventlet import greenthread
 from oslo_config import cfg
 from oslo_db import exception as db_exc
 from oslo_db import options
@@ -39,7 +40,7 @@ import six
 import sqlalchemy
 from sqlalchemy import MetaData
 from sqlalchemy import or_
-from sqlalchemy.orm import joinedload, joinedload_all
+from sqlalchemy.orm import joinedload, joinedload_all, subqueryload
 from sqlalchemy.orm import RelationshipProperty
 from sqlalchemy.schema import Table
 from sqlalchemy.sql.expression import literal_column
@@ -734,29 +735,98 @@ def _reservation_create(context, uuid, usage, project_id, resource, delta,
 # code always acquires the lock on quota_usages before acquiring the lock
 # on reservations.
 
-def _get_quota_usages(context, session, project_id):
+def _get_quota_usages(context, session, project_id, resources=None):
     # Broken out for testability
-    rows = model_query(context, models.QuotaUsage,
-                       read_deleted="no",
-                       session=session).\
-        filter_by(project_id=project_id).\
-        with_lockmode('update').\
-        all()
+    query = model_query(context, models.QuotaUsage,
+                        read_deleted="no",
+                        session=session).\
+        filter_by(project_id=project_id)
+    if resources is not None:
+        # Only lock the usages that are going to change
+        query = query.filter(models.QuotaUsage.resource.in_(resources))
+    rows = query.with_lockmode('update').all()
     return dict((row.resource, row) for row in rows)
 
 
+def _quota_usage_sync(elevated, session, project_id, resources, resource,
+                      usages, until_refresh):
+    """Refresh usages from the sync routine of a resource.
+
+    Returns the names of the resources whose usage was refreshed.
+    """
+    # Grab the sync routine
+    sync = QUOTA_SYNC_FUNCTIONS[resources[resource].sync]
+    volume_type_id = getattr(resources[resource], 'volume_type_id', None)
+    volume_type_name = getattr(resources[resource], 'volume_type_name', None)
+    updates = sync(elevated, project_id,
+                   volume_type_id=volume_type_id,
+                   volume_type_name=volume_type_name,
+                   session=session)
+    for res, in_use in updates.items():
+        # Make sure we have a destination for the usage!
+        if res not in usages:
+            usages.update(_get_quota_usages(elevated, session, project_id,
+                                            resources=[res]))
+        if res not in usages:
+            usages[res] = _quota_usage_create(elevated,
+                                              project_id,
+                                              res,
+                                              0, 0,
+                                              until_refresh or None,
+                                              session=session)
+
+        # Update the usage
+        usages[res].in_use = in_use
+        usages[res].until_refresh = until_refresh or None
+
+        # NOTE(Vek): We make the assumption that the sync
+        #            routine actually refreshes the
+        #            resources that it is the sync routine
+        #            for.  We don't check, because this is
+        #            a best-effort mechanism.
+    return set(updates)
+
+
+def _quota_usage_refresh(elevated, project_id, resources, refresh,
+                         until_refresh):
+    """Refresh the usages of the given resources in their own transaction.
+
+    Used to run the syncs that quota_reserve deferred.
+    """
+    try:
+        session = get_session()
+        with session.begin():
+            usages = _get_quota_usages(elevated, session, project_id,
+                                       resources=refresh)
+            work = set(refresh)
+            while work:
+                resource = work.pop()
+                work -= _quota_usage_sync(elevated, session, project_id,
+                                          resources, resource, usages,
+                                          until_refresh)
+    except Exception:
+        # The usages are refreshed again when next due
+        LOG.exception(_LE("Failed to refresh the quota usages of project "
+                          "%(project_id)s for %(resources)s."),
+                      {'project_id': project_id, 'resources': refresh})
+
+
 @require_context
 @_retry_on_deadlock
 def quota_reserve(context, resources, quotas, deltas, expire,
-                  until_refresh, max_age, project_id=None):
+                  until_refresh, max_age, project_id=None,
+                  async_refresh=False):
     elevated = context.elevated()
     session = get_session()
+    # Usages whose refresh is due but was deferred to the background
+    deferred = set()
     with session.begin():
         if project_id is None:
             project_id = context.project_id
 
         # Get the current usages
-        usages = _get_quota_usages(context, session, project_id)
+        usages = _get_quota_usages(context, session, project_id,
+                                   resources=deltas.keys())
 
         # Handle usage refresh
         work = set(deltas.keys())
@@ -765,6 +835,9 @@ def quota_reserve(context, resources, quotas, deltas, expire,
 
             # Do we need to refresh the usage?
             refresh = False
+            # A refresh that only keeps the usage from drifting; unlike
+            # missing or negative usages, it can be run in the background
+            periodic = False
             if resource not in usages:
                 usages[resource] = _quota_usage_create(elevated,
                                                        project_id,
@@ -780,51 +853,25 @@ def quota_reserve(context, resources, quotas, deltas, expire,
             elif usages[resource].until_refresh is not None:
                 usages[resource].until_refresh -= 1
                 if usages[resource].until_refresh <= 0:
-                    refresh = True
+                    refresh = periodic = True
             elif max_age and usages[resource].updated_at is not None and (
                 (usages[resource].updated_at -
                     timeutils.utcnow()).seconds >= max_age):
-                refresh = True
-
-            # OK, refresh the usage
-            if refresh:
-                # Grab the sync routine
-                sync = QUOTA_SYNC_FUNCTIONS[resources[resource].sync]
-                volume_type_id = getattr(resources[resource],
-                                         'volume_type_id', None)
-                volume_type_name = getattr(resources[resource],
-                                           'volume_type_name', None)
-                updates = sync(elevated, project_id,
-                               volume_type_id=volume_type_id,
-                               volume_type_name=volume_type_name,
-                               session=session)
-                for res, in_use in updates.items():
-                    # Make sure we have a destination for the usage!
-                    if res not in usages:
-                        usages[res] = _quota_usage_create(
-                            elevated,
-                            project_id,
-                            res,
-                            0, 0,
-                            until_refresh or None,
-                            session=session
-                        )
-
-                    # Update the usage
-                    usages[res].in_use = in_use
-                    usages[res].until_refresh = until_refresh or None
-
-                    # Because more than one resource may be refreshed
-                    # by the call to the sync routine, and we don't
-                    # want to double-sync, we make sure all refreshed
-                    # resources are dropped from the work set.
-                    work.discard(res)
-
-                    # NOTE(Vek): We make the assumption that the sync
-                    #            routine actually refreshes the
-                    #            resources that it is the sync routine
-                    #            for.  We don't check, because this is
-                    #            a best-effort mechanism.
+                refresh = periodic = True
+
+            if refresh and periodic and async_refresh:
+                # Go on with the current usage and restart the count
+                # down so the refresh is only scheduled once
+                usages[resource].until_refresh = until_refresh or None
+                deferred.add(resource)
+            elif refresh:
+                # OK, refresh the usage.  Because more than one resource
+                # may be refreshed by the call to the sync routine, and we
+                # don't want to double-sync, we make sure all refreshed
+                # resources are dropped from the work set.
+                work -= _quota_usage_sync(elevated, session, project_id,
+                                          resources, resource, usages,
+                                          until_refresh)
 
         # Check for deltas that would go negative
         unders = [r for r, delta in deltas.items()
@@ -873,6 +920,9 @@ def quota_reserve(context, resources, quotas, deltas, expire,
                 if delta > 0:
                     usages[resource].reserved += delta
 
+    if deferred:
+        greenthread.spawn_n(_quota_usage_refresh, elevated, project_id,
+                            resources, deferred, until_refresh)
     if unders:
         LOG.warning(_LW("Change will make usage less than 0 for the following "
                         "resources: %s") % unders)
@@ -885,32 +935,63 @@ def quota_reserve(context, resources, quotas, deltas, expire,
     return reservations
 
 
-def _quota_reservations(session, context, reservations):
-    """Return the relevant reservations."""
+def _quota_reservations_query(session, context, reservations):
+    """Return the query for the relevant reservations."""
 
-    # Get the listed reservations
     return model_query(context, models.Reservation,
                        read_deleted="no",
                        session=session).\
-        filter(models.Reservation.uuid.in_(reservations)).\
+        filter(models.Reservation.uuid.in_(reservations))
+
+
+def _quota_reservations(session, context, reservations):
+    """Return the relevant reservations."""
+
+    # Get the listed reservations
+    return _quota_reservations_query(session, context, reservations).\
         with_lockmode('update').\
         all()
 
 
+def _dispose_reservations(context, session, reservations, project_id,
+                          commit):
+    """Release reservations, adding their deltas to the usages on commit.
+
+    Only the usages of the resources the reservations are for get locked,
+    and all the reservations are deleted with a single statement.
+    """
+    if not reservations:
+        return
+
+    resources = set(row.resource for row in
+                    _quota_reservations_query(session, context,
+                                              reservations).
+                    with_entities(models.Reservation.resource).
+                    distinct())
+    usages = _get_quota_usages(context, session, project_id,
+                               resources=resources)
+
+    for reservation in _quota_reservations(session, context, reservations):
+        usage = usages[reservation.resource]
+        if reservation.delta >= 0:
+            usage.reserved -= reservation.delta
+        if commit:
+            usage.in_use += reservation.delta
+
+    _quota_reservations_query(session, context, reservations).\
+        update({'deleted': True,
+                'deleted_at': timeutils.utcnow(),
+                'updated_at': literal_column('updated_at')},
+               synchronize_session=False)
+
+
 @require_context
 @_retry_on_deadlock
 def reservation_commit(context, reservations, project_id=None):
     session = get_session()
     with session.begin():
-        usages = _get_quota_usages(context, session, project_id)
-
-        for reservation in _quota_reservations(session, context, reservations):
-            usage = usages[reservation.resource]
-            if reservation.delta >= 0:
-                usage.reserved -= reservation.delta
-            usage.in_use += reservation.delta
-
-            reservation.delete(session=session)
+        _dispose_reservations(context, session, reservations, project_id,
+                              commit=True)
 
 
 @require_context
@@ -918,14 +999,8 @@ def reservation_commit(context, reservations, project_id=None):
 def reservation_rollback(context, reservations, project_id=None):
     session = get_session()
     with session.begin():
-        usages = _get_quota_usages(context, session, project_id)
-
-        for reservation in _quota_reservations(session, context, reservations):
-            usage = usages[reservation.resource]
-            if reservation.delta >= 0:
-                usage.reserved -= reservation.delta
-
-            reservation.delete(session=session)
+        _dispose_reservations(context, session, reservations, project_id,
+                              commit=False)
 
 
 @require_admin_context
@@ -1073,6 +1148,20 @@ def volume_data_get_for_host(context, host, count_only=False):
         return (result[0] or 0, result[1] or 0)
 
 
+@require_admin_context
+def volume_count_get_by_hosts(context, hosts):
+    if not hosts:
+        return {}
+    result = model_query(context,
+                         models.Volume.host,
+                         func.count(models.Volume.id),
+                         read_deleted="no").\
+        filter(models.Volume.host.in_(hosts)).\
+        group_by(models.Volume.host).\
+        all()
+    return dict(result)
+
+
 @require_admin_context
 def _volume_data_get_for_project(context, project_id, volume_type_id=None,
                                  session=None):
@@ -1230,24 +1319,31 @@ def volume_detached(context, volume_id, attachment_id):
 
 
 @require_context
-def _volume_get_query(context, session=None, project_only=False):
+def _volume_get_query(context, session=None, project_only=False,
+                      loader=joinedload):
+    """Get the query to retrieve volumes.
+
+    :param context: context to query under
+    :param session: the session to use
+    :param project_only: restrict user contexts to their own project
+    :param loader: eager loading strategy for the volume relationships, for
+                   instance joinedload or subqueryload; None loads none of
+                   them
+    :returns: volume query
+    """
+    query = model_query(context, models.Volume, session=session,
+                        project_only=project_only)
+    if loader is None:
+        return query
+
+    relationships = ['volume_metadata', 'volume_type',
+                     'volume_type.extra_specs', 'volume_attachment',
+                     'consistencygroup']
     if is_admin_context(context):
-        return model_query(context, models.Volume, session=session,
-                           project_only=project_only).\
-            options(joinedload('volume_metadata')).\
-            options(joinedload('volume_admin_metadata')).\
-            options(joinedload('volume_type')).\
-            options(joinedload('volume_type.extra_specs')).\
-            options(joinedload('volume_attachment')).\
-            options(joinedload('consistencygroup'))
-    else:
-        return model_query(context, models.Volume, session=session,
-                           project_only=project_only).\
-            options(joinedload('volume_metadata')).\
-            options(joinedload('volume_type')).\
-            options(joinedload('volume_type.extra_specs')).\
-            options(joinedload('volume_attachment')).\
-            options(joinedload('consistencygroup'))
+        relationships.append('volume_admin_metadata')
+    for relationship in relationships:
+        query = query.options(loader(relationship))
+    return query
 
 
 @require_context
@@ -1317,7 +1413,7 @@ def volume_get(context, volume_id):
 
 @require_admin_context
 def volume_get_all(context, marker, limit, sort_keys=None, sort_dirs=None,
-                   filters=None):
+                   filters=None, fields=None):
     """Retrieves all volumes.
 
     If no sort parameters are specified then the returned volumes are sorted
@@ -1336,17 +1432,21 @@ def volume_get_all(context, marker, limit, sort_keys=None, sort_dirs=None,
                     or sets cause an 'IN' operation, while exact matching
                     is used for other values, see _process_volume_filters
                     function for more information
+    :param fields: names of the volume columns to return; when given the
+                   volumes are returned as dictionaries of those columns
+                   only, without any of their relationships
     :returns: list of matching volumes
     """
     session = get_session()
     with session.begin():
         # Generate the query
         query = _generate_paginate_query(context, session, marker, limit,
-                                         sort_keys, sort_dirs, filters)
+                                         sort_keys, sort_dirs, filters,
+                                         fields=fields)
         # No volumes would match, return empty list
         if query is None:
             return []
-        return query.all()
+        return _paginate_query_results(query, fields)
 
 
 @require_admin_context
@@ -1407,7 +1507,8 @@ def volume_get_all_by_group(context, group_id, filters=None):
 
 @require_context
 def volume_get_all_by_project(context, project_id, marker, limit,
-                              sort_keys=None, sort_dirs=None, filters=None):
+                              sort_keys=None, sort_dirs=None, filters=None,
+                              fields=None):
     """"Retrieves all volumes in a project.
 
     If no sort parameters are specified then the returned volumes are sorted
@@ -1427,6 +1528,9 @@ def volume_get_all_by_project(context, project_id, marker, limit,
                     or sets cause an 'IN' operation, while exact matching
                     is used for other values, see _process_volume_filters
                     function for more information
+    :param fields: names of the volume columns to return; when given the
+                   volumes are returned as dictionaries of those columns
+                   only, without any of their relationships
     :returns: list of matching volumes
     """
     session = get_session()
@@ -1437,15 +1541,17 @@ def volume_get_all_by_project(context, project_id, marker, limit,
         filters['project_id'] = project_id
         # Generate the query
         query = _generate_paginate_query(context, session, marker, limit,
-                                         sort_keys, sort_dirs, filters)
+                                         sort_keys, sort_dirs, filters,
+                                         fields=fields)
         # No volumes would match, return empty list
         if query is None:
             return []
-        return query.all()
+        return _paginate_query_results(query, fields)
 
 
 def _generate_paginate_query(context, session, marker, limit, sort_keys,
-                             sort_dirs, filters):
+                             sort_dirs, filters, offset=None,
+                             paginate_type=models.Volume, fields=None):
     """Generate the query to include the filters and the paginate options.
 
     Returns a query with sorting / pagination criteria added or None
@@ -1464,26 +1570,66 @@ def _generate_paginate_query(context, session, marker, limit, sort_keys,
                     or sets cause an 'IN' operation, while exact matching
                     is used for other values, see _process_volume_filters
                     function for more information
+    :param offset: number of items to skip
+    :param paginate_type: type of pagination to generate, a key of
+                          PAGINATION_HELPERS
+    :param fields: names of the columns to select; when given the query
+                   returns rows of those columns only and loads no
+                   relationships, see _paginate_query_results
     :returns: updated query or None
     """
+    get_query, process_filters, get = PAGINATION_HELPERS[paginate_type]
+
+    columns = None
+    if fields:
+        columns = []
+        for field in fields:
+            column_attr = getattr(paginate_type, field, None)
+            prop = getattr(column_attr, 'property', None)
+            if prop is None or isinstance(prop, RelationshipProperty):
+                raise exception.InvalidInput(
+                    reason=_("Invalid field: %s") % field)
+            columns.append(column_attr)
+
     sort_keys, sort_dirs = process_sort_params(sort_keys,
                                                sort_dirs,
                                                default_dir='desc')
-    query = _volume_get_query(context, session=session)
+    if columns:
+        query = get_query(context, session=session, loader=None)
+    else:
+        # Load the relationships of the whole page with one extra query
+        # each, rather than joining them in and multiplying the page rows
+        query = get_query(context, session=session, loader=subqueryload)
 
     if filters:
-        query = _process_volume_filters(query, filters)
+        query = process_filters(query, filters)
         if query is None:
             return None
 
-    marker_volume = None
+    marker_object = None
     if marker is not None:
-        marker_volume = _volume_get(context, marker, session)
+        marker_object = get(context, marker, session)
+
+    query = sqlalchemyutils.paginate_query(query, paginate_type, limit,
+                                           sort_keys,
+                                           marker=marker_object,
+                                           sort_dirs=sort_dirs)
+    if offset:
+        query = query.offset(offset)
+    if columns:
+        query = query.with_entities(*columns)
+    return query
 
-    return sqlalchemyutils.paginate_query(query, models.Volume, limit,
-                                          sort_keys,
-                                          marker=marker_volume,
-                                          sort_dirs=sort_dirs)
+
+def _paginate_query_results(query, fields=None):
+    """Return the results of a _generate_paginate_query query.
+
+    Rows of a query restricted to some fields are returned as dictionaries
+    of those fields.
+    """
+    if not fields:
+        return query.all()
+    return [dict(zip(fields, row)) for row in query]
 
 
 def _process_volume_filters(query, filters):
@@ -1928,10 +2074,103 @@ def snapshot_get(context, snapshot_id):
 
 
 @require_admin_context
-def snapshot_get_all(context):
-    return model_query(context, models.Snapshot).\
-        options(joinedload('snapshot_metadata')).\
-        all()
+def snapshot_get_all(context, filters=None, marker=None, limit=None,
+                     sort_keys=None, sort_dirs=None, offset=None):
+    """Retrieves all snapshots.
+
+    If no sort parameters are specified then the returned snapshots are
+    sorted first by the 'created_at' key and then by the 'id' key in
+    descending order.
+
+    :param context: context to query under
+    :param filters: dictionary of filters; values that are in lists, tuples,
+                    or sets cause an 'IN' operation, while exact matching
+                    is used for other values, see _process_snaps_filters
+                    function for more information
+    :param marker: the last item of the previous page, used to determine the
+                   next page of results to return
+    :param limit: maximum number of items to return
+    :param sort_keys: list of attributes by which results should be sorted,
+                      paired with corresponding item in sort_dirs
+    :param sort_dirs: list of directions in which results should be sorted,
+                      paired with corresponding item in sort_keys
+    :param offset: number of items to skip
+    :returns: list of matching snapshots
+    """
+    session = get_session()
+    with session.begin():
+        query = _generate_paginate_query(context, session, marker, limit,
+                                         sort_keys, sort_dirs, filters,
+                                         offset, models.Snapshot)
+        # No snapshots would match, return empty list
+        if query is None:
+            return []
+        return query.all()
+
+
+@require_context
+def _snaps_get_query(context, session=None, project_only=False,
+                     loader=joinedload):
+    query = model_query(context, models.Snapshot, session=session,
+                        project_only=project_only)
+    if loader is None:
+        return query
+    return query.options(loader('snapshot_metadata'))
+
+
+def _process_snaps_filters(query, filters):
+    """Common filter processing for Snapshot queries.
+
+    Filter values that are in lists, tuples, or sets cause an 'IN' operator
+    to be used, while exact matching ('==' operator) is used for other values.
+
+    :param query: Model query to use
+    :param filters: dictionary of filters
+    :returns: updated query or None
+    """
+    filters = filters.copy()
+
+    # Ensure that the filter value exists on the model
+    for key in filters.keys():
+        try:
+            column_attr = getattr(models.Snapshot, key)
+            # Do not allow relationship properties since those require
+            # schema specific knowledge
+            prop = getattr(column_attr, 'property')
+            if isinstance(prop, RelationshipProperty):
+                LOG.debug(("'%s' filter key is not valid, "
+                           "it maps to a relationship."), key)
+                return None
+        except AttributeError:
+            LOG.debug("'%s' filter key is not valid.", key)
+            return None
+
+    # Holds the simple exact matches
+    filter_dict = {}
+
+    for key, value in filters.iteritems():
+        if isinstance(value, (list, tuple, set, frozenset)):
+            # Looking for values in a list; apply to query directly
+            column_attr = getattr(models.Snapshot, key)
+            query = query.filter(column_attr.in_(value))
+        else:
+            # OK, simple exact match; save for later
+            filter_dict[key] = value
+
+    # Apply simple exact matches
+    if filter_dict:
+        query = query.filter_by(**filter_dict)
+    return query
+
+
+# Model-specific helpers used by _generate_paginate_query: the function that
+# builds the base query, the one that applies the filters and the one that
+# loads the marker object.
+PAGINATION_HELPERS = {
+    models.Volume: (_volume_get_query, _process_volume_filters, _volume_get),
+    models.Snapshot: (_snaps_get_query, _process_snaps_filters,
+                      _snapshot_get),
+}
 
 
 @require_context
@@ -1966,12 +2205,44 @@ def snapshot_get_all_for_cgsnapshot(context, cgsnapshot_id):
 
 
 @require_context
-def snapshot_get_all_by_project(context, project_id):
-    authorize_project_context(context, project_id)
-    return model_query(context, models.Snapshot).\
-        filter_by(project_id=project_id).\
-        options(joinedload('snapshot_metadata')).\
-        all()
+def snapshot_get_all_by_project(context, project_id, filters=None,
+                                marker=None, limit=None, sort_keys=None,
+                                sort_dirs=None, offset=None):
+    """Retrieves all snapshots in a project.
+
+    If no sort parameters are specified then the returned snapshots are
+    sorted first by the 'created_at' key and then by the 'id' key in
+    descending order.
+
+    :param context: context to query under
+    :param project_id: project for all snapshots being retrieved
+    :param filters: dictionary of filters; values that are in lists, tuples,
+                    or sets cause an 'IN' operation, while exact matching
+                    is used for other values, see _process_snaps_filters
+                    function for more information
+    :param marker: the last item of the previous page, used to determine the
+                   next page of results to return
+    :param limit: maximum number of items to return
+    :param sort_keys: list of attributes by which results should be sorted,
+                      paired with corresponding item in sort_dirs
+    :param sort_dirs: list of directions in which results should be sorted,
+                      paired with corresponding item in sort_keys
+    :param offset: number of items to skip
+    :returns: list of matching snapshots
+    """
+    session = get_session()
+    with session.begin():
+        authorize_project_context(context, project_id)
+        # Add in the project filter without modifying the given filters
+        filters = filters.copy() if filters else {}
+        filters['project_id'] = project_id
+        query = _generate_paginate_query(context, session, marker, limit,
+                                         sort_keys, sort_dirs, filters,
+                                         offset, models.Snapshot)
+        # No snapshots would match, return empty list
+        if query is None:
+            return []
+        return query.all()
 
 
 @require_context
@@ -0,0 +1,47 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from oslo_log import log as logging
+from sqlalchemy import Column, MetaData, String, Table
+
+from cinder.i18n import _LE
+
+LOG = logging.getLogger(__name__)
+
+
+def upgrade(migrate_engine):
+    meta = MetaData()
+    meta.bind = migrate_engine
+
+    backups = Table('backups', meta, autoload=True)
+    restore_volume_id = Column('restore_volume_id', String(length=36))
+
+    try:
+        backups.create_column(restore_volume_id)
+    except Exception:
+        LOG.error(_LE("Adding restore_volume_id column to backups table "
+                      "failed."))
+        raise
+
+
+def downgrade(migrate_engine):
+    meta = MetaData()
+    meta.bind = migrate_engine
+
+    backups = Table('backups', meta, autoload=True)
+
+    try:
+        backups.drop_column('restore_volume_id')
+    except Exception:
+        LOG.error(_LE("Dropping restore_volume_id column from backups table "
+                      "failed."))
+        raise
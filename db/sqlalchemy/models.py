@@ -519,6 +519,8 @@ class Backup(BASE, CinderBase):
     display_description = Column(String(255))
     container = Column(String(255))
     parent_id = Column(String(36))
+    # Volume being restored while the backup is restoring
+    restore_volume_id = Column(String(36))
     status = Column(String(255))
     fail_reason = Column(String(255))
     service_metadata = Column(String(255))
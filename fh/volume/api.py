@@ -18,6 +18,16 @@
 from cinder.volume.api import *
 from cinder.fh.volume import rpcapi as volume_rpcapi
 
+import collections
+
+import eventlet
+from oslo_log import log as logging
+
+from cinder.i18n import _LW
+from cinder.volume import utils as volume_utils
+
+LOG = logging.getLogger(__name__)
+
 
 class FhAPI(API):
     def __init__(self, db_driver=None, image_service=None):
@@ -27,6 +37,36 @@ class FhAPI(API):
     def get_volume_snapshots(self, context, volume):
         return self.volume_rpcapi.get_volume_snapshots(context, volume)
 
+    def get_volumes_snapshots(self, context, volumes):
+        """Get the snapshots of many volumes with one call per backend.
+
+        The calls to the different backends are made concurrently. Returns a
+        dict of snapshot lists keyed by volume id; volumes without a host or
+        whose backend could not be reached are left out.
+        """
+        volumes_by_host = collections.defaultdict(list)
+        for volume in volumes:
+            if volume['host']:
+                host = volume_utils.extract_host(volume['host'])
+                volumes_by_host[host].append({'id': volume['id'],
+                                              'host': volume['host']})
+
+        def _get_host_snapshots(host):
+            try:
+                return self.volume_rpcapi.get_volumes_snapshots(
+                    context, host, volumes_by_host[host])
+            except Exception:
+                LOG.warning(_LW("Unable to get volume snapshots from "
+                                "host %s."), host, exc_info=True)
+                return {}
+
+        snapshots = {}
+        pool = eventlet.GreenPool(max(len(volumes_by_host), 1))
+        for host_snapshots in pool.imap(_get_host_snapshots,
+                                        volumes_by_host):
+            snapshots.update(host_snapshots)
+        return snapshots
+
     def get_snapshot_children(self, context, snapshot):
         volume = self.db.volume_get(context, snapshot.volume_id)
         return self.volume_rpcapi.get_snapshot_children(context, snapshot,
@@ -24,7 +24,7 @@ LOG = logging.getLogger(__name__)
 class FhVolumeManager(volume_manager.VolumeManager):
     """The volume manager of fenghuo."""
 
-    RPC_API_VERSION = '1.30'
+    RPC_API_VERSION = '1.31'
 
     target = messaging.Target(version=RPC_API_VERSION)
 
@@ -40,6 +40,11 @@ class FhVolumeManager(volume_manager.VolumeManager):
                   {'volume_id': volume['id']})
         return self.driver.get_volume_snapshots(volume)
 
+    def get_volumes_snapshots(self, ctxt, volumes):
+        LOG.debug('retrieving snapshots of %(count)d volumes',
+                  {'count': len(volumes)})
+        return self.driver.get_volumes_snapshots(volumes)
+
     def get_snapshot_children(self, ctxt, snapshot):
         LOG.debug('retrieving snapshot children: %(snapshot_id)s',
                   {'snapshot_id': snapshot['id']})
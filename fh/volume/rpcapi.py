@@ -20,8 +20,22 @@ from cinder.volume.rpcapi import *
 
 
 class FhVolumeAPI(VolumeAPI):
+    """Client side of the fenghuo volume rpc API.
+
+    API version history:
+
+        1.31 - Adds get_volumes_snapshots
+    """
+
+    RPC_API_VERSION = '1.31'
+
     def __init__(self):
         super(FhVolumeAPI, self).__init__()
+        target = messaging.Target(topic=CONF.volume_topic,
+                                  version=self.BASE_RPC_API_VERSION)
+        serializer = objects_base.CinderObjectSerializer()
+        self.client = rpc.get_client(target, self.RPC_API_VERSION,
+                                     serializer=serializer)
 
     def get_volume_snapshots(self, ctxt, volume):
         host = utils.extract_host(volume['host'])
@@ -29,6 +43,11 @@ class FhVolumeAPI(VolumeAPI):
         cctxt = self.client.prepare(server=new_host, version='1.23')
         return cctxt.call(ctxt, 'get_volume_snapshots', volume=volume)
 
+    def get_volumes_snapshots(self, ctxt, host, volumes):
+        new_host = utils.extract_host(host)
+        cctxt = self.client.prepare(server=new_host, version='1.31')
+        return cctxt.call(ctxt, 'get_volumes_snapshots', volumes=volumes)
+
     def get_snapshot_children(self, ctxt, snapshot, volume):
         new_host = utils.extract_host(volume['host'])
         cctxt = self.client.prepare(server=new_host, version='1.23')
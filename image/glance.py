@@ -19,22 +19,30 @@
 
 from __future__ import absolute_import
 
+import collections
 import copy
+import hashlib
 import itertools
+import os
 import random
 import shutil
 import sys
 import time
 
+import eventlet
+from eventlet import semaphore
+from eventlet import tpool
 import glanceclient.exc
 from oslo_config import cfg
 from oslo_log import log as logging
 from oslo_serialization import jsonutils
 from oslo_utils import timeutils
+from oslo_utils import units
+import six
 import six.moves.urllib.parse as urlparse
 
 from cinder import exception
-from cinder.i18n import _LE, _LW
+from cinder.i18n import _, _LE, _LW
 
 
 glance_opts = [
@@ -43,6 +51,29 @@ glance_opts = [
                 help='A list of url schemes that can be downloaded directly '
                      'via the direct_url.  Currently supported schemes: '
                      '[file].'),
+    cfg.IntOpt('glance_client_pool_size',
+               default=16,
+               help='Number of glance clients kept around so that their '
+                    'HTTP connections are reused. 0 => no reuse'),
+    cfg.IntOpt('glance_server_backoff',
+               default=60,
+               help='Number of seconds a glance API server that could not '
+                    'be reached is skipped for, as long as other servers '
+                    'are available'),
+    cfg.IntOpt('glance_show_cache_ttl',
+               default=10,
+               help='Number of seconds image metadata is cached for, so '
+                    'that volumes created from the same image at once '
+                    'don\'t each fetch it. 0 => no caching'),
+    cfg.IntOpt('glance_download_parallelism',
+               default=1,
+               help='Number of ranges of an image downloaded at the same '
+                    'time, when glance supports range requests. 1 => the '
+                    'image is downloaded in a single request'),
+    cfg.IntOpt('glance_download_part_size_mb',
+               default=256,
+               help='Size in MiB of the ranges of an image downloaded in '
+                    'parallel'),
 ]
 glance_core_properties = [
     cfg.ListOpt('glance_core_properties',
@@ -59,6 +90,12 @@ CONF.import_opt('glance_api_version', 'cinder.common.config')
 LOG = logging.getLogger(__name__)
 
 
+def _is_local_file(data):
+    """Check whether data is a regular file, which can be written anywhere."""
+    name = getattr(data, 'name', None)
+    return isinstance(name, six.string_types) and os.path.isfile(name)
+
+
 def _parse_image_ref(image_href):
     """Parse an image href into composite parts.
 
@@ -115,6 +152,60 @@ def get_api_servers():
     return itertools.cycle(api_servers)
 
 
+class _GlanceClientPool(object):
+    """Glance clients kept around to reuse their HTTP connections.
+
+    A client carries the auth token it was created with, so it is only
+    handed out again for the same server, API version and token.  The
+    least recently used clients are dropped once there are more than
+    glance_client_pool_size.
+    """
+
+    def __init__(self):
+        self._clients = collections.OrderedDict()
+
+    def get(self, context, netloc, use_ssl, version):
+        if not CONF.glance_client_pool_size:
+            return _create_glance_client(context, netloc, use_ssl, version)
+        key = (netloc, use_ssl, version, getattr(context, 'auth_token', None))
+        client = self._clients.pop(key, None)
+        if client is None:
+            client = _create_glance_client(context, netloc, use_ssl, version)
+        self._clients[key] = client
+        while len(self._clients) > CONF.glance_client_pool_size:
+            self._clients.popitem(last=False)
+        return client
+
+    def discard(self, netloc, use_ssl):
+        """Drop the clients of a server, along with their connections."""
+        for key in [key for key in self._clients
+                    if key[:2] == (netloc, use_ssl)]:
+            del self._clients[key]
+
+
+_CLIENT_POOL = _GlanceClientPool()
+
+# Time until which each api server that failed is skipped
+_FAILED_SERVERS = {}
+
+# Recently shown image metadata, by image id and what the context can see
+_SHOW_CACHE = {}
+
+
+def _cache_image_meta(key, image_meta):
+    now = time.time()
+    for cached_key, (expires, _meta) in list(_SHOW_CACHE.items()):
+        if expires <= now:
+            del _SHOW_CACHE[cached_key]
+    _SHOW_CACHE[key] = (now + CONF.glance_show_cache_ttl,
+                        copy.deepcopy(image_meta))
+
+
+def _uncache_image_meta(image_id):
+    for key in [key for key in _SHOW_CACHE if key[0] == image_id]:
+        del _SHOW_CACHE[key]
+
+
 class GlanceClientWrapper(object):
     """Glance client wrapper class that implements retries."""
 
@@ -145,14 +236,23 @@ class GlanceClientWrapper(object):
                                      self.netloc,
                                      self.use_ssl, self.version)
 
-    def _create_onetime_client(self, context, version):
-        """Create a client that will be used for one call."""
+    def _next_api_server(self):
+        """Return the next api server that hasn't failed lately."""
         if self.api_servers is None:
             self.api_servers = get_api_servers()
-        self.netloc, self.use_ssl = self.api_servers.next()
-        return _create_glance_client(context,
-                                     self.netloc,
-                                     self.use_ssl, version)
+        now = time.time()
+        server = None
+        for _i in range(len(CONF.glance_api_servers)):
+            server = next(self.api_servers)
+            if _FAILED_SERVERS.get(server, 0) <= now:
+                return server
+        # Every server failed lately, try them anyway
+        return server or next(self.api_servers)
+
+    def _create_onetime_client(self, context, version):
+        """Get a client of the next api server for one call."""
+        self.netloc, self.use_ssl = self._next_api_server()
+        return _CLIENT_POOL.get(context, self.netloc, self.use_ssl, version)
 
     def call(self, context, method, *args, **kwargs):
         """Call a glance client method.
@@ -164,6 +264,27 @@ class GlanceClientWrapper(object):
         if version in kwargs:
             version = kwargs['version']
 
+        def _call_method(client):
+            return getattr(client.images, method)(*args, **kwargs)
+
+        return self._call(context, version, method, _call_method)
+
+    def get_range(self, context, url, start, end):
+        """Get bytes start to end of url from a glance server.
+
+        Returns the response and an iterator over its body.  Servers that
+        don't support range requests answer with a 200 and the whole
+        content rather than with a 206.
+        """
+        headers = {'Range': 'bytes=%d-%d' % (start, end)}
+
+        def _get_range(client):
+            return client.http_client.get(url, headers=headers)
+
+        return self._call(context, self.version, 'get_range', _get_range)
+
+    def _call(self, context, version, method, func):
+        """Call func with a client, retrying on connection errors."""
         retry_excs = (glanceclient.exc.ServiceUnavailable,
                       glanceclient.exc.InvalidEndpoint,
                       glanceclient.exc.CommunicationError)
@@ -173,9 +294,13 @@ class GlanceClientWrapper(object):
             client = self.client or self._create_onetime_client(context,
                                                                 version)
             try:
-                return getattr(client.images, method)(*args, **kwargs)
+                result = func(client)
             except retry_excs as e:
                 netloc = self.netloc
+                if not self.client:
+                    _CLIENT_POOL.discard(netloc, self.use_ssl)
+                    _FAILED_SERVERS[(netloc, self.use_ssl)] = (
+                        time.time() + CONF.glance_server_backoff)
                 extra = "retrying"
                 error_msg = _LE("Error contacting glance server "
                                 "'%(netloc)s' for '%(method)s', "
@@ -191,6 +316,10 @@ class GlanceClientWrapper(object):
                                           'method': method,
                                           'extra': extra})
                 time.sleep(1)
+            else:
+                if not self.client:
+                    _FAILED_SERVERS.pop((self.netloc, self.use_ssl), None)
+                return result
 
 
 class GlanceImageService(object):
@@ -231,6 +360,13 @@ class GlanceImageService(object):
 
     def show(self, context, image_id):
         """Returns a dict with image data for the given opaque image id."""
+        key = (image_id, getattr(context, 'user_id', None),
+               getattr(context, 'project_id', None),
+               getattr(context, 'is_admin', False))
+        cached = _SHOW_CACHE.get(key)
+        if cached and cached[0] > time.time():
+            return copy.deepcopy(cached[1])
+
         try:
             image = self._client.call(context, 'get', image_id)
         except Exception:
@@ -240,6 +376,8 @@ class GlanceImageService(object):
             raise exception.ImageNotFound(image_id=image_id)
 
         base_image_meta = self._translate_from_glance(image)
+        if CONF.glance_show_cache_ttl:
+            _cache_image_meta(key, base_image_meta)
         return base_image_meta
 
     def get_location(self, context, image_id):
@@ -278,6 +416,17 @@ class GlanceImageService(object):
                     shutil.copyfileobj(f, data)
                 return
 
+        if CONF.glance_download_parallelism > 1 and _is_local_file(data):
+            image_meta = self.show(context, image_id)
+            part_size = CONF.glance_download_part_size_mb * units.Mi
+            if (image_meta.get('size') or 0) > part_size:
+                try:
+                    self._download_in_parts(context, image_id, image_meta,
+                                            data, part_size)
+                except Exception:
+                    _reraise_translated_image_exception(image_id)
+                return
+
         try:
             image_chunks = self._client.call(context, 'data', image_id)
         except Exception:
@@ -289,6 +438,116 @@ class GlanceImageService(object):
             for chunk in image_chunks:
                 data.write(chunk)
 
+    def _download_in_parts(self, context, image_id, image_meta, data,
+                           part_size):
+        """Download an image in ranges fetched concurrently.
+
+        Each range is written at its offset of data, a file opened for
+        writing.  The ranges are read back in order as they complete to
+        check the checksum of the image.  When the first range request
+        gets the whole image instead, that is written out and checked as
+        it comes.
+        """
+        size = image_meta['size']
+        version = self._client.version or CONF.glance_api_version
+        if version == 1:
+            url = '/v1/images/%s' % image_id
+        else:
+            url = '/v2/images/%s/file' % image_id
+
+        ranges = [(start, min(start + part_size, size) - 1)
+                  for start in range(0, size, part_size)]
+        md5 = hashlib.md5()
+        resp, body = self._client.get_range(context, url, *ranges[0])
+        if getattr(resp, 'status_code', getattr(resp, 'status', None)) != 206:
+            LOG.debug("Glance doesn't support range requests for image "
+                      "%s, downloading it in one go.", image_id)
+            for chunk in body:
+                md5.update(chunk)
+                data.write(chunk)
+            self._check_checksum(image_id, image_meta, md5.hexdigest())
+            return
+
+        # Ranges written but not hashed yet, by start
+        written = {}
+        hashed = [0]
+        hash_lock = semaphore.Semaphore()
+
+        def _hash_range(offset, end):
+            with open(data.name, 'rb') as f:
+                f.seek(offset)
+                while offset < end:
+                    chunk = f.read(min(units.Mi, end - offset))
+                    if not chunk:
+                        raise exception.ImageUnacceptable(
+                            image_id=image_id,
+                            reason=_("The downloaded data ends at %(got)d "
+                                     "bytes instead of %(end)d.") %
+                            {'got': offset, 'end': end})
+                    md5.update(chunk)
+                    offset += len(chunk)
+
+        def _hash_written():
+            with hash_lock:
+                # Only the ranges taken here have been flushed; ranges
+                # written while they are hashed wait for the next call
+                end = hashed[0]
+                while end in written:
+                    end = written.pop(end)
+                if end == hashed[0]:
+                    return
+                data.flush()
+                # Reading the ranges back blocks, keep it off the hub
+                tpool.execute(_hash_range, hashed[0], end)
+                hashed[0] = end
+
+        def _fetch_range(start, end, body=None):
+            if body is None:
+                resp, body = self._client.get_range(context, url, start,
+                                                    end)
+            offset = start
+            for chunk in body:
+                # NOTE: file writes don't yield, so no other greenthread
+                # moves the file position between the seek and the write
+                data.seek(offset)
+                data.write(chunk)
+                offset += len(chunk)
+            if offset != end + 1:
+                raise exception.ImageUnacceptable(
+                    image_id=image_id,
+                    reason=_("Got %(got)d bytes for range %(start)d-%(end)d "
+                             "of the image.") % {'got': offset - start,
+                                                 'start': start,
+                                                 'end': end})
+            written[start] = offset
+            _hash_written()
+
+        pool = eventlet.GreenPool(CONF.glance_download_parallelism)
+        fetches = [pool.spawn(_fetch_range, ranges[0][0], ranges[0][1],
+                              body)]
+        for start, end in ranges[1:]:
+            fetches.append(pool.spawn(_fetch_range, start, end))
+        errors = []
+        for fetch in fetches:
+            try:
+                fetch.wait()
+            except Exception as e:
+                errors.append(e)
+        if errors:
+            raise errors[0]
+        data.seek(size)
+        self._check_checksum(image_id, image_meta, md5.hexdigest())
+
+    @staticmethod
+    def _check_checksum(image_id, image_meta, actual):
+        checksum = image_meta.get('checksum')
+        if checksum and checksum != actual:
+            raise exception.ImageUnacceptable(
+                image_id=image_id,
+                reason=_("Checksum of the downloaded data %(actual)s doesn't "
+                         "match %(expected)s.") % {'actual': actual,
+                                                   'expected': checksum})
+
     def create(self, context, image_meta, data=None):
         """Store the image data and return the new image object."""
         sent_service_image_meta = self._translate_to_glance(image_meta)
@@ -304,6 +563,7 @@ class GlanceImageService(object):
     def update(self, context, image_id,
                image_meta, data=None, purge_props=True):
         """Modify the given image with the new data."""
+        _uncache_image_meta(image_id)
         image_meta = self._translate_to_glance(image_meta)
         # NOTE(dosaboy): see comment in bug 1210467
         if CONF.glance_api_version == 1:
@@ -333,6 +593,7 @@ class GlanceImageService(object):
         :raises: NotAuthorized if the user is not an owner.
 
         """
+        _uncache_image_meta(image_id)
         try:
             self._client.call(context, 'delete', image_id)
         except glanceclient.exc.NotFound:
@@ -0,0 +1,171 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Local cache of images converted for volumes.
+
+Entries are files named after the image id, image checksum and volume
+format, so a changed image never matches an old entry.  Entries are
+evicted least recently used first once the cache grows past its size
+limit.  Filling an entry holds a lock on it, so concurrent creates from
+the same image on this host download it only once.
+
+Entries are filled under a name of their own and published with a
+rename, and an entry is handed out as a hard link of its own, which
+keeps the data around for as long as it is being copied even when the
+entry gets evicted in the meantime.  Volume services on other hosts
+sharing the cache directory may fill an entry twice, but never see a
+partial or vanishing one.
+"""
+
+import contextlib
+import errno
+import os
+import re
+import time
+import uuid
+
+from oslo_concurrency import lockutils
+from oslo_config import cfg
+from oslo_log import log as logging
+from oslo_utils import units
+
+from cinder.i18n import _LI, _LW
+from cinder.openstack.common import fileutils
+
+
+LOG = logging.getLogger(__name__)
+
+image_cache_opts = [
+    cfg.StrOpt('image_cache_dir',
+               default=None,
+               help='Directory where images converted for volumes are '
+                    'cached, so that volumes created from the same image '
+                    'don\'t download it again. Unset to disable the cache.'),
+    cfg.IntOpt('image_cache_max_size_gb',
+               default=10,
+               help='Size limit of the image cache in GB. 0 => unlimited'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(image_cache_opts)
+
+_PIN_PREFIX = 'pin-'
+_PART_SUFFIX = '.part'
+# Pins and partial entries left behind this long are from a crash
+_STALE_AGE = 24 * 60 * 60
+
+
+def get_cache():
+    """Return the configured image cache, or None when it is disabled."""
+    if not CONF.image_cache_dir:
+        return None
+    return ImageCache(CONF.image_cache_dir,
+                      CONF.image_cache_max_size_gb * units.Gi)
+
+
+class ImageCache(object):
+    """Size limited LRU cache of converted images in a directory."""
+
+    def __init__(self, path, max_size=0):
+        self.path = path
+        self.max_size = max_size
+        fileutils.ensure_tree(path)
+
+    def _entry_name(self, image_id, checksum, volume_format):
+        name = '%s-%s.%s' % (image_id, checksum, volume_format)
+        return re.sub(r'[^\w.-]', '_', name)
+
+    def _lock(self, name):
+        return lockutils.lock('image-cache-%s' % name,
+                              lock_file_prefix='cinder-', external=True)
+
+    def _entries(self):
+        """Return (mtime, size, path) of the cache entries."""
+        entries = []
+        now = time.time()
+        for name in os.listdir(self.path):
+            path = os.path.join(self.path, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                # Evicted meanwhile
+                continue
+            if name.startswith(_PIN_PREFIX) or name.endswith(_PART_SUFFIX):
+                if now - st.st_mtime > _STALE_AGE:
+                    fileutils.delete_if_exists(path)
+                continue
+            entries.append((st.st_mtime, st.st_blocks * 512, path))
+        return entries
+
+    def _evict(self, keep):
+        if not self.max_size:
+            return
+        with self._lock('evict'):
+            entries = sorted(self._entries())
+            total = sum(size for _mtime, size, _path in entries)
+            for _mtime, size, path in entries:
+                if total <= self.max_size:
+                    break
+                if path == keep:
+                    continue
+                LOG.info(_LI("Evicting %s from the image cache."), path)
+                fileutils.delete_if_exists(path)
+                total -= size
+            if total > self.max_size:
+                LOG.warning(_LW("Image cache %(path)s holds %(total)d bytes, "
+                                "more than its limit of %(max)d bytes."),
+                            {'path': self.path, 'total': total,
+                             'max': self.max_size})
+
+    @contextlib.contextmanager
+    def get(self, image_id, checksum, volume_format, fill):
+        """Yield the path of a cached copy of an image.
+
+        On a miss, fill is called with the path to write the converted
+        image to.  The yielded path stays valid until the context exits.
+        """
+        name = self._entry_name(image_id, checksum, volume_format)
+        entry = os.path.join(self.path, name)
+        pin = os.path.join(self.path, '%s%s' % (_PIN_PREFIX, uuid.uuid4()))
+        added = False
+        with self._lock(name):
+            try:
+                # Linked before use, as it may be evicted any time
+                os.link(entry, pin)
+            except OSError as e:
+                if e.errno != errno.ENOENT:
+                    raise
+            else:
+                LOG.debug("Image %(image_id)s found in the image cache as "
+                          "%(entry)s.", {'image_id': image_id,
+                                         'entry': entry})
+                os.utime(pin, None)
+            if not os.path.exists(pin):
+                part = '%s.%s%s' % (entry, uuid.uuid4(), _PART_SUFFIX)
+                with fileutils.remove_path_on_error(pin):
+                    with fileutils.remove_path_on_error(part):
+                        # Created here so the entry belongs to this service
+                        # even when filling it runs commands as root
+                        open(part, 'wb').close()
+                        fill(part)
+                        os.link(part, pin)
+                        os.rename(part, entry)
+                added = True
+                LOG.info(_LI("Added image %(image_id)s to the image cache "
+                             "as %(entry)s."), {'image_id': image_id,
+                                                'entry': entry})
+        if added:
+            self._evict(keep=entry)
+        try:
+            yield pin
+        finally:
+            fileutils.delete_if_exists(pin)
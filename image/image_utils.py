@@ -25,22 +25,30 @@ we should look at maybe pushing this up to Oslo
 
 
 import contextlib
+import hashlib
 import math
 import os
 import re
 import tempfile
+import time
 
+import eventlet
+from eventlet import tpool
 from oslo_concurrency import processutils
 from oslo_config import cfg
 from oslo_log import log as logging
+from oslo_utils import excutils
+from oslo_utils import strutils
 from oslo_utils import timeutils
 from oslo_utils import units
 
 from cinder import exception
 from cinder.i18n import _, _LI, _LW
+from cinder.image import image_cache
 from cinder.openstack.common import fileutils
 from cinder.openstack.common import imageutils
 from cinder import utils
+from cinder.volume import copy_engine
 from cinder.volume import throttling
 from cinder.volume import utils as volume_utils
 
@@ -49,7 +57,16 @@ LOG = logging.getLogger(__name__)
 image_helper_opt = [cfg.StrOpt('image_conversion_dir',
                                default='$state_path/conversion',
                                help='Directory used for temporary storage '
-                                    'during image conversion'), ]
+                                    'during image conversion'),
+                    cfg.BoolOpt('image_stream_to_volume',
+                                default=True,
+                                help='Write raw images straight to raw '
+                                     'volumes while they are downloaded, '
+                                     'instead of downloading them to '
+                                     'image_conversion_dir first'), ]
+
+# Amount of image data checked with qemu-img before streaming an image
+IMAGE_PROBE_SIZE = units.Mi
 
 CONF = cfg.CONF
 CONF.register_opts(image_helper_opt)
@@ -226,13 +243,263 @@ def fetch_to_raw(context, image_service,
                            run_as_root=run_as_root)
 
 
+class _ImageProbeFailed(Exception):
+    """The image data is not what it was claimed to be."""
+
+
+class _VolumeImageWriter(object):
+    """File-like object writing image data straight to a volume.
+
+    Chunks are gathered in an aligned buffer and written out a buffer at
+    a time in a native thread, with O_DIRECT for a block device.  Before
+    anything gets written, probe is called with the first IMAGE_PROBE_SIZE
+    bytes of the image.  The MD5 of everything written is kept for
+    checking the image checksum.  bps_limit, if given, caps the bytes
+    written per second.
+    """
+
+    def __init__(self, dest, blocksize, probe=None, bps_limit=0):
+        self.dest = dest
+        self.size = 0
+        self._probe = probe
+        self._bps_limit = bps_limit
+        self._started = None
+        self._written = 0
+        self._md5 = hashlib.md5()
+        self._buf = copy_engine.aligned_buffer(max(blocksize,
+                                                   IMAGE_PROBE_SIZE))
+        self._fill = 0
+        self._fd = None
+        self._direct = False
+
+    @property
+    def checksum(self):
+        return self._md5.hexdigest()
+
+    def _open(self):
+        if utils.is_blk_device(self.dest):
+            try:
+                self._fd = os.open(self.dest,
+                                   os.O_WRONLY | getattr(os, 'O_DIRECT', 0))
+                self._direct = True
+                return
+            except OSError:
+                pass
+        self._fd = os.open(self.dest, os.O_WRONLY | os.O_CREAT | os.O_TRUNC,
+                           0o644)
+
+    def _flush(self):
+        if self._fd is None:
+            if self._probe:
+                self._probe(self._buf[:self._fill].tobytes())
+            self._open()
+            self._started = time.time()
+        size = self._fill
+        if self._direct and size % copy_engine.ALIGNMENT:
+            # O_DIRECT writes whole sectors, pad the end of the image
+            padded = -(-size // copy_engine.ALIGNMENT) * copy_engine.ALIGNMENT
+            self._buf[size:padded] = b'\0' * (padded - size)
+            size = padded
+        tpool.execute(self._write, size)
+        self._fill = 0
+        self._limit_rate(size)
+
+    def _limit_rate(self, size):
+        """Hold the download back to keep within bps_limit."""
+        if not self._bps_limit:
+            return
+        self._written += size
+        delay = (self._started + float(self._written) / self._bps_limit -
+                 time.time())
+        if delay > 0:
+            eventlet.sleep(delay)
+
+    def _write(self, size):
+        written = 0
+        while written < size:
+            written += os.write(self._fd, self._buf[written:size])
+
+    def write(self, data):
+        self._md5.update(data)
+        self.size += len(data)
+        view = memoryview(data)
+        while len(view):
+            count = min(len(view), len(self._buf) - self._fill)
+            self._buf[self._fill:self._fill + count] = view[:count]
+            self._fill += count
+            view = view[count:]
+            if self._fill == len(self._buf):
+                self._flush()
+
+    def abort(self):
+        """Give up on the image, leaving what was written so far."""
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def close(self):
+        """Write out what is left and make sure it is on disk."""
+        if self._fill or self._fd is None:
+            self._flush()
+        try:
+            if not self._direct:
+                tpool.execute(os.fsync, self._fd)
+        finally:
+            os.close(self._fd)
+
+
+def _probe_raw_image(image_id, run_as_root=True):
+    """Return a probe checking that image data really is a raw image."""
+    def probe(header):
+        with temporary_file() as tmp:
+            with open(tmp, 'wb') as f:
+                f.write(header)
+            try:
+                data = qemu_img_info(tmp, run_as_root=run_as_root)
+            except processutils.ProcessExecutionError as e:
+                # Leave it to the full fetch to check the image, or to
+                # find qemu-img missing
+                raise _ImageProbeFailed(
+                    _("Image %(image_id)s could not be probed: %(err)s") %
+                    {'image_id': image_id, 'err': e})
+        if data.file_format != 'raw' or data.backing_file is not None:
+            raise _ImageProbeFailed(
+                _("Image %(image_id)s is not a raw image, qemu-img found "
+                  "%(fmt)s.") % {'image_id': image_id,
+                                 'fmt': data.file_format})
+    return probe
+
+
+def _can_stream_to_volume(image_meta, dest, volume_format, run_as_root):
+    if not CONF.image_stream_to_volume or volume_format != 'raw':
+        return False
+    # A throttle that is not a bandwidth limit only applies to the
+    # sub-commands of the temporary file path
+    if throttling.Throttle.get_default().get_bps_limit() is None:
+        return False
+    if not image_meta or image_meta.get('disk_format') != 'raw' or \
+            image_meta.get('container_format') not in (None, 'bare'):
+        return False
+    if os.access(dest, os.W_OK) or run_as_root:
+        return True
+    return (not os.path.exists(dest) and
+            os.access(os.path.dirname(os.path.abspath(dest)), os.W_OK))
+
+
+def _stream_to_volume(context, image_service, image_id, image_meta, dest,
+                      blocksize, size=None, run_as_root=True):
+    """Write a raw image to a volume while it is downloaded.
+
+    Raises _ImageProbeFailed, before writing anything, when the image
+    isn't a raw image after all.
+    """
+    image_size = image_meta.get('size')
+    if size is not None and image_size and image_size > size * units.Gi:
+        params = {'image_size': image_size / units.Gi, 'volume_size': size}
+        reason = _("Size is %(image_size)dGB and doesn't fit in a "
+                   "volume of size %(volume_size)dGB.") % params
+        raise exception.ImageUnacceptable(image_id=image_id, reason=reason)
+
+    try:
+        bs = strutils.string_to_bytes('%sB' % blocksize)
+    except (ValueError, TypeError):
+        bs = units.Mi
+    writer = _VolumeImageWriter(
+        dest, bs, probe=_probe_raw_image(image_id, run_as_root),
+        bps_limit=throttling.Throttle.get_default().get_bps_limit())
+
+    def _download():
+        try:
+            image_service.download(context, image_id, writer)
+        except Exception:
+            with excutils.save_and_reraise_exception():
+                writer.abort()
+        writer.close()
+
+    start_time = timeutils.utcnow()
+    if os.path.exists(dest) and not os.access(dest, os.W_OK):
+        with utils.temporary_chown(dest):
+            _download()
+    else:
+        _download()
+    duration = max(timeutils.delta_seconds(start_time, timeutils.utcnow()),
+                   1)
+
+    checksum = image_meta.get('checksum')
+    if checksum and checksum != writer.checksum:
+        raise exception.ImageUnacceptable(
+            image_id=image_id,
+            reason=_("Checksum of the downloaded data %(actual)s doesn't "
+                     "match %(expected)s.") % {'actual': writer.checksum,
+                                               'expected': checksum})
+
+    size_mb = writer.size / units.Mi
+    LOG.info(_LI("Image download %(sz).2f MB at %(mbps).2f MB/s straight "
+                 "to %(dest)s"),
+             {'sz': size_mb, 'mbps': size_mb / duration, 'dest': dest})
+
+
 def fetch_to_volume_format(context, image_service,
                            image_id, dest, volume_format, blocksize,
                            user_id=None, project_id=None, size=None,
                            run_as_root=True):
-    qemu_img = True
     image_meta = image_service.show(context, image_id)
 
+    cache = image_cache.get_cache()
+    if cache and image_meta and image_meta.get('checksum') and \
+            not is_xenserver_format(image_meta):
+        def fill(path):
+            _fetch_to_volume_format(context, image_service, image_id,
+                                    image_meta, path, volume_format,
+                                    blocksize, user_id, project_id,
+                                    run_as_root=False)
+
+        with cache.get(image_id, image_meta['checksum'], volume_format,
+                       fill) as cached:
+            _copy_cached_image(image_id, cached, dest, blocksize, size=size)
+        return
+
+    if _can_stream_to_volume(image_meta, dest, volume_format, run_as_root):
+        try:
+            _stream_to_volume(context, image_service, image_id, image_meta,
+                              dest, blocksize, size=size,
+                              run_as_root=run_as_root)
+            return
+        except _ImageProbeFailed as e:
+            LOG.warning(_LW("Not streaming image to volume: %s"), e)
+
+    _fetch_to_volume_format(context, image_service, image_id, image_meta,
+                            dest, volume_format, blocksize, user_id,
+                            project_id, size=size, run_as_root=run_as_root)
+
+
+def _copy_cached_image(image_id, cached, dest, blocksize, size=None):
+    """Copy an image from the image cache to a volume."""
+    if size is not None:
+        try:
+            data = qemu_img_info(cached, run_as_root=False)
+        except processutils.ProcessExecutionError:
+            # Only raw images get cached without qemu-img
+            virt_size = os.path.getsize(cached) / units.Gi
+        else:
+            virt_size = data.virtual_size / units.Gi
+        if virt_size > size:
+            params = {'image_size': virt_size, 'volume_size': size}
+            reason = _("Size is %(image_size)dGB and doesn't fit in a "
+                       "volume of size %(volume_size)dGB.") % params
+            raise exception.ImageUnacceptable(image_id=image_id, reason=reason)
+
+    LOG.debug("Copying cached image %(image_id)s to %(dest)s.",
+              {'image_id': image_id, 'dest': dest})
+    image_size_m = math.ceil(os.path.getsize(cached) / float(units.Mi))
+    volume_utils.copy_volume(cached, dest, image_size_m, blocksize)
+
+
+def _fetch_to_volume_format(context, image_service, image_id, image_meta,
+                            dest, volume_format, blocksize, user_id,
+                            project_id, size=None, run_as_root=True):
+    qemu_img = True
+
     # NOTE(avishay): I'm not crazy about creating temp files which may be
     # large and cause disk full errors which would confuse users.
     # Unfortunately it seems that you can't pipe to 'qemu-img convert' because
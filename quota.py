@@ -18,6 +18,7 @@
 
 
 import datetime
+import time
 
 from oslo_config import cfg
 from oslo_log import log as logging
@@ -69,7 +70,19 @@ quota_opts = [
     cfg.BoolOpt('use_default_quota_class',
                 default=True,
                 help='Enables or disables use of default quota class '
-                     'with default quota.'), ]
+                     'with default quota.'),
+    cfg.IntOpt('quota_resources_cache_ttl',
+               default=60,
+               help='Number of seconds the per volume type quota resources '
+                    'are cached for. Volume type changes made through this '
+                    'node refresh the cache right away; the expiry picks up '
+                    'changes made through other nodes. Set to 0 to disable '
+                    'the cache.'),
+    cfg.BoolOpt('quota_usage_async_refresh',
+                default=False,
+                help='Run the usage refreshes triggered by until_refresh '
+                     'and max_age in the background instead of while the '
+                     'reservation holds the usage locks.'), ]
 
 CONF = cfg.CONF
 CONF.register_opts(quota_opts)
@@ -368,7 +381,8 @@ class DbQuotaDriver(object):
         #            have to do the work there.
         return db.quota_reserve(context, resources, quotas, deltas, expire,
                                 CONF.until_refresh, CONF.max_age,
-                                project_id=project_id)
+                                project_id=project_id,
+                                async_refresh=CONF.quota_usage_async_refresh)
 
     def commit(self, context, reservations, project_id=None):
         """Commit reservations.
@@ -864,10 +878,36 @@ class QuotaEngine(object):
 class VolumeTypeQuotaEngine(QuotaEngine):
     """Represent the set of all quotas."""
 
+    def __init__(self, quota_driver_class=None):
+        super(VolumeTypeQuotaEngine, self).__init__(quota_driver_class)
+        self._cached_resources = None
+        self._cached_at = 0
+        # Bumped on every invalidation so that a rebuild which raced with
+        # one is not cached.
+        self._resources_generation = 0
+
     @property
     def resources(self):
         """Fetches all possible quota resources."""
 
+        ttl = CONF.quota_resources_cache_ttl
+        if (self._cached_resources is not None and
+                time.time() - self._cached_at < ttl):
+            return self._cached_resources
+
+        generation = self._resources_generation
+        result = self._load_resources()
+        if ttl > 0 and generation == self._resources_generation:
+            self._cached_resources = result
+            self._cached_at = time.time()
+        return result
+
+    def invalidate_resources(self):
+        """Drop the cached resources, e.g. after a volume type change."""
+        self._resources_generation += 1
+        self._cached_resources = None
+
+    def _load_resources(self):
         result = {}
         # Global quotas.
         argses = [('volumes', '_sync_volumes', 'quota_volumes'),
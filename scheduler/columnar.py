@@ -0,0 +1,113 @@
+# Copyright (c) 2015 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Columnar view of pool states for vectorized filtering and weighing.
+
+When NumPy is available and enough pools are being scheduled, filters and
+weighers that support it score all pools in one pass over arrays instead of
+one Python call per pool.  The results match the per-pool implementations.
+"""
+
+from oslo_config import cfg
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+columnar_opts = [
+    cfg.IntOpt('scheduler_vectorize_min_pools',
+               default=0,
+               help='Minimum number of pools for which the capacity filter '
+                    'and the capacity and volume number weighers score all '
+                    'pools in a single vectorized pass. Requires NumPy. '
+                    'Set to 0 to disable.'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(columnar_opts)
+
+UNBOUNDED_CAPACITY = ('infinite', 'unknown')
+
+
+def enabled(count):
+    """Return True if ``count`` pools should take the vectorized path."""
+    min_pools = CONF.scheduler_vectorize_min_pools
+    return numpy is not None and 0 < min_pools <= count
+
+
+class PoolColumns(object):
+    """Capacity attributes of a list of pool states as NumPy arrays.
+
+    Rows are in the same order as the ``host_states`` passed in.  Capacities
+    reported as 'infinite' or 'unknown' are flagged in the ``*_unbounded``
+    masks and stored as 0; a free capacity that was never reported is
+    flagged in ``free_unset``.
+    """
+
+    def __init__(self, host_states):
+        self.host_states = host_states
+
+        hosts = []
+        free = []
+        total = []
+        free_unset = []
+        free_unbounded = []
+        total_unbounded = []
+        reserved = []
+        provisioned = []
+        ratio = []
+        thin = []
+        for state in host_states:
+            free_space = state.free_capacity_gb
+            total_space = state.total_capacity_gb
+            hosts.append(state.host)
+            free_unset.append(free_space is None)
+            if free_space is None or free_space in UNBOUNDED_CAPACITY:
+                free_unbounded.append(free_space is not None)
+                free.append(0.0)
+            else:
+                free_unbounded.append(False)
+                free.append(free_space)
+            if total_space in UNBOUNDED_CAPACITY:
+                total_unbounded.append(True)
+                total.append(0.0)
+            else:
+                total_unbounded.append(False)
+                total.append(float(total_space))
+            reserved.append(float(state.reserved_percentage) / 100)
+            provisioned.append(state.provisioned_capacity_gb)
+            ratio.append(state.max_over_subscription_ratio)
+            thin.append(bool(state.thin_provisioning_support))
+
+        self.hosts = hosts
+        self.free = numpy.array(free, dtype=numpy.float64)
+        self.total = numpy.array(total, dtype=numpy.float64)
+        self.free_unset = numpy.array(free_unset, dtype=bool)
+        self.free_unbounded = numpy.array(free_unbounded, dtype=bool)
+        self.total_unbounded = numpy.array(total_unbounded, dtype=bool)
+        self.reserved = numpy.array(reserved, dtype=numpy.float64)
+        self.provisioned = numpy.array(provisioned, dtype=numpy.float64)
+        self.ratio = numpy.array(ratio, dtype=numpy.float64)
+        self.thin = numpy.array(thin, dtype=bool)
+
+    def __len__(self):
+        return len(self.host_states)
+
+    def reserved_free(self):
+        """Free capacity left after taking the reserved space into account."""
+        return self.free - numpy.floor(self.total * self.reserved)
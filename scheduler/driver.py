@@ -19,11 +19,14 @@
 Scheduler base class that all Schedulers should inherit from
 """
 
+import copy
+
 from oslo_config import cfg
 from oslo_utils import importutils
 from oslo_utils import timeutils
 
 from cinder import db
+from cinder import exception
 from cinder.i18n import _
 from cinder.volume import rpcapi as volume_rpcapi
 
@@ -84,6 +87,10 @@ class Scheduler(object):
                                                       host,
                                                       capabilities)
 
+    def sweep_service_states(self, context):
+        """Check volume service liveness and refresh cached host states."""
+        self.host_manager.sweep_service_states(context)
+
     def host_passes_filters(self, context, volume_id, host, filter_properties):
         """Check if the specified host passes the filters."""
         raise NotImplementedError(_("Must implement host_passes_filters"))
@@ -101,6 +108,23 @@ class Scheduler(object):
         """Must override schedule method for scheduler to work."""
         raise NotImplementedError(_("Must implement schedule_create_volume"))
 
+    def schedule_create_volumes(self, context, request_spec,
+                                filter_properties, volume_ids):
+        """Place several identical volumes.
+
+        Returns the IDs of the volumes no host could be found for.
+        Schedulers that can place a batch in one pass override this.
+        """
+        unplaced = []
+        for volume_id in volume_ids:
+            volume_request_spec = dict(request_spec, volume_id=volume_id)
+            try:
+                self.schedule_create_volume(context, volume_request_spec,
+                                            copy.deepcopy(filter_properties))
+            except exception.NoValidHost:
+                unplaced.append(volume_id)
+        return unplaced
+
     def schedule_create_consistencygroup(self, context, group_id,
                                          request_spec_list,
                                          filter_properties_list):
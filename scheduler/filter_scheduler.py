@@ -106,6 +106,70 @@ class FilterScheduler(driver.Scheduler):
                                          snapshot_id=snapshot_id,
                                          image_id=image_id)
 
+    def schedule_create_volumes(self, context, request_spec,
+                                filter_properties, volume_ids):
+        """Place several identical volumes with a single filter pass.
+
+        Capacity is consumed virtually on the chosen host after each
+        placement, and only that host is filtered and weighed again.  The
+        create casts go out once every volume has been placed.
+
+        Returns the IDs of the volumes no host could be found for.
+        """
+        weighed_hosts = self._get_weighted_candidates(context, request_spec,
+                                                      filter_properties)
+        if not weighed_hosts:
+            LOG.warning(_LW('No weighed hosts found for volume '
+                            'with properties: %s'),
+                        filter_properties['request_spec']['volume_type'])
+            return list(volume_ids)
+
+        placements = []
+        unplaced = []
+        for volume_id in volume_ids:
+            if not weighed_hosts:
+                unplaced.append(volume_id)
+                continue
+            top_host = self._choose_top_host(weighed_hosts, request_spec)
+            host_state = top_host.obj
+            placements.append((volume_id, host_state))
+
+            # Only the chosen host's state changed; re-check it and move it
+            # to its new place in the ordering.
+            weighed_hosts.pop(0)
+            if self.host_manager.get_filtered_hosts([host_state],
+                                                    filter_properties):
+                reweighed = self.host_manager.get_weighed_hosts(
+                    [host_state], filter_properties)[0]
+                index = 0
+                while (index < len(weighed_hosts) and
+                       weighed_hosts[index].weight >= reweighed.weight):
+                    index += 1
+                weighed_hosts.insert(index, reweighed)
+
+        snapshot_id = request_spec['snapshot_id']
+        image_id = request_spec['image_id']
+        # context is not serializable
+        filter_properties.pop('context', None)
+        for volume_id, host_state in placements:
+            volume_request_spec = dict(request_spec, volume_id=volume_id)
+            volume_filter_properties = dict(filter_properties)
+            retry = filter_properties.get('retry')
+            if retry:
+                volume_filter_properties['retry'] = dict(
+                    retry, hosts=list(retry['hosts']))
+            host = host_state.host
+            updated_volume = driver.volume_update_db(context, volume_id, host)
+            self._post_select_populate_filter_properties(
+                volume_filter_properties, host_state)
+            self.volume_rpcapi.create_volume(context, updated_volume, host,
+                                             volume_request_spec,
+                                             volume_filter_properties,
+                                             allow_reschedule=True,
+                                             snapshot_id=snapshot_id,
+                                             image_id=image_id)
+        return unplaced
+
     def host_passes_filters(self, context, host, request_spec,
                             filter_properties):
         """Check if the specified host passes the filters."""
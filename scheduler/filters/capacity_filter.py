@@ -23,6 +23,7 @@ from oslo_log import log as logging
 
 from cinder.i18n import _LE, _LW
 from cinder.openstack.common.scheduler import filters
+from cinder.scheduler import columnar
 
 
 LOG = logging.getLogger(__name__)
@@ -31,6 +32,56 @@ LOG = logging.getLogger(__name__)
 class CapacityFilter(filters.BaseHostFilter):
     """CapacityFilter filters based on volume host's capacity utilization."""
 
+    def filter_all(self, filter_obj_list, filter_properties):
+        host_states = list(filter_obj_list)
+        volume_size = filter_properties.get('size')
+        if volume_size is None or not columnar.enabled(len(host_states)):
+            return super(CapacityFilter, self).filter_all(host_states,
+                                                          filter_properties)
+
+        passes = self._hosts_pass(columnar.PoolColumns(host_states),
+                                  filter_properties)
+        return [state for state, ok in zip(host_states, passes) if ok]
+
+    def _hosts_pass(self, columns, filter_properties):
+        """Vectorized equivalent of host_passes over all pools at once."""
+        numpy = columnar.numpy
+        volume_size = filter_properties['size']
+
+        vol_exists_on = filter_properties.get('vol_exists_on')
+        exists = numpy.array([host == vol_exists_on
+                              for host in columns.hosts], dtype=bool)
+        if (columns.free_unset & ~exists).any():
+            # Fail Safe
+            LOG.error(_LE("Free capacity not set: "
+                          "volume node info collection broken."))
+
+        bounded = ~(columns.free_unset | columns.free_unbounded |
+                    columns.total_unbounded)
+        free = columns.reserved_free()
+        thin = columns.thin & (columns.ratio > 1)
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            provisioned_ratio = ((columns.provisioned + volume_size) /
+                                 columns.total)
+        thin_passes = (~(provisioned_ratio > columns.ratio) &
+                       (free * columns.ratio >= volume_size))
+        thick_passes = ~(free < volume_size)
+        passes = (bounded & (columns.total > 0) &
+                  numpy.where(thin, thin_passes, thick_passes))
+
+        # Back-ends that cannot report actual capacity are assumed to be
+        # able to serve the request, as in host_passes.
+        passes |= columns.free_unbounded
+        passes |= (~columns.free_unset & ~columns.free_unbounded &
+                   columns.total_unbounded & (columns.reserved == 0))
+        passes |= exists
+
+        LOG.debug("Capacity filter passed %(passed)d of %(total)d pools "
+                  "for a %(size)s GB volume.",
+                  {'passed': passes.sum(), 'total': len(columns),
+                   'size': volume_size})
+        return passes
+
     def host_passes(self, host_state, filter_properties):
         """Return True if host has sufficient capacity."""
 
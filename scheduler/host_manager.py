@@ -17,6 +17,7 @@
 Manage hosts in the current zone.
 """
 
+import time
 import UserDict
 
 from oslo_config import cfg
@@ -46,7 +47,13 @@ host_manager_opts = [
                 default=[
                     'CapacityWeigher'
                 ],
-                help='Which weigher class names to use for weighing hosts.')
+                help='Which weigher class names to use for weighing hosts.'),
+    cfg.IntOpt('scheduler_service_sweep_interval',
+               default=60,
+               help='Maximum number of seconds between checks of volume '
+                    'service liveness against the database. Capability '
+                    'reports update the cached host states in between. '
+                    'Set to 0 to check on every scheduling request.'),
 ]
 
 CONF = cfg.CONF
@@ -375,6 +382,16 @@ class HostManager(object):
             pass
 
         self._no_capabilities_hosts = set()  # Hosts having no capabilities
+        # Service records of the live hosts seen by the last liveness sweep
+        self._services = {}
+        # Bumped whenever host_state_map changes; the pool index is rebuilt
+        # lazily when it no longer matches.
+        self._version = 0
+        self._pools_version = None
+        self._pools = []
+        # Not recorded as a sweep: the first request always checks liveness
+        # against whatever capabilities have been reported by then.
+        self._last_sweep = None
         self._update_host_state_map(cinder_context.get_admin_context())
 
     def _choose_host_filters(self, filter_cls_names):
@@ -468,9 +485,37 @@ class HostManager(object):
 
         self._no_capabilities_hosts.discard(host)
 
+        host_state = self.host_state_map.get(host)
+        if host_state is None:
+            # A host the last sweep did not see as live; let the next
+            # request check its service record before scheduling to it.
+            self._last_sweep = None
+            return
+
+        host_state.update_from_volume_capability(capab_copy,
+                                                 service=self._services[host])
+        self._version += 1
+
     def has_all_capabilities(self):
         return len(self._no_capabilities_hosts) == 0
 
+    def _sweep_due(self):
+        if self._last_sweep is None:
+            return True
+        interval = CONF.scheduler_service_sweep_interval
+        if time.time() - self._last_sweep >= interval:
+            return True
+        # The heartbeat recorded by the last sweep is never newer than the
+        # one in the database, so a host that looks down here may have
+        # stopped reporting; check the database before scheduling to it.
+        return not all(utils.service_is_up(service)
+                       for service in self._services.itervalues())
+
+    def sweep_service_states(self, context):
+        """Check volume service liveness and refresh the host state map."""
+        self._update_host_state_map(context)
+        self._last_sweep = time.time()
+
     def _update_host_state_map(self, context):
 
         # Get resource usage across the available volume nodes:
@@ -480,6 +525,7 @@ class HostManager(object):
                                                       disabled=False)
         active_hosts = set()
         no_capabilities_hosts = set()
+        services = {}
         for service in volume_services:
             host = service['host']
             if not utils.service_is_up(service):
@@ -490,20 +536,22 @@ class HostManager(object):
                 no_capabilities_hosts.add(host)
                 continue
 
+            service = dict(service.iteritems())
+            services[host] = service
             host_state = self.host_state_map.get(host)
             if not host_state:
                 host_state = self.host_state_cls(host,
                                                  capabilities=capabilities,
-                                                 service=
-                                                 dict(service.iteritems()))
+                                                 service=service)
                 self.host_state_map[host] = host_state
             # update capabilities and attributes in host_state
             host_state.update_from_volume_capability(capabilities,
-                                                     service=
-                                                     dict(service.iteritems()))
+                                                     service=service)
             active_hosts.add(host)
 
         self._no_capabilities_hosts = no_capabilities_hosts
+        self._services = services
+        self._version += 1
 
         # remove non-active hosts from host_state_map
         nonactive_hosts = set(self.host_state_map.keys()) - active_hosts
@@ -520,25 +568,30 @@ class HostManager(object):
 
         For example:
           {'192.168.1.100': HostState(), ...}
-        """
 
-        self._update_host_state_map(context)
+        Service liveness is only checked against the database when a sweep
+        is due or when the heartbeat of a host seen by the last sweep has
+        gone stale; otherwise the host states kept current by capability
+        reports are used as they are.
+        """
+        if self._sweep_due():
+            self.sweep_service_states(context)
 
-        # build a pool_state map and return that map instead of host_state_map
-        all_pools = {}
-        for host, state in self.host_state_map.items():
-            for key in state.pools:
-                pool = state.pools[key]
-                # use host.pool_name to make sure key is unique
-                pool_key = '.'.join([host, pool.pool_name])
-                all_pools[pool_key] = pool
+        if self._pools_version != self._version:
+            # build a pool_state index and return that instead of
+            # host_state_map
+            all_pools = []
+            for state in self.host_state_map.itervalues():
+                all_pools.extend(state.pools.itervalues())
+            self._pools = all_pools
+            self._pools_version = self._version
 
-        return all_pools.itervalues()
+        return iter(self._pools)
 
     def get_pools(self, context):
         """Returns a dict of all pools on all hosts HostManager knows about."""
-
-        self._update_host_state_map(context)
+        if self._sweep_due():
+            self.sweep_service_states(context)
 
         all_pools = []
         for host, state in self.host_state_map.items():
@@ -32,6 +32,7 @@ from cinder import exception
 from cinder import flow_utils
 from cinder.i18n import _, _LE
 from cinder import manager
+from cinder.openstack.common import periodic_task
 from cinder.openstack.common import versionutils
 from cinder import quota
 from cinder import rpc
@@ -55,7 +56,7 @@ LOG = logging.getLogger(__name__)
 class SchedulerManager(manager.Manager):
     """Chooses a host to create volumes."""
 
-    RPC_API_VERSION = '1.7'
+    RPC_API_VERSION = '1.8'
 
     target = messaging.Target(version=RPC_API_VERSION)
 
@@ -94,6 +95,10 @@ class SchedulerManager(manager.Manager):
                                                 host,
                                                 capabilities)
 
+    @periodic_task.periodic_task
+    def _sweep_service_states(self, context):
+        self.driver.sweep_service_states(context)
+
     def _wait_for_scheduler(self):
         # NOTE(dulek): We're waiting for scheduler to announce that it's ready
         # or CONF.periodic_interval seconds from service startup has passed.
@@ -148,6 +153,39 @@ class SchedulerManager(manager.Manager):
         with flow_utils.DynamicLogListener(flow_engine, logger=LOG):
             flow_engine.run()
 
+    def create_volumes(self, context, topic, volume_ids, snapshot_id=None,
+                       image_id=None, request_spec=None,
+                       filter_properties=None):
+        """Place and create a batch of identical volumes."""
+
+        self._wait_for_scheduler()
+        if filter_properties is None:
+            filter_properties = {}
+
+        def _create_volumes_set_error(volume_ids, ex):
+            volume_state = {'volume_state': {'status': 'error'}}
+            for volume_id in volume_ids:
+                self._set_volume_state_and_notify(
+                    'create_volume', volume_state, context, ex,
+                    dict(request_spec, volume_id=volume_id))
+
+        try:
+            unplaced = self.driver.schedule_create_volumes(context,
+                                                           request_spec,
+                                                           filter_properties,
+                                                           volume_ids)
+        except Exception as ex:
+            with excutils.save_and_reraise_exception():
+                LOG.exception(_LE("Failed to schedule a batch of %d "
+                                  "volumes."), len(volume_ids))
+                # Volumes that were already sent to a host are left alone
+                _create_volumes_set_error(
+                    [volume_id for volume_id in volume_ids
+                     if not db.volume_get(context, volume_id)['host']], ex)
+        if unplaced:
+            ex = exception.NoValidHost(reason=_("No weighed hosts available"))
+            _create_volumes_set_error(unplaced, ex)
+
     def request_service_capabilities(self, context):
         volume_rpcapi.VolumeAPI().publish_service_capabilities(context)
 
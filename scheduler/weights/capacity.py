@@ -45,6 +45,7 @@ import math
 from oslo_config import cfg
 
 from cinder.openstack.common.scheduler import weights
+from cinder.scheduler import columnar
 
 
 capacity_weight_opts = [
@@ -67,6 +68,33 @@ class CapacityWeigher(weights.BaseHostWeigher):
         """Override the weight multiplier."""
         return CONF.capacity_weight_multiplier
 
+    def weigh_objects(self, weighed_obj_list, weight_properties):
+        if columnar.enabled(len(weighed_obj_list)):
+            columns = columnar.PoolColumns([obj.obj
+                                            for obj in weighed_obj_list])
+            # Unset free capacity is left to the per-pool path, which
+            # fails on it the same way as before.
+            if not columns.free_unset.any():
+                weights = self._weigh_columns(columns)
+                for obj, weight in zip(weighed_obj_list, weights):
+                    obj.weight += float(weight)
+                return
+        super(CapacityWeigher, self).weigh_objects(weighed_obj_list,
+                                                   weight_properties)
+
+    def _weigh_columns(self, columns):
+        """Vectorized equivalent of _weigh_object, multiplier applied."""
+        numpy = columnar.numpy
+        reserved_space = numpy.floor(columns.total * columns.reserved)
+        free = numpy.where(columns.thin,
+                           (columns.total * columns.ratio -
+                            columns.provisioned - reserved_space),
+                           columns.free - reserved_space)
+        unbounded = columns.free_unbounded | columns.total_unbounded
+        free[unbounded] = (-1 if CONF.capacity_weight_multiplier > 0
+                           else float('inf'))
+        return self._weight_multiplier() * free
+
     def _weigh_object(self, host_state, weight_properties):
         """Higher weights win.  We want spreading to be the default."""
         reserved = float(host_state.reserved_percentage) / 100
@@ -28,6 +28,7 @@ from oslo_log import log as logging
 
 from cinder import db
 from cinder.openstack.common.scheduler import weights
+from cinder.scheduler import columnar
 
 
 LOG = logging.getLogger(__name__)
@@ -49,6 +50,21 @@ class VolumeNumberWeigher(weights.BaseHostWeigher):
         """Override the weight multiplier."""
         return CONF.volume_number_multiplier
 
+    def weigh_objects(self, weighed_obj_list, weight_properties):
+        if not columnar.enabled(len(weighed_obj_list)):
+            return super(VolumeNumberWeigher, self).weigh_objects(
+                weighed_obj_list, weight_properties)
+
+        # Count the volumes of all pools in one query instead of one per pool
+        context = weight_properties['context']
+        hosts = [obj.obj.host for obj in weighed_obj_list]
+        counts = db.volume_count_get_by_hosts(context, set(hosts))
+        volume_numbers = columnar.numpy.array(
+            [counts.get(host, 0) for host in hosts], dtype=float)
+        weights = self._weight_multiplier() * volume_numbers
+        for obj, weight in zip(weighed_obj_list, weights):
+            obj.weight += float(weight)
+
     def _weigh_object(self, host_state, weight_properties):
         """Less volume number weights win.
         We want spreading to be the default.
@@ -24,6 +24,7 @@ inline callbacks.
 import logging
 import os
 import shutil
+import time
 import uuid
 
 import fixtures
@@ -38,12 +39,14 @@ from oslo_utils import strutils
 from oslo_utils import timeutils
 import stubout
 import testtools
+from testtools import content
 
 from cinder.common import config  # noqa Need to register global_opts
 from cinder.db import migration
 from cinder.db.sqlalchemy import api as sqla_api
 from cinder import i18n
 from cinder import objects
+from cinder import quota
 from cinder import rpc
 from cinder import service
 from cinder.tests import conf_fixture
@@ -193,6 +196,8 @@ class TestCase(testtools.TestCase):
                                  sqlite_db=CONF.database.sqlite_db,
                                  sqlite_clean_db=CONF.sqlite_clean_db)
         self.useFixture(_DB_CACHE)
+        # Quota resources cached by an earlier test come from its database
+        quota.QUOTAS.invalidate_resources()
 
         # emulate some of the mox stuff, we can't use the metaclass
         # because it screws with our generators
@@ -345,3 +350,32 @@ class TestCase(testtools.TestCase):
                                     'd1value': d1value,
                                     'd2value': d2value,
                                 })
+
+
+class BenchmarkTestCase(TestCase):
+    """Base class for benchmarks, which are not run by default.
+
+    A benchmark runs when the environment variable named by BENCHMARK_ENV
+    is set to a size, such as a number of items, which is then available
+    as self.benchmark_size.  Timings taken with timed() are attached to the
+    test result as the 'timings' detail.
+    """
+
+    BENCHMARK_ENV = None
+
+    def setUp(self):
+        super(BenchmarkTestCase, self).setUp()
+        self.benchmark_size = int(os.environ.get(self.BENCHMARK_ENV) or 0)
+        if not self.benchmark_size:
+            self.skipTest('%s is not set' % self.BENCHMARK_ENV)
+        self.timings = []
+        self.addDetail('timings', content.Content(
+            content.UTF8_TEXT,
+            lambda: ['\n'.join(self.timings).encode('utf-8')]))
+
+    def timed(self, name, func, *args, **kwargs):
+        """Call func, record how long it took and return its result."""
+        start = time.time()
+        result = func(*args, **kwargs)
+        self.timings.append('%s: %.2fs' % (name, time.time() - start))
+        return result
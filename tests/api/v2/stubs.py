@@ -125,7 +125,7 @@ def stub_volume_get_db(context, volume_id):
 
 def stub_volume_get_all(context, search_opts=None, marker=None, limit=None,
                         sort_keys=None, sort_dirs=None, filters=None,
-                        viewable_admin_meta=False):
+                        viewable_admin_meta=False, fields=None):
     return [stub_volume(100, project_id='fake'),
             stub_volume(101, project_id='superfake'),
             stub_volume(102, project_id='superduperfake')]
@@ -134,7 +134,8 @@ def stub_volume_get_all(context, search_opts=None, marker=None, limit=None,
 def stub_volume_get_all_by_project(self, context, marker, limit,
                                    sort_keys=None, sort_dirs=None,
                                    filters=None,
-                                   viewable_admin_meta=False):
+                                   viewable_admin_meta=False,
+                                   fields=None):
     filters = filters or {}
     return [stub_volume_get(self, context, '1')]
 
@@ -153,14 +154,28 @@ def stub_snapshot(id, **kwargs):
     return snapshot
 
 
-def stub_snapshot_get_all(self):
-    return [stub_snapshot(100, project_id='fake'),
-            stub_snapshot(101, project_id='superfake'),
-            stub_snapshot(102, project_id='superduperfake')]
+def stub_snapshot_paginate(snapshots, filters=None, marker=None, limit=None,
+                           sort_keys=None, sort_dirs=None, offset=None):
+    """Apply the filters, offset and limit the snapshot DB queries take."""
+    if filters:
+        snapshots = [snapshot for snapshot in snapshots
+                     if all(snapshot.get(key) == value
+                            for key, value in filters.items())]
+    offset = offset or 0
+    if limit is not None:
+        return snapshots[offset:offset + limit]
+    return snapshots[offset:]
 
 
-def stub_snapshot_get_all_by_project(self, context):
-    return [stub_snapshot(1)]
+def stub_snapshot_get_all(self, **kwargs):
+    return stub_snapshot_paginate(
+        [stub_snapshot(100, project_id='fake'),
+         stub_snapshot(101, project_id='superfake'),
+         stub_snapshot(102, project_id='superduperfake')], **kwargs)
+
+
+def stub_snapshot_get_all_by_project(self, context, **kwargs):
+    return stub_snapshot_paginate([stub_snapshot(1)], **kwargs)
 
 
 def stub_snapshot_update(self, context, *args, **param):
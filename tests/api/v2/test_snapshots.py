@@ -73,7 +73,7 @@ def stub_snapshot_get(self, context, snapshot_id):
     return param
 
 
-def stub_snapshot_get_all(self, context, search_opts=None):
+def stub_snapshot_get_all(self, context, search_opts=None, **kwargs):
     param = _get_default_snapshot_param()
     return [param]
 
@@ -304,15 +304,16 @@ class SnapshotApiTest(test.TestCase):
 
     @mock.patch('cinder.db.snapshot_metadata_get', return_value=dict())
     def test_snapshot_list_by_status(self, snapshot_metadata_get):
-        def stub_snapshot_get_all_by_project(context, project_id):
-            return [
+        def stub_snapshot_get_all_by_project(context, project_id,
+                                             **kwargs):
+            return stubs.stub_snapshot_paginate([
                 stubs.stub_snapshot(1, display_name='backup1',
                                     status='available'),
                 stubs.stub_snapshot(2, display_name='backup2',
                                     status='available'),
                 stubs.stub_snapshot(3, display_name='backup3',
                                     status='creating'),
-            ]
+            ], **kwargs)
         self.stubs.Set(db, 'snapshot_get_all_by_project',
                        stub_snapshot_get_all_by_project)
 
@@ -338,12 +339,13 @@ class SnapshotApiTest(test.TestCase):
 
     @mock.patch('cinder.db.snapshot_metadata_get', return_value={})
     def test_snapshot_list_by_volume(self, snapshot_metadata_get):
-        def stub_snapshot_get_all_by_project(context, project_id):
-            return [
+        def stub_snapshot_get_all_by_project(context, project_id,
+                                             **kwargs):
+            return stubs.stub_snapshot_paginate([
                 stubs.stub_snapshot(1, volume_id='vol1', status='creating'),
                 stubs.stub_snapshot(2, volume_id='vol1', status='available'),
                 stubs.stub_snapshot(3, volume_id='vol2', status='available'),
-            ]
+            ], **kwargs)
         self.stubs.Set(db, 'snapshot_get_all_by_project',
                        stub_snapshot_get_all_by_project)
 
@@ -368,12 +370,13 @@ class SnapshotApiTest(test.TestCase):
 
     @mock.patch('cinder.db.snapshot_metadata_get', return_value={})
     def test_snapshot_list_by_name(self, snapshot_metadata_get):
-        def stub_snapshot_get_all_by_project(context, project_id):
-            return [
+        def stub_snapshot_get_all_by_project(context, project_id,
+                                             **kwargs):
+            return stubs.stub_snapshot_paginate([
                 stubs.stub_snapshot(1, display_name='backup1'),
                 stubs.stub_snapshot(2, display_name='backup2'),
                 stubs.stub_snapshot(3, display_name='backup3'),
-            ]
+            ], **kwargs)
         self.stubs.Set(db, 'snapshot_get_all_by_project',
                        stub_snapshot_get_all_by_project)
 
@@ -403,12 +406,13 @@ class SnapshotApiTest(test.TestCase):
 
     def test_list_snapshots_with_limit_and_offset(self):
         def list_snapshots_with_limit_and_offset(is_admin):
-            def stub_snapshot_get_all_by_project(context, project_id):
-                return [
+            def stub_snapshot_get_all_by_project(context, project_id,
+                                                 **kwargs):
+                return stubs.stub_snapshot_paginate([
                     stubs.stub_snapshot(1, display_name='backup1'),
                     stubs.stub_snapshot(2, display_name='backup2'),
                     stubs.stub_snapshot(3, display_name='backup3'),
-                ]
+                ], **kwargs)
 
             self.stubs.Set(db, 'snapshot_get_all_by_project',
                            stub_snapshot_get_all_by_project)
@@ -427,6 +431,17 @@ class SnapshotApiTest(test.TestCase):
         # non_admin case
         list_snapshots_with_limit_and_offset(is_admin=False)
 
+    @mock.patch('cinder.db.snapshot_get_all_by_project', return_value=[])
+    def test_list_snapshots_with_marker_and_sort(self, snapshot_get_all):
+        req = fakes.HTTPRequest.blank('/v2/fake/snapshots?marker=1&limit=5'
+                                      '&sort=display_name:asc'
+                                      '&status=available')
+        self.controller.index(req)
+        snapshot_get_all.assert_called_once_with(
+            req.environ['cinder.context'], 'fake',
+            filters={'status': 'available'}, marker='1', limit=5,
+            sort_keys=['display_name'], sort_dirs=['asc'], offset=0)
+
     @mock.patch('cinder.db.snapshot_metadata_get', return_value=dict())
     def test_admin_list_snapshots_all_tenants(self, snapshot_metadata_get):
         req = fakes.HTTPRequest.blank('/v2/fake/snapshots?all_tenants=1',
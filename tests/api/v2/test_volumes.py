@@ -113,6 +113,46 @@ class VolumeApiTest(test.TestCase):
                          'encrypted': False}}
         self.assertEqual(res_dict, ex)
 
+    @mock.patch.object(volume_api.API, 'create_volumes')
+    def test_volume_create_count(self, mock_create_volumes):
+        mock_create_volumes.return_value = [stubs.stub_volume('1'),
+                                            stubs.stub_volume('2')]
+        vol = {"size": 100,
+               "name": "Volume Test Name",
+               "description": "Volume Test Desc",
+               "count": 2}
+        body = {"volume": vol}
+        req = fakes.HTTPRequest.blank('/v2/volumes')
+        res = self.controller.create(req, body)
+
+        self.assertEqual(['1', '2'],
+                         [volume['id'] for volume in res.obj['volumes']])
+        mock_create_volumes.assert_called_once_with(
+            req.environ['cinder.context'], 2, 100, 'Volume Test Name',
+            'Volume Test Desc', metadata=None, availability_zone=None,
+            scheduler_hints=None, multiattach=False)
+
+    def test_volume_create_count_invalid(self):
+        vol = {"size": 100, "count": 0}
+        body = {"volume": vol}
+        req = fakes.HTTPRequest.blank('/v2/volumes')
+        self.assertRaises(webob.exc.HTTPBadRequest, self.controller.create,
+                          req, body)
+
+    @mock.patch.object(volume_api.API, 'get_snapshot')
+    @mock.patch.object(volume_api.API, 'create_volumes')
+    def test_volume_create_count_from_snapshot(self, mock_create_volumes,
+                                               mock_get_snapshot):
+        mock_get_snapshot.return_value = stubs.stub_snapshot(
+            'fake-snapshot-id')
+        vol = {"size": 100, "count": 2,
+               "snapshot_id": 'fake-snapshot-id'}
+        body = {"volume": vol}
+        req = fakes.HTTPRequest.blank('/v2/volumes')
+        self.assertRaises(webob.exc.HTTPBadRequest, self.controller.create,
+                          req, body)
+        self.assertFalse(mock_create_volumes.called)
+
     def test_volume_create_with_consistencygroup_invalid_type(self):
         ctxt = context.RequestContext('fake', 'fake', auth_token=True)
         vol_type = db.volume_type_create(
@@ -897,7 +937,8 @@ class VolumeApiTest(test.TestCase):
         def stub_volume_get_all_by_project(context, project_id, marker, limit,
                                            sort_keys=None, sort_dirs=None,
                                            filters=None,
-                                           viewable_admin_meta=False):
+                                           viewable_admin_meta=False,
+                                           fields=None):
             return [
                 stubs.stub_volume(1, display_name='vol1'),
                 stubs.stub_volume(2, display_name='vol2'),
@@ -967,7 +1008,8 @@ class VolumeApiTest(test.TestCase):
         def stub_volume_get_all_by_project(context, project_id, marker, limit,
                                            sort_keys=None, sort_dirs=None,
                                            filters=None,
-                                           viewable_admin_meta=False):
+                                           viewable_admin_meta=False,
+                                           fields=None):
             return [
                 stubs.stub_volume(1, display_name='vol1'),
                 stubs.stub_volume(2, display_name='vol2'),
@@ -996,7 +1038,8 @@ class VolumeApiTest(test.TestCase):
         def stub_volume_get_all_by_project(context, project_id, marker, limit,
                                            sort_keys=None, sort_dirs=None,
                                            filters=None,
-                                           viewable_admin_meta=False):
+                                           viewable_admin_meta=False,
+                                           fields=None):
             return [
                 stubs.stub_volume(1, display_name='vol1'),
                 stubs.stub_volume(2, display_name='vol2'),
@@ -1058,7 +1101,8 @@ class VolumeApiTest(test.TestCase):
         def stub_volume_get_all_by_project(context, project_id, marker, limit,
                                            sort_keys=None, sort_dirs=None,
                                            filters=None,
-                                           viewable_admin_meta=False):
+                                           viewable_admin_meta=False,
+                                           fields=None):
             return [
                 stubs.stub_volume(1, display_name='vol1'),
                 stubs.stub_volume(2, display_name='vol2'),
@@ -1116,7 +1160,8 @@ class VolumeApiTest(test.TestCase):
         def stub_volume_get_all(context, marker, limit,
                                 sort_keys=None, sort_dirs=None,
                                 filters=None,
-                                viewable_admin_meta=False):
+                                viewable_admin_meta=False,
+                                fields=None):
             vols = [stubs.stub_volume(i)
                     for i in xrange(CONF.osapi_max_limit)]
             if limit is None or limit >= len(vols):
@@ -1134,7 +1179,8 @@ class VolumeApiTest(test.TestCase):
         def stub_volume_get_all2(context, marker, limit,
                                  sort_keys=None, sort_dirs=None,
                                  filters=None,
-                                 viewable_admin_meta=False):
+                                 viewable_admin_meta=False,
+                                 fields=None):
             vols = [stubs.stub_volume(i)
                     for i in xrange(100)]
             if limit is None or limit >= len(vols):
@@ -1152,7 +1198,8 @@ class VolumeApiTest(test.TestCase):
         def stub_volume_get_all3(context, marker, limit,
                                  sort_keys=None, sort_dirs=None,
                                  filters=None,
-                                 viewable_admin_meta=False):
+                                 viewable_admin_meta=False,
+                                 fields=None):
             vols = [stubs.stub_volume(i)
                     for i in xrange(CONF.osapi_max_limit + 100)]
             if limit is None or limit >= len(vols):
@@ -1193,7 +1240,8 @@ class VolumeApiTest(test.TestCase):
         def stub_volume_get_all_by_project(context, project_id, marker, limit,
                                            sort_keys=None, sort_dirs=None,
                                            filters=None,
-                                           viewable_admin_meta=False):
+                                           viewable_admin_meta=False,
+                                           fields=None):
             self.assertEqual(filters['no_migration_targets'], True)
             self.assertFalse('all_tenants' in filters)
             return [stubs.stub_volume(1, display_name='vol1')]
@@ -1201,7 +1249,8 @@ class VolumeApiTest(test.TestCase):
         def stub_volume_get_all(context, marker, limit,
                                 sort_keys=None, sort_dirs=None,
                                 filters=None,
-                                viewable_admin_meta=False):
+                                viewable_admin_meta=False,
+                                fields=None):
             return []
         self.stubs.Set(db, 'volume_get_all_by_project',
                        stub_volume_get_all_by_project)
@@ -1219,14 +1268,16 @@ class VolumeApiTest(test.TestCase):
         def stub_volume_get_all_by_project2(context, project_id, marker, limit,
                                             sort_keys=None, sort_dirs=None,
                                             filters=None,
-                                            viewable_admin_meta=False):
+                                            viewable_admin_meta=False,
+                                            fields=None):
             self.assertFalse('no_migration_targets' in filters)
             return [stubs.stub_volume(1, display_name='vol2')]
 
         def stub_volume_get_all2(context, marker, limit,
                                  sort_keys=None, sort_dirs=None,
                                  filters=None,
-                                 viewable_admin_meta=False):
+                                 viewable_admin_meta=False,
+                                 fields=None):
             return []
         self.stubs.Set(db, 'volume_get_all_by_project',
                        stub_volume_get_all_by_project2)
@@ -1242,13 +1293,15 @@ class VolumeApiTest(test.TestCase):
         def stub_volume_get_all_by_project3(context, project_id, marker, limit,
                                             sort_keys=None, sort_dirs=None,
                                             filters=None,
-                                            viewable_admin_meta=False):
+                                            viewable_admin_meta=False,
+                                            fields=None):
             return []
 
         def stub_volume_get_all3(context, marker, limit,
                                  sort_keys=None, sort_dirs=None,
                                  filters=None,
-                                 viewable_admin_meta=False):
+                                 viewable_admin_meta=False,
+                                 fields=None):
             self.assertFalse('no_migration_targets' in filters)
             self.assertFalse('all_tenants' in filters)
             return [stubs.stub_volume(1, display_name='vol3')]
@@ -1537,7 +1590,7 @@ class VolumeApiTest(test.TestCase):
             context, None, None,
             sort_keys=['created_at'], sort_dirs=['desc'],
             filters={'display_name': 'Volume-573108026'},
-            viewable_admin_meta=True)
+            viewable_admin_meta=True, fields=None)
 
     @mock.patch('cinder.volume.api.API.get_all')
     def test_get_volumes_filter_with_list(self, get_all):
@@ -1550,7 +1603,8 @@ class VolumeApiTest(test.TestCase):
         get_all.assert_called_once_with(
             context, None, None,
             sort_keys=['created_at'], sort_dirs=['desc'],
-            filters={'id': ['1', '2', '3']}, viewable_admin_meta=True)
+            filters={'id': ['1', '2', '3']}, viewable_admin_meta=True,
+            fields=None)
 
     @mock.patch('cinder.volume.api.API.get_all')
     def test_get_volumes_filter_with_expression(self, get_all):
@@ -1563,7 +1617,21 @@ class VolumeApiTest(test.TestCase):
         get_all.assert_called_once_with(
             context, None, None,
             sort_keys=['created_at'], sort_dirs=['desc'],
-            filters={'display_name': 'd-'}, viewable_admin_meta=True)
+            filters={'display_name': 'd-'}, viewable_admin_meta=True,
+            fields=None)
+
+    @mock.patch('cinder.volume.api.API.get_all')
+    def test_get_volumes_summary_fields(self, get_all):
+        req = mock.MagicMock()
+        context = mock.Mock()
+        req.environ = {'cinder.context': context}
+        req.params = {}
+        self.controller._view_builder.summary_list = mock.Mock()
+        self.controller._get_volumes(req, False)
+        get_all.assert_called_once_with(
+            context, None, None,
+            sort_keys=['created_at'], sort_dirs=['desc'], filters={},
+            viewable_admin_meta=True, fields=('id', 'display_name'))
 
 
 class VolumeSerializerTest(test.TestCase):
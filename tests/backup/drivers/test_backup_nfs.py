@@ -30,6 +30,7 @@ import mock
 from oslo_config import cfg
 from oslo_log import log as logging
 
+from cinder.backup import chunkeddriver
 from cinder.backup.drivers import nfs
 from cinder.brick.remotefs import remotefs as remotefs_brick
 from cinder import context
@@ -551,6 +552,43 @@ class BackupNFSSwiftBasedTestCase(test.TestCase):
         self.assertNotEqual(content1['sha256s'][16], content2['sha256s'][16])
         self.assertNotEqual(content1['sha256s'][20], content2['sha256s'][20])
 
+    def test_backup_pipelined_matches_sequential(self):
+        self.flags(backup_file_size=(8 * 1024))
+        self.flags(backup_sha_block_size_bytes=1024)
+        container_name = self.temp_dir.replace(tempfile.gettempdir() + '/',
+                                               '', 1)
+
+        def _backup(backup_id, parent_id=None):
+            self._create_backup_db_entry(container=container_name,
+                                         backup_id=backup_id,
+                                         parent_id=parent_id)
+            service = nfs.NFSBackupDriver(self.ctxt)
+            self.volume_file.seek(0)
+            backup = db.backup_get(self.ctxt, backup_id)
+            service.backup(backup, self.volume_file)
+            backup = db.backup_get(self.ctxt, backup_id)
+            metadata = service._read_metadata(backup)
+            objects = [(name.rsplit('-', 1)[1], obj[name])
+                       for obj in metadata['objects'] for name in obj]
+            sha256s = service._read_sha256file(backup)['sha256s']
+            return objects, sha256s, backup['object_count']
+
+        full = _backup(123)
+        self.flags(backup_pipeline_workers=2,
+                   backup_pipeline_writers=2,
+                   backup_pipeline_max_chunks=3)
+        self.assertEqual(full, _backup(124))
+
+        self.volume_file.seek(16 * 1024)
+        self.volume_file.write(os.urandom(1024))
+        self.volume_file.seek(20 * 1024)
+        self.volume_file.write(os.urandom(2048))
+        pipelined_delta = _backup(125, parent_id=124)
+        self.flags(backup_pipeline_workers=0)
+        sequential_delta = _backup(126, parent_id=123)
+        self.assertEqual(sequential_delta, pipelined_delta)
+        self.assertEqual(3, pipelined_delta[2])
+
     def test_backup_backup_metadata_fail(self):
         """Test of when an exception occurs in backup().
 
@@ -701,6 +739,272 @@ class BackupNFSSwiftBasedTestCase(test.TestCase):
             self.assertTrue(filecmp.cmp(self.volume_file.name,
                             restored_file.name))
 
+    def test_restore_delta_prefetch(self):
+        self.flags(backup_file_size=(1024 * 8))
+        self.flags(backup_sha_block_size_bytes=1024)
+        self.flags(backup_restore_prefetch=3)
+
+        container_name = self.temp_dir.replace(tempfile.gettempdir() + '/',
+                                               '', 1)
+        self._create_backup_db_entry(container=container_name, backup_id=123)
+        service = nfs.NFSBackupDriver(self.ctxt)
+        self.volume_file.seek(0)
+        backup = db.backup_get(self.ctxt, 123)
+        service.backup(backup, self.volume_file)
+
+        # Overwrite a whole object and part of another one.
+        self.volume_file.seek(8 * 1024)
+        self.volume_file.write(os.urandom(8 * 1024))
+        self.volume_file.seek(20 * 1024)
+        self.volume_file.write(os.urandom(1024))
+
+        self._create_backup_db_entry(container=container_name, backup_id=124,
+                                     parent_id=123)
+        self.volume_file.seek(0)
+        deltabackup = db.backup_get(self.ctxt, 124)
+        service.backup(deltabackup, self.volume_file, True)
+
+        with mock.patch.object(service, '_fetch_restore_object',
+                               wraps=service._fetch_restore_object) as fetch:
+            with tempfile.NamedTemporaryFile() as restored_file:
+                backup = db.backup_get(self.ctxt, 124)
+                service.restore(backup, '1234-5678-1234-8888',
+                                restored_file)
+                self.assertTrue(filecmp.cmp(self.volume_file.name,
+                                restored_file.name))
+        # 16 objects in the full backup, 2 in the incremental one of which
+        # one completely replaces an object of the full backup.
+        self.assertEqual(17, fetch.call_count)
+
+    def test_backup_dedup(self):
+        self.flags(backup_file_size=(8 * 1024))
+        self.flags(backup_sha_block_size_bytes=1024)
+        self.flags(backup_dedup=True)
+        container_name = self.temp_dir.replace(tempfile.gettempdir() + '/',
+                                               '', 1)
+        # The second half of the volume repeats the first one.
+        self.volume_file.seek(0)
+        data = self.volume_file.read(64 * 1024)
+        self.volume_file.write(data)
+        self.volume_file.flush()
+
+        service = nfs.NFSBackupDriver(self.ctxt)
+        self.mock_object(service, '_generate_object_name_prefix',
+                         lambda backup: 'backup_%s_' % backup['id'])
+
+        def _chunks():
+            return service.get_container_entries(
+                container_name, chunkeddriver.ChunkIndex.OBJECT_PREFIX)
+
+        def _refs():
+            chunk_index = service._read_chunk_index(container_name)
+            return sum(chunk['refs']
+                       for chunk in chunk_index.chunks.values())
+
+        for backup_id in (123, 124):
+            self._create_backup_db_entry(container=container_name,
+                                         backup_id=backup_id)
+            self.volume_file.seek(0)
+            backup = db.backup_get(self.ctxt, backup_id)
+            service.backup(backup, self.volume_file)
+        self.assertEqual(8, len(_chunks()))
+        self.assertEqual(32, _refs())
+
+        service.delete(db.backup_get(self.ctxt, 123))
+        self.assertEqual(8, len(_chunks()))
+        self.assertEqual(16, _refs())
+
+        for prefetch in (0, 2):
+            self.flags(backup_restore_prefetch=prefetch)
+            service = nfs.NFSBackupDriver(self.ctxt)
+            with tempfile.NamedTemporaryFile() as restored_file:
+                backup = db.backup_get(self.ctxt, 124)
+                service.restore(backup, '1234-5678-1234-8888',
+                                restored_file)
+                self.assertTrue(filecmp.cmp(self.volume_file.name,
+                                restored_file.name))
+
+        self.mock_object(service, '_generate_object_name_prefix',
+                         lambda backup: 'backup_%s_' % backup['id'])
+        service.delete(db.backup_get(self.ctxt, 124))
+        self.assertEqual([], _chunks())
+        self.assertEqual(0, _refs())
+
+    def test_backup_dedup_object_count(self):
+        self.flags(backup_file_size=(8 * 1024))
+        self.flags(backup_sha_block_size_bytes=1024)
+        self.flags(backup_dedup=True)
+        container_name = self.temp_dir.replace(tempfile.gettempdir() + '/',
+                                               '', 1)
+        # The second half of the volume repeats the first one.
+        self.volume_file.seek(0)
+        data = self.volume_file.read(64 * 1024)
+        self.volume_file.write(data)
+        self.volume_file.flush()
+
+        # Stored and referenced chunks both count, sequentially and
+        # pipelined alike.
+        for backup_id, workers in ((123, 0), (124, 2)):
+            self.flags(backup_pipeline_workers=workers)
+            self._create_backup_db_entry(container=container_name,
+                                         backup_id=backup_id)
+            service = self._dedup_service()
+            self.volume_file.seek(0)
+            service.backup(db.backup_get(self.ctxt, backup_id),
+                           self.volume_file)
+            backup = db.backup_get(self.ctxt, backup_id)
+            self.assertEqual(17, backup['object_count'])
+
+    def _dedup_service(self):
+        service = nfs.NFSBackupDriver(self.ctxt)
+        self.mock_object(service, '_generate_object_name_prefix',
+                         lambda backup: 'backup_%s_' % backup['id'])
+        return service
+
+    def test_backup_dedup_concurrent(self):
+        self.flags(backup_file_size=(8 * 1024))
+        self.flags(backup_sha_block_size_bytes=1024)
+        self.flags(backup_dedup=True)
+        container_name = self.temp_dir.replace(tempfile.gettempdir() + '/',
+                                               '', 1)
+        service = self._dedup_service()
+        other_service = self._dedup_service()
+        for backup_id in (123, 124):
+            self._create_backup_db_entry(container=container_name,
+                                         backup_id=backup_id)
+
+        def _other_backup(*args):
+            # Runs while backup 123 holds its copy of the chunk index.
+            self.volume_file.flush()
+            with open(self.volume_file.name, 'rb') as volume_file:
+                other_service.backup(db.backup_get(self.ctxt, 124),
+                                     volume_file)
+
+        self.volume_file.seek(0)
+        with mock.patch.object(service, '_send_progress_end',
+                               side_effect=_other_backup):
+            service.backup(db.backup_get(self.ctxt, 123), self.volume_file)
+
+        chunk_index = service._read_chunk_index(container_name)
+        self.assertEqual(32, len(chunk_index.chunks))
+        self.assertEqual(32, sum(chunk['refs']
+                                 for chunk in chunk_index.chunks.values()))
+
+        service.delete(db.backup_get(self.ctxt, 123))
+        service.delete(db.backup_get(self.ctxt, 124))
+        self.assertEqual([], service.get_container_entries(
+            container_name, chunkeddriver.ChunkIndex.OBJECT_PREFIX))
+
+    def test_backup_dedup_concurrent_delete(self):
+        self.flags(backup_file_size=(8 * 1024))
+        self.flags(backup_sha_block_size_bytes=1024)
+        self.flags(backup_dedup=True)
+        container_name = self.temp_dir.replace(tempfile.gettempdir() + '/',
+                                               '', 1)
+        service = self._dedup_service()
+        for backup_id in (123, 124):
+            self._create_backup_db_entry(container=container_name,
+                                         backup_id=backup_id)
+        self.volume_file.seek(0)
+        service.backup(db.backup_get(self.ctxt, 123), self.volume_file)
+
+        def _delete_parent(*args):
+            # Releases the chunks backup 124 refers to.
+            self._dedup_service().delete(db.backup_get(self.ctxt, 123))
+
+        self.volume_file.seek(0)
+        with mock.patch.object(service, '_send_progress_end',
+                               side_effect=_delete_parent):
+            self.assertRaises(exception.InvalidBackup, service.backup,
+                              db.backup_get(self.ctxt, 124),
+                              self.volume_file)
+
+        self.assertEqual([], service.get_container_entries(
+            container_name, chunkeddriver.ChunkIndex.OBJECT_PREFIX))
+        chunk_index = service._read_chunk_index(container_name)
+        self.assertEqual({}, chunk_index.chunks)
+
+    def test_backup_dedup_multiple_hosts(self):
+        self.flags(backup_dedup=True)
+        for host in ('host1', 'host2'):
+            db.service_create(self.ctxt, {'host': host,
+                                          'binary': 'cinder-backup',
+                                          'topic': CONF.backup_topic})
+        self._create_backup_db_entry()
+        service = nfs.NFSBackupDriver(self.ctxt)
+        self.volume_file.seek(0)
+        backup = db.backup_get(self.ctxt, 123)
+        self.assertRaises(exception.InvalidBackup, service.backup, backup,
+                          self.volume_file)
+
+    def _test_delete_interrupted_backup(self, dedup):
+        self.flags(backup_file_size=(8 * 1024))
+        self.flags(backup_sha_block_size_bytes=1024)
+        self.flags(backup_dedup=dedup)
+        container_name = self.temp_dir.replace(tempfile.gettempdir() + '/',
+                                               '', 1)
+        self._create_backup_db_entry(container=container_name)
+        service = self._dedup_service()
+
+        class Interrupted(BaseException):
+            pass
+
+        # The service stops after the data was stored
+        self.volume_file.seek(0)
+        with mock.patch.object(service, '_finalize_backup',
+                               side_effect=Interrupted):
+            self.assertRaises(Interrupted, service.backup,
+                              db.backup_get(self.ctxt, 123),
+                              self.volume_file)
+        prefix = (chunkeddriver.ChunkIndex.OBJECT_PREFIX if dedup
+                  else 'backup_123_')
+        self.assertNotEqual([], service.get_container_entries(
+            container_name, prefix))
+
+        service.delete(db.backup_get(self.ctxt, 123))
+        self.assertEqual([], service.get_container_entries(
+            container_name, prefix))
+
+        # Backed up again from scratch
+        self.volume_file.seek(0)
+        service.backup(db.backup_get(self.ctxt, 123), self.volume_file)
+        with tempfile.NamedTemporaryFile() as restored_file:
+            service.restore(db.backup_get(self.ctxt, 123),
+                            '1234-5678-1234-8888', restored_file)
+            self.assertTrue(filecmp.cmp(self.volume_file.name,
+                                        restored_file.name))
+
+    def test_delete_interrupted_backup(self):
+        self._test_delete_interrupted_backup(False)
+
+    def test_delete_interrupted_backup_dedup(self):
+        self._test_delete_interrupted_backup(True)
+
+    def test_delete_without_dedup(self):
+        self._create_backup_db_entry()
+        db.backup_update(self.ctxt, 123, {'service_metadata': 'backup_123_'})
+        service = self._dedup_service()
+        self.mock_object(service, '_delete_backup_objects')
+        self.mock_object(service, 'get_container_entries')
+
+        service.delete(db.backup_get(self.ctxt, 123))
+        self.assertTrue(service._delete_backup_objects.called)
+        self.assertFalse(service.get_container_entries.called)
+
+    def test_delete_not_started(self):
+        self._create_backup_db_entry()
+        service = nfs.NFSBackupDriver(self.ctxt)
+        self.mock_object(service, 'get_container_entries')
+
+        service.delete(db.backup_get(self.ctxt, 123))
+        self.assertFalse(service.get_container_entries.called)
+
+    def test_build_extent_map(self):
+        extents = nfs.NFSBackupDriver._build_extent_map(
+            [(0, 10, 'a'), (10, 10, 'b'), (5, 10, 'c'), (12, 2, 'd')])
+        self.assertEqual([(0, 5, 'a'), (5, 12, 'c'), (12, 14, 'd'),
+                          (14, 15, 'c'), (15, 20, 'b')], extents)
+
     def test_delete(self):
         self._create_backup_db_entry()
         service = nfs.NFSBackupDriver(self.ctxt)
@@ -0,0 +1,76 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import mock
+from oslo_concurrency import processutils as putils
+
+from cinder.brick import executor
+from cinder import test
+
+
+class RootwrapDaemonExecuteTestCase(test.TestCase):
+
+    def setUp(self):
+        super(RootwrapDaemonExecuteTestCase, self).setUp()
+        self.fallback = mock.Mock()
+        self.execute = executor.RootwrapDaemonExecute(
+            'sudo fake-rootwrap-daemon fake.conf', execute=self.fallback)
+        self.client = mock.Mock()
+        self.client.execute.return_value = (0, 'out', 'err')
+        self.stubs.Set(self.execute, '_get_client', lambda: self.client)
+
+    def test_not_root(self):
+        output = self.execute('ls', 1)
+        self.assertEqual(self.fallback.return_value, output)
+        self.fallback.assert_called_once_with('ls', 1)
+        self.assertFalse(self.client.execute.called)
+
+    def test_root(self):
+        output = self.execute('ls', 1, run_as_root=True, root_helper='sudo',
+                              process_input='input')
+        self.assertEqual(('out', 'err'), output)
+        self.client.execute.assert_called_once_with(['ls', '1'], 'input')
+        self.assertFalse(self.fallback.called)
+
+    def test_root_unsupported_kwargs(self):
+        output = self.execute('ls', run_as_root=True, root_helper='sudo',
+                              cwd='/tmp', env_variables={'LC_ALL': 'C'})
+        self.assertEqual(self.fallback.return_value, output)
+        self.fallback.assert_called_once_with(
+            'ls', run_as_root=True, root_helper='sudo', cwd='/tmp',
+            env_variables={'LC_ALL': 'C'})
+        self.assertFalse(self.client.execute.called)
+
+    def test_root_failure(self):
+        self.client.execute.return_value = (1, 'out', 'err')
+        self.assertRaises(putils.ProcessExecutionError, self.execute,
+                          'ls', run_as_root=True)
+
+    def test_root_failure_ignored(self):
+        self.client.execute.return_value = (1, 'out', 'err')
+        output = self.execute('ls', run_as_root=True, check_exit_code=False)
+        self.assertEqual(('out', 'err'), output)
+
+    def test_root_retry(self):
+        self.client.execute.side_effect = [(1, '', 'err'), (0, 'out', '')]
+        output = self.execute('ls', run_as_root=True, attempts=2,
+                              delay_on_retry=False)
+        self.assertEqual(('out', ''), output)
+        self.assertEqual(2, self.client.execute.call_count)
+
+    def test_clients_shared(self):
+        self.stubs.Set(executor.RootwrapDaemonExecute, '_clients', {})
+        other = executor.RootwrapDaemonExecute(self.execute.daemon_cmd)
+        with mock.patch('oslo_rootwrap.client.Client') as mock_client:
+            self.assertIs(other._get_client(), other._get_client())
+        mock_client.assert_called_once_with(
+            ['sudo', 'fake-rootwrap-daemon', 'fake.conf'])
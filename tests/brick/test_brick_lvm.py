@@ -95,6 +95,31 @@ class BrickLvmTestCase(test.TestCase):
                     "lWyauW-dKpG-Rz7E-xtKY-jeju-QsYU-SLG7Z2\n"
             data += "  fake-vg-3:10.00:10.00:0:"\
                     "mXzbuX-dKpG-Rz7E-xtKY-jeju-QsYU-SLG8Z3\n"
+        elif ('env, LC_ALL=C, lvs, --noheadings, --unit=g, '
+              '-o, vg_name,name,size,lv_attr,origin,data_percent'
+              in cmd_string):
+            if 'fake-unknown' in cmd_string:
+                raise processutils.ProcessExecutionError(
+                    stderr="One or more volume(s) not found."
+                )
+            if 'test-prov-cap-vg-unit' in cmd_string:
+                data = ("  fake-vg:test-prov-cap-pool-unit:9.50g:"
+                        "twi-a-tz--::20\n")
+                data += "  fake-vg:fake-volume-1:1.00g:Vwi-a-tz--::0\n"
+                data += "  fake-vg:fake-volume-2:2.00g:Vwi-a-tz--::0\n"
+            elif 'test-prov-cap-vg-no-unit' in cmd_string:
+                data = ("  fake-vg:test-prov-cap-pool-no-unit:9.50:"
+                        "twi-a-tz--::20\n")
+                data += "  fake-vg:fake-volume-1:1.00:Vwi-a-tz--::0\n"
+                data += "  fake-vg:fake-volume-2:2.00:Vwi-a-tz--::0\n"
+            elif 'test-volumes' in cmd_string:
+                data = "  fake-vg:test-volumes:1.00:-wi-a-----::\n"
+            elif cmd_string.endswith('fake-vg/fake-vg'):
+                data = "  fake-vg:fake-vg:1.00:owi-a-----::\n"
+            else:
+                data = "  fake-vg:fake-1:1.00g:owi-a-----::\n"
+                data += "  fake-vg:fake-2:1.00g:-wi-a-----::\n"
+                data += "  fake-vg:snapshot-fake-1:1.00g:swi-a-s---:fake-1:\n"
         elif ('env, LC_ALL=C, lvs, --noheadings, '
               '--unit=g, -o, vg_name,name,size, --nosuffix, '
               'fake-vg/lv-nothere' in cmd_string):
@@ -340,6 +365,52 @@ class BrickLvmTestCase(test.TestCase):
         self.assertTrue(self.vg.lv_has_snapshot('fake-vg'))
         self.assertFalse(self.vg.lv_has_snapshot('test-volumes'))
 
+    def _count_lvs_executor(self, calls):
+        def executor(*cmd, **kwargs):
+            if 'lvs' in cmd:
+                calls.append(cmd)
+            if cmd[0] in ('lvcreate', 'lvremove', 'lvrename', 'lvextend'):
+                return ("", "")
+            return self.fake_execute(*cmd, **kwargs)
+        return executor
+
+    def test_update_volume_group_info_scans_once(self):
+        calls = []
+        self.vg.set_execute(self._count_lvs_executor(calls))
+
+        self.vg.update_volume_group_info()
+        self.assertEqual(3, len(self.vg.get_volumes()))
+        self.assertEqual('fake-1', self.vg.get_volume('fake-1')['name'])
+        self.assertTrue(self.vg.lv_has_snapshot('fake-1'))
+        self.assertFalse(self.vg.lv_has_snapshot('fake-2'))
+
+        self.assertEqual(1, len(calls))
+
+    def test_lv_index_updated_in_place(self):
+        calls = []
+        self.vg.set_execute(self._count_lvs_executor(calls))
+        self.vg.update_volume_group_info()
+
+        self.vg.create_volume('new', '2g')
+        self.assertEqual({'vg': 'fake-vg', 'name': 'new', 'size': '2.00'},
+                         self.vg.get_volume('new'))
+
+        self.vg.create_lv_snapshot('snap', 'fake-2')
+        self.assertTrue(self.vg.lv_has_snapshot('fake-2'))
+        self.vg.delete('snap')
+        self.assertFalse(self.vg.lv_has_snapshot('fake-2'))
+
+        self.vg.rename_volume('new', 'renamed')
+        self.vg.extend_volume('renamed', '3g')
+        self.assertEqual('3.00', self.vg.get_volume('renamed')['size'])
+
+        # The old style snapshot goes along with its origin
+        self.vg.delete('fake-1')
+        self.assertEqual(['fake-2', 'renamed'],
+                         [lv['name'] for lv in self.vg.get_volumes()])
+
+        self.assertEqual(1, len(calls))
+
     def test_activate_lv(self):
         self._mox.StubOutWithMock(self.vg, '_execute')
         self.vg._supports_lvchange_ignoreskipactivation = True
@@ -28,6 +28,7 @@ CONF.import_opt('xiv_ds8k_proxy',
 CONF.import_opt('backup_driver', 'cinder.backup.manager')
 CONF.import_opt('fixed_key', 'cinder.keymgr.conf_key_mgr', group='keymgr')
 CONF.import_opt('scheduler_driver', 'cinder.scheduler.manager')
+CONF.import_opt('glance_client_pool_size', 'cinder.image.glance')
 
 def_vol_type = 'fake_vol_type'
 
@@ -51,3 +52,7 @@ def set_defaults(conf):
     conf.set_default('state_path', os.path.abspath(
         os.path.join(os.path.dirname(__file__), '..', '..')))
     conf.set_default('policy_dirs', [])
+    # Tests stub out the glance client, don't let them share clients
+    conf.set_default('glance_client_pool_size', 0)
+    conf.set_default('glance_server_backoff', 0)
+    conf.set_default('glance_show_cache_ttl', 0)
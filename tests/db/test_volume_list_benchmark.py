@@ -0,0 +1,85 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Benchmark of the volume listing queries.
+
+This is not run by default.  Set CINDER_VOLUME_LIST_BENCHMARK to the number
+of volumes to list, for instance 100000, to compare listing them with every
+relationship joined in, with the relationships loaded by separate queries
+and with only the columns the summary view needs.
+"""
+
+import uuid
+
+from sqlalchemy.orm import joinedload
+
+from cinder.common import sqlalchemyutils
+from cinder import context
+from cinder import db
+from cinder.db.sqlalchemy import api as sqlalchemy_api
+from cinder.db.sqlalchemy import models
+from cinder import test
+
+
+class VolumeListBenchmark(test.BenchmarkTestCase):
+    """Times the volume listing queries over a large number of volumes."""
+
+    BENCHMARK_ENV = 'CINDER_VOLUME_LIST_BENCHMARK'
+
+    def setUp(self):
+        super(VolumeListBenchmark, self).setUp()
+        self.ctxt = context.get_admin_context()
+        volume_type = db.volume_type_create(
+            self.ctxt, {'name': 'bench', 'extra_specs': {'a': '1', 'b': '2'}})
+
+        session = sqlalchemy_api.get_session()
+        with session.begin():
+            for i in xrange(self.benchmark_size):
+                volume_id = str(uuid.uuid4())
+                session.add(models.Volume(
+                    id=volume_id, project_id='bench',
+                    display_name='vol%d' % i, size=1,
+                    volume_type_id=volume_type['id'],
+                    volume_metadata=[models.VolumeMetadata(key='k%d' % j,
+                                                           value='v')
+                                     for j in xrange(4)],
+                    volume_admin_metadata=[
+                        models.VolumeAdminMetadata(key='readonly',
+                                                   value='False'),
+                        models.VolumeAdminMetadata(key='attached_mode',
+                                                   value='rw')]))
+
+    def _joined_volume_get_all(self):
+        """List the volumes the way volume_get_all used to."""
+        session = sqlalchemy_api.get_session()
+        with session.begin():
+            query = sqlalchemy_api._volume_get_query(self.ctxt,
+                                                     session=session,
+                                                     loader=joinedload)
+            return sqlalchemyutils.paginate_query(
+                query, models.Volume, None, ['created_at', 'id'],
+                sort_dirs=['desc', 'desc']).all()
+
+    def test_volume_list(self):
+        joined = self.timed('joined relationships',
+                            self._joined_volume_get_all)
+        detail = self.timed('relationships by separate queries',
+                            db.volume_get_all, self.ctxt, None, None)
+        summary = self.timed('summary columns',
+                             db.volume_get_all, self.ctxt, None, None,
+                             fields=['id', 'display_name'])
+
+        self.assertEqual(self.benchmark_size, len(joined))
+        self.assertEqual([volume['id'] for volume in joined],
+                         [volume['id'] for volume in detail])
+        self.assertEqual([volume['id'] for volume in joined],
+                         [volume['id'] for volume in summary])
@@ -15,10 +15,14 @@
 
 
 import datetime
+import hashlib
+import os
 
+import fixtures
 import glanceclient.exc
 import mock
 from oslo_config import cfg
+from oslo_utils import units
 
 from cinder import context
 from cinder import exception
@@ -730,3 +734,190 @@ class TestGlanceImageServiceClient(test.TestCase):
         client = glance._create_glance_client(self.context, 'fake_host:9292',
                                               False)
         self.assertIsInstance(client, MyGlanceStubClient)
+
+
+class TestGlanceClientPool(test.TestCase):
+
+    def setUp(self):
+        super(TestGlanceClientPool, self).setUp()
+        self.flags(glance_client_pool_size=2, glance_server_backoff=60,
+                   glance_api_servers=['host1:9292', 'host2:9292'])
+        self.context = context.RequestContext('fake', 'fake',
+                                              auth_token='token')
+        self.stubs.Set(glance, '_CLIENT_POOL', glance._GlanceClientPool())
+        self.stubs.Set(glance, '_FAILED_SERVERS', {})
+        self.stubs.Set(glance.time, 'sleep', lambda s: None)
+
+    @mock.patch('cinder.image.glance._create_glance_client')
+    def test_client_reused(self, mock_create):
+        wrapper = glance.GlanceClientWrapper()
+        wrapper.call(self.context, 'get', 'image1')
+        wrapper.call(self.context, 'get', 'image2')
+        wrapper.call(self.context, 'get', 'image3')
+
+        # One client for each of the two servers
+        self.assertEqual(2, mock_create.call_count)
+
+    @mock.patch('cinder.image.glance._create_glance_client')
+    def test_client_not_shared_across_tokens(self, mock_create):
+        other = context.RequestContext('fake', 'fake', auth_token='other')
+        pool = glance._CLIENT_POOL
+        pool.get(self.context, 'host1:9292', False, 1)
+        pool.get(other, 'host1:9292', False, 1)
+        pool.get(self.context, 'host1:9292', False, 1)
+
+        self.assertEqual(2, mock_create.call_count)
+
+    def test_failed_server_skipped(self):
+        clients = {}
+
+        def fake_create(context, netloc, use_ssl, version):
+            client = mock.Mock()
+            if netloc == 'host1:9292':
+                client.images.get.side_effect = (
+                    glanceclient.exc.CommunicationError(''))
+            clients[netloc] = client
+            return client
+        self.stubs.Set(glance, '_create_glance_client', fake_create)
+        self.stubs.Set(glance.random, 'shuffle', lambda servers: None)
+        self.flags(glance_num_retries=1)
+
+        for _i in range(4):
+            glance.GlanceClientWrapper().call(self.context, 'get', 'image')
+
+        # host1 failed once, after which it was skipped
+        self.assertIn(('host1:9292', False), glance._FAILED_SERVERS)
+        self.assertEqual(1, clients['host1:9292'].images.get.call_count)
+        self.assertEqual(4, clients['host2:9292'].images.get.call_count)
+
+
+class TestGlanceShowCache(test.TestCase):
+
+    def setUp(self):
+        super(TestGlanceShowCache, self).setUp()
+        self.flags(glance_show_cache_ttl=10)
+        self.stubs.Set(glance, '_SHOW_CACHE', {})
+        self.context = context.RequestContext('fake', 'fake',
+                                              auth_token=True)
+        self.client = mock.Mock()
+        self.client.call.return_value = glance_stubs.FakeImage(
+            {'id': 'image', 'name': 'image', 'is_public': True,
+             'status': 'active', 'properties': {}})
+        self.service = glance.GlanceImageService(client=self.client)
+
+    def test_show_cached(self):
+        first = self.service.show(self.context, 'image')
+        first['name'] = 'changed'
+        second = self.service.show(self.context, 'image')
+
+        self.assertEqual(1, self.client.call.call_count)
+        self.assertEqual('image', second['name'])
+
+    @mock.patch('cinder.image.glance.time')
+    def test_show_cache_expires(self, mock_time):
+        mock_time.time.return_value = 100
+        self.service.show(self.context, 'image')
+        mock_time.time.return_value = 111
+        self.service.show(self.context, 'image')
+
+        self.assertEqual(2, self.client.call.call_count)
+
+    def test_show_cache_per_project(self):
+        other = context.RequestContext('fake', 'other', auth_token=True)
+        self.service.show(self.context, 'image')
+        self.service.show(other, 'image')
+
+        self.assertEqual(2, self.client.call.call_count)
+
+    def test_delete_uncaches(self):
+        self.service.show(self.context, 'image')
+        self.service.delete(self.context, 'image')
+        self.service.show(self.context, 'image')
+
+        self.assertEqual(3, self.client.call.call_count)
+
+
+class TestGlanceDownloadInParts(test.TestCase):
+
+    def setUp(self):
+        super(TestGlanceDownloadInParts, self).setUp()
+        self.flags(glance_download_parallelism=2,
+                   glance_download_part_size_mb=1)
+        self.context = context.RequestContext('fake', 'fake',
+                                              auth_token=True)
+        self.content = b'a' * units.Mi + b'b' * units.Mi + b'c' * 1000
+        self.image_meta = {'id': 'image', 'size': len(self.content),
+                           'checksum': hashlib.md5(self.content).hexdigest()}
+        self.client = mock.Mock(version=2)
+        self.client.get_range.side_effect = self._get_range
+        self.service = glance.GlanceImageService(client=self.client)
+        self.stubs.Set(self.service, 'show',
+                       lambda context, image_id: self.image_meta)
+        self.path = os.path.join(self.useFixture(fixtures.TempDir()).path,
+                                 'image')
+
+    def _get_range(self, context, url, start, end):
+        return mock.Mock(status_code=206), [self.content[start:end + 1]]
+
+    def _download(self):
+        with open(self.path, 'wb') as data:
+            self.service.download(self.context, 'image', data)
+        with open(self.path, 'rb') as data:
+            return data.read()
+
+    def test_download_in_parts(self):
+        self.assertEqual(self.content, self._download())
+        self.assertEqual(3, self.client.get_range.call_count)
+        self.client.get_range.assert_any_call(
+            self.context, '/v2/images/image/file', units.Mi,
+            2 * units.Mi - 1)
+        self.assertFalse(self.client.call.called)
+
+    def test_download_ranges_unsupported(self):
+        self.client.get_range.side_effect = None
+        self.client.get_range.return_value = (mock.Mock(status_code=200),
+                                              [self.content])
+
+        self.assertEqual(self.content, self._download())
+        self.assertEqual(1, self.client.get_range.call_count)
+
+    def test_download_ranges_unsupported_checksum_mismatch(self):
+        self.image_meta['checksum'] = 'bad'
+        self.client.get_range.side_effect = None
+        self.client.get_range.return_value = (mock.Mock(status_code=200),
+                                              [self.content])
+
+        self.assertRaises(exception.ImageUnacceptable, self._download)
+
+    def test_download_checksum_mismatch(self):
+        self.image_meta['checksum'] = 'bad'
+
+        self.assertRaises(exception.ImageUnacceptable, self._download)
+
+    def test_download_short_range(self):
+        self.client.get_range.side_effect = (
+            lambda context, url, start, end: (mock.Mock(status_code=206),
+                                              [self.content[start:end]]))
+
+        self.assertRaises(exception.ImageUnacceptable, self._download)
+
+    def test_download_hash_short_file(self):
+        # The file read back for the checksum ends before the image
+        short = os.path.join(os.path.dirname(self.path), 'short')
+        with open(short, 'wb') as f:
+            f.write(self.content[:units.Mi // 2])
+
+        with open(self.path, 'wb') as f:
+            data = mock.Mock(wraps=f)
+            data.name = short
+            self.assertRaises(exception.ImageUnacceptable,
+                              self.service._download_in_parts,
+                              self.context, 'image', self.image_meta, data,
+                              units.Mi)
+
+    def test_download_small_image_in_one_go(self):
+        self.image_meta['size'] = units.Mi
+        self.client.call.return_value = [b'data']
+
+        self.assertEqual(b'data', self._download())
+        self.assertFalse(self.client.get_range.called)
@@ -0,0 +1,162 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Unit tests for the local image cache."""
+
+import errno
+import os
+
+import fixtures
+import mock
+
+from cinder.image import image_cache
+from cinder.image import image_utils
+from cinder import test
+
+
+class ImageCacheTestCase(test.TestCase):
+    def setUp(self):
+        super(ImageCacheTestCase, self).setUp()
+        self.path = self.useFixture(fixtures.TempDir()).path
+        self.cache = image_cache.ImageCache(self.path, max_size=2 * 4096)
+
+    def _fill(self, data):
+        def fill(path):
+            with open(path, 'wb') as f:
+                f.write(data)
+        return mock.Mock(side_effect=fill)
+
+    def test_get_miss_then_hit(self):
+        fill = self._fill(b'x' * 4096)
+        with self.cache.get('image', 'sum', 'raw', fill) as path:
+            with open(path, 'rb') as f:
+                self.assertEqual(b'x' * 4096, f.read())
+        self.assertFalse(os.path.exists(path))
+
+        with self.cache.get('image', 'sum', 'raw', fill) as path:
+            self.assertTrue(os.path.exists(path))
+        self.assertEqual(1, fill.call_count)
+        part = fill.call_args[0][0]
+        self.assertTrue(part.startswith(
+            os.path.join(self.path, 'image-sum.raw.')))
+        self.assertTrue(part.endswith('.part'))
+        self.assertEqual(['image-sum.raw'], os.listdir(self.path))
+
+    def test_get_fills_unique_parts(self):
+        fill = self._fill(b'x')
+        with self.cache.get('image', 'sum', 'raw', fill):
+            pass
+        os.unlink(os.path.join(self.path, 'image-sum.raw'))
+        with self.cache.get('image', 'sum', 'raw', fill):
+            pass
+        self.assertEqual(2, fill.call_count)
+        self.assertNotEqual(fill.call_args_list[0], fill.call_args_list[1])
+
+    def test_get_hit_evicted(self):
+        with self.cache.get('image', 'sum', 'raw', self._fill(b'x')):
+            pass
+        real_link = os.link
+
+        def evicted_link(src, dest):
+            # The entry is evicted just before it gets linked
+            if not src.endswith('.part'):
+                os.unlink(src)
+                raise OSError(errno.ENOENT, 'evicted')
+            return real_link(src, dest)
+
+        fill = self._fill(b'y')
+        with mock.patch('os.link', side_effect=evicted_link):
+            with self.cache.get('image', 'sum', 'raw', fill) as path:
+                with open(path, 'rb') as f:
+                    self.assertEqual(b'y', f.read())
+        self.assertEqual(1, fill.call_count)
+
+    def test_get_keys_on_checksum_and_format(self):
+        fill = self._fill(b'x')
+        for checksum, volume_format in (('sum', 'raw'), ('sum2', 'raw'),
+                                        ('sum', 'vpc')):
+            with self.cache.get('image', checksum, volume_format, fill):
+                pass
+        self.assertEqual(3, fill.call_count)
+
+    def test_get_fill_error(self):
+        fill = mock.Mock(side_effect=IOError)
+        self.assertRaises(IOError, self.cache.get('image', 'sum', 'raw',
+                                                  fill).__enter__)
+        self.assertEqual([], os.listdir(self.path))
+
+    def test_evict_least_recently_used(self):
+        for image_id, mtime in (('old', 1000), ('new', 3000)):
+            with self.cache.get(image_id, 'sum', 'raw',
+                                self._fill(b'x' * 4096)):
+                pass
+            os.utime(os.path.join(self.path, '%s-sum.raw' % image_id),
+                     (mtime, mtime))
+
+        with self.cache.get('newest', 'sum', 'raw',
+                            self._fill(b'x' * 4096)) as path:
+            self.assertTrue(os.path.exists(path))
+
+        self.assertEqual(['new-sum.raw', 'newest-sum.raw'],
+                         sorted(os.listdir(self.path)))
+
+    def test_evicted_entry_stays_readable(self):
+        with self.cache.get('image', 'sum', 'raw',
+                            self._fill(b'x' * 4096)) as path:
+            os.unlink(os.path.join(self.path, 'image-sum.raw'))
+            with open(path, 'rb') as f:
+                self.assertEqual(b'x' * 4096, f.read())
+
+
+class FetchFromImageCacheTestCase(test.TestCase):
+    def setUp(self):
+        super(FetchFromImageCacheTestCase, self).setUp()
+        self.flags(image_cache_dir=self.useFixture(fixtures.TempDir()).path)
+        self.image_service = mock.Mock()
+        self.image_service.show.return_value = {
+            'disk_format': 'qcow2', 'container_format': 'bare',
+            'checksum': 'sum', 'size': 4096}
+
+    @mock.patch('cinder.image.image_utils.volume_utils.copy_volume')
+    @mock.patch('cinder.image.image_utils._fetch_to_volume_format')
+    def test_fetch_to_volume_format_cached(self, mock_fetch, mock_copy):
+        def fake_fetch(context, image_service, image_id, image_meta, dest,
+                       *args, **kwargs):
+            with open(dest, 'wb') as f:
+                f.write(b'x' * 4096)
+        mock_fetch.side_effect = fake_fetch
+
+        for dest in ('/dev/one', '/dev/two'):
+            image_utils.fetch_to_volume_format(
+                mock.sentinel.context, self.image_service, 'image', dest,
+                'raw', '1M')
+
+        self.assertEqual(1, mock_fetch.call_count)
+        self.assertFalse(mock_fetch.call_args[1]['run_as_root'])
+        self.assertEqual([mock.call(mock.ANY, '/dev/one', 1, '1M'),
+                          mock.call(mock.ANY, '/dev/two', 1, '1M')],
+                         mock_copy.call_args_list)
+
+    @mock.patch('cinder.image.image_utils._stream_to_volume')
+    @mock.patch('cinder.image.image_utils._fetch_to_volume_format')
+    def test_fetch_to_volume_format_no_checksum(self, mock_fetch,
+                                                mock_stream):
+        del self.image_service.show.return_value['checksum']
+
+        image_utils.fetch_to_volume_format(
+            mock.sentinel.context, self.image_service, 'image', '/dev/one',
+            'raw', '1M')
+
+        mock_fetch.assert_called_once_with(
+            mock.sentinel.context, self.image_service, 'image',
+            self.image_service.show.return_value, '/dev/one', 'raw', '1M',
+            None, None, size=None, run_as_root=True)
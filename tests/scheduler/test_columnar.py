@@ -0,0 +1,109 @@
+# Copyright (c) 2015 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""
+Tests For the vectorized filter and weigher paths.
+"""
+
+import random
+
+import mock
+import testtools
+
+from cinder import context
+from cinder.openstack.common.scheduler import weights
+from cinder.scheduler import columnar
+from cinder.scheduler.filters import capacity_filter
+from cinder.scheduler.weights import capacity
+from cinder.scheduler.weights import volume_number
+from cinder import test
+from cinder.tests.scheduler import fakes
+
+
+def _random_host_states(count):
+    rand = random.Random(42)
+    host_states = []
+    for i in xrange(count):
+        total = rand.choice([0, 100, 512, 2048, 'infinite', 'unknown'])
+        free = rand.choice([None, 0, 50, 300, 1024, 'infinite', 'unknown'])
+        host_states.append(fakes.FakeHostState(
+            'host%d@lvm#pool' % i,
+            {'total_capacity_gb': total,
+             'free_capacity_gb': free,
+             'reserved_percentage': rand.choice([0, 5, 10]),
+             'provisioned_capacity_gb': rand.randint(0, 4096),
+             'max_over_subscription_ratio': rand.choice([0.5, 1.0, 1.5,
+                                                         20.0]),
+             'thin_provisioning_support': rand.choice([True, False])}))
+    return host_states
+
+
+@testtools.skipIf(columnar.numpy is None, 'NumPy is not installed')
+class ColumnarTestCase(test.TestCase):
+    def setUp(self):
+        super(ColumnarTestCase, self).setUp()
+        self.host_states = _random_host_states(200)
+        self.weight_handler = weights.HostWeightHandler(
+            'cinder.scheduler.weights')
+
+    def _filter(self, filter_properties):
+        filt = capacity_filter.CapacityFilter()
+        return list(filt.filter_all(iter(self.host_states),
+                                    filter_properties))
+
+    def _weigh(self, weigher_cls, host_states, weight_properties):
+        weighed = self.weight_handler.get_weighed_objects(
+            [weigher_cls], host_states, weight_properties)
+        return [(w.obj.host, w.weight) for w in weighed]
+
+    def test_capacity_filter_matches_scalar(self):
+        for size in (1, 100, 600):
+            filter_properties = {'size': size,
+                                 'vol_exists_on': 'host3@lvm#pool'}
+            expected = self._filter(filter_properties)
+            self.flags(scheduler_vectorize_min_pools=1)
+            self.assertEqual(expected, self._filter(filter_properties))
+            self.flags(scheduler_vectorize_min_pools=0)
+
+    def test_capacity_weigher_matches_scalar(self):
+        host_states = [state for state in self.host_states
+                       if state.free_capacity_gb is not None]
+        for multiplier in (1.0, -1.0, 2.0):
+            self.flags(capacity_weight_multiplier=multiplier)
+            expected = self._weigh(capacity.CapacityWeigher, host_states, {})
+            self.flags(scheduler_vectorize_min_pools=1)
+            self.assertEqual(expected, self._weigh(capacity.CapacityWeigher,
+                                                   host_states, {}))
+            self.flags(scheduler_vectorize_min_pools=0)
+
+    @mock.patch('cinder.db.volume_data_get_for_host')
+    @mock.patch('cinder.db.volume_count_get_by_hosts')
+    def test_volume_number_weigher_matches_scalar(self, _mock_get_by_hosts,
+                                                  _mock_get_for_host):
+        counts = dict((state.host, i % 7)
+                      for i, state in enumerate(self.host_states))
+        _mock_get_for_host.side_effect = (
+            lambda context, host, count_only: counts[host])
+        _mock_get_by_hosts.return_value = counts
+        weight_properties = {'context': context.get_admin_context()}
+
+        expected = self._weigh(volume_number.VolumeNumberWeigher,
+                               self.host_states, weight_properties)
+        self.flags(scheduler_vectorize_min_pools=1)
+        self.assertEqual(expected,
+                         self._weigh(volume_number.VolumeNumberWeigher,
+                                     self.host_states, weight_properties))
+        self.assertEqual(1, _mock_get_by_hosts.call_count)
+        self.assertEqual(len(self.host_states),
+                         _mock_get_for_host.call_count)
@@ -162,6 +162,62 @@ class FilterSchedulerTestCase(test_scheduler.SchedulerTestCase):
         self.assertIsNotNone(weighed_host.obj)
         self.assertTrue(_mock_service_get_all_by_topic.called)
 
+    def test_schedule_create_volumes_no_hosts(self):
+        sched = fakes.FakeFilterScheduler()
+
+        fake_context = context.RequestContext('user', 'project')
+        request_spec = {'volume_properties': {'project_id': 1,
+                                              'size': 1},
+                        'volume_type': {'name': 'LVM_iSCSI'},
+                        'snapshot_id': None,
+                        'image_id': None}
+        unplaced = sched.schedule_create_volumes(fake_context, request_spec,
+                                                 {}, ['fake-id1', 'fake-id2'])
+        self.assertEqual(['fake-id1', 'fake-id2'], unplaced)
+
+    @mock.patch('cinder.scheduler.driver.volume_update_db')
+    @mock.patch('cinder.db.service_get_all_by_topic')
+    def test_schedule_create_volumes(self, _mock_service_get_all_by_topic,
+                                     _mock_volume_update_db):
+        # A batch is placed with one filter pass, consuming capacity on the
+        # chosen host between placements.
+        sched = fakes.FakeFilterScheduler()
+        sched.host_manager = fakes.FakeHostManager()
+        sched.volume_rpcapi = mock.Mock()
+        fake_context = context.RequestContext('user', 'project',
+                                              is_admin=True)
+        fakes.mock_host_manager_db_calls(_mock_service_get_all_by_topic)
+        _mock_volume_update_db.side_effect = (
+            lambda context, volume_id, host: {'id': volume_id, 'host': host})
+
+        request_spec = {'volume_type': {'name': 'LVM_iSCSI'},
+                        'volume_properties': {'project_id': 1,
+                                              'size': 100},
+                        'snapshot_id': None,
+                        'image_id': None}
+        filter_properties = {}
+        volume_ids = ['fake-id%d' % i for i in xrange(6)]
+        unplaced = sched.schedule_create_volumes(fake_context, request_spec,
+                                                 filter_properties,
+                                                 volume_ids)
+
+        self.assertEqual([], unplaced)
+        self.assertEqual(1, _mock_service_get_all_by_topic.call_count)
+        calls = sched.volume_rpcapi.create_volume.call_args_list
+        self.assertEqual(volume_ids,
+                         [call[0][1]['id'] for call in calls])
+        self.assertEqual(volume_ids,
+                         [call[0][3]['volume_id'] for call in calls])
+        # host2 wins first, after which it no longer has the capacity to
+        # pass the filters and host1 takes over.
+        hosts = [utils.extract_host(call[0][2]) for call in calls]
+        self.assertEqual('host2', hosts[0])
+        self.assertIn('host1', hosts)
+        for call in calls:
+            retry = call[0][4]['retry']
+            self.assertEqual([call[0][2]], retry['hosts'])
+            self.assertNotIn('context', call[0][4])
+
     def test_max_attempts(self):
         self.flags(scheduler_max_attempts=4)
 
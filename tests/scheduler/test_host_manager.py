@@ -259,13 +259,20 @@ class HostManagerTestCase(test.TestCase):
             host = volume_node['host']
             self.assertEqual(host_state_map[host].service, volume_node)
 
+        # Until the next sweep the cached host states are used
+        _mock_service_get_all_by_topic.reset_mock()
+        self.host_manager.get_all_host_states(context)
+        self.assertFalse(_mock_service_get_all_by_topic.called)
+
         # Second test: Now service_is_up returns False for host3
         _mock_service_is_up.reset_mock()
-        _mock_service_is_up.side_effect = [True, True, False, True]
+        _mock_service_is_up.side_effect = [True, True, False, True,
+                                           True, True]
         _mock_service_get_all_by_topic.reset_mock()
         _mock_warning.reset_mock()
 
-        # Get all states, make sure host 3 is reported as down
+        # Sweep and get all states, make sure host 3 is reported as down
+        self.host_manager.sweep_service_states(context)
         self.host_manager.get_all_host_states(context)
         _mock_service_get_all_by_topic.assert_called_with(context,
                                                           topic,
@@ -273,7 +280,11 @@ class HostManagerTestCase(test.TestCase):
         expected = []
         for service in services:
             expected.append(mock.call(service))
-        self.assertEqual(expected, _mock_service_is_up.call_args_list)
+        self.assertEqual(expected, _mock_service_is_up.call_args_list[:4])
+        # The live hosts are checked again when fetched
+        self.assertItemsEqual([mock.call(services[0]),
+                               mock.call(services[1])],
+                              _mock_service_is_up.call_args_list[4:])
         _mock_warning.assert_called_once_with("volume service is down. "
                                               "(host: host3)")
 
@@ -287,6 +298,83 @@ class HostManagerTestCase(test.TestCase):
             self.assertEqual(host_state_map[host].service,
                              volume_node)
 
+    @mock.patch('cinder.db.service_get_all_by_topic')
+    @mock.patch('cinder.utils.service_is_up')
+    def test_get_all_host_states_incremental(self, _mock_service_is_up,
+                                             _mock_service_get_all_by_topic):
+        context = 'fake_context'
+        services = [
+            dict(id=1, host='host1', topic='volume', disabled=False,
+                 availability_zone='zone1', updated_at=timeutils.utcnow()),
+            dict(id=2, host='host2', topic='volume', disabled=False,
+                 availability_zone='zone1', updated_at=timeutils.utcnow()),
+        ]
+        _mock_service_get_all_by_topic.return_value = services
+        _mock_service_is_up.return_value = True
+
+        self.host_manager.update_service_capabilities(
+            'volume', 'host1', dict(volume_backend_name='AAA',
+                                    total_capacity_gb=512,
+                                    free_capacity_gb=200,
+                                    reserved_percentage=0))
+        pools = list(self.host_manager.get_all_host_states(context))
+        self.assertEqual(1, _mock_service_get_all_by_topic.call_count)
+        self.assertEqual(['AAA'], [pool.pool_name for pool in pools])
+
+        # A report from a known host updates its state in place
+        self.host_manager.update_service_capabilities(
+            'volume', 'host1', dict(volume_backend_name='AAA',
+                                    total_capacity_gb=512,
+                                    free_capacity_gb=100,
+                                    reserved_percentage=0))
+        pools = list(self.host_manager.get_all_host_states(context))
+        self.assertEqual(1, _mock_service_get_all_by_topic.call_count)
+        self.assertEqual(100, pools[0].free_capacity_gb)
+        self.assertEqual(services[0],
+                         self.host_manager.host_state_map['host1'].service)
+
+        # A report from a new host triggers a liveness check
+        self.host_manager.update_service_capabilities(
+            'volume', 'host2', dict(volume_backend_name='BBB',
+                                    total_capacity_gb=256,
+                                    free_capacity_gb=100,
+                                    reserved_percentage=0))
+        pools = list(self.host_manager.get_all_host_states(context))
+        self.assertEqual(2, _mock_service_get_all_by_topic.call_count)
+        self.assertEqual(['AAA', 'BBB'],
+                         sorted(pool.pool_name for pool in pools))
+
+    @mock.patch('cinder.db.service_get_all_by_topic')
+    def test_get_all_host_states_stale_heartbeat(
+            self, _mock_service_get_all_by_topic):
+        context = 'fake_context'
+        timeutils.set_time_override()
+        self.addCleanup(timeutils.clear_time_override)
+        services = [
+            dict(id=1, host='host1', topic='volume', disabled=False,
+                 availability_zone='zone1', updated_at=timeutils.utcnow()),
+            dict(id=2, host='host2', topic='volume', disabled=False,
+                 availability_zone='zone1', updated_at=timeutils.utcnow()),
+        ]
+        _mock_service_get_all_by_topic.return_value = services
+        for host in ('host1', 'host2'):
+            self.host_manager.update_service_capabilities(
+                'volume', host, dict(volume_backend_name=host,
+                                     total_capacity_gb=512,
+                                     free_capacity_gb=200,
+                                     reserved_percentage=0))
+        pools = list(self.host_manager.get_all_host_states(context))
+        self.assertEqual(1, _mock_service_get_all_by_topic.call_count)
+        self.assertEqual(['host1', 'host2'],
+                         sorted(pool.pool_name for pool in pools))
+
+        # host2 stops reporting and is dropped before the next sweep is due
+        timeutils.advance_time_seconds(CONF.service_down_time + 1)
+        services[0]['updated_at'] = timeutils.utcnow()
+        pools = list(self.host_manager.get_all_host_states(context))
+        self.assertEqual(2, _mock_service_get_all_by_topic.call_count)
+        self.assertEqual(['host1'], [pool.pool_name for pool in pools])
+
     @mock.patch('cinder.db.service_get_all_by_topic')
     @mock.patch('cinder.utils.service_is_up')
     def test_get_pools(self, _mock_service_is_up,
@@ -19,6 +19,8 @@ Tests for Backup code.
 
 import tempfile
 
+import eventlet
+from eventlet import event
 import mock
 from oslo_config import cfg
 from oslo_log import log as logging
@@ -156,6 +158,7 @@ class BackupTestCase(BaseBackupTest):
         backup3_id = self._create_backup_db_entry(status='deleting')
 
         self.backup_mgr.init_host()
+        self.backup_mgr.jobs.wait()
         vol1 = db.volume_get(self.ctxt, vol1_id)
         self.assertEqual(vol1['status'], 'available')
         vol2 = db.volume_get(self.ctxt, vol2_id)
@@ -170,6 +173,79 @@ class BackupTestCase(BaseBackupTest):
                           self.ctxt,
                           backup3_id)
 
+    @mock.patch('%s.%s' % (CONF.volume_driver, 'restore_backup'))
+    @mock.patch('%s.%s' % (CONF.volume_driver, 'backup_volume'))
+    def test_init_host_resumes_jobs(self, _mock_volume_backup,
+                                    _mock_volume_restore):
+        """Make sure backups and restores whose volumes still wait for them
+        are resumed when backup_manager.init_host() is called
+        """
+        vol1_id = self._create_volume_db_entry()
+        vol2_id = self._create_volume_db_entry(status='restoring-backup')
+        backup1_id = self._create_backup_db_entry(volume_id=vol1_id)
+        backup2_id = self._create_backup_db_entry(status='restoring',
+                                                  volume_id=vol2_id)
+        db.backup_update(self.ctxt, backup2_id,
+                         {'restore_volume_id': vol2_id})
+
+        self.backup_mgr.init_host()
+        self.backup_mgr.jobs.wait()
+        self.assertTrue(_mock_volume_backup.called)
+        self.assertTrue(_mock_volume_restore.called)
+
+        backup1 = db.backup_get(self.ctxt, backup1_id)
+        self.assertEqual('available', backup1['status'])
+        backup2 = db.backup_get(self.ctxt, backup2_id)
+        self.assertEqual('available', backup2['status'])
+        self.assertIsNone(backup2['restore_volume_id'])
+        vol2 = db.volume_get(self.ctxt, vol2_id)
+        self.assertEqual('available', vol2['status'])
+
+    @mock.patch('%s.%s' % (CONF.volume_driver, 'backup_volume'))
+    def test_init_host_cleans_up_resumed_backup(self, _mock_volume_backup):
+        """Make sure what an interrupted backup stored is deleted before
+        the backup is run again
+        """
+        vol_id = self._create_volume_db_entry()
+        backup_id = self._create_backup_db_entry(volume_id=vol_id)
+        db.backup_update(self.ctxt, backup_id,
+                         {'service_metadata': 'partial_backup'})
+        calls = []
+        _mock_volume_backup.side_effect = (
+            lambda *args: calls.append('backup'))
+
+        def fake_delete(backup):
+            self.assertEqual('partial_backup', backup['service_metadata'])
+            calls.append('delete')
+
+        with mock.patch('cinder.tests.backup.fake_service.'
+                        'FakeBackupService.delete', side_effect=fake_delete):
+            self.backup_mgr.init_host()
+            self.backup_mgr.jobs.wait()
+
+        self.assertEqual(['delete', 'backup'], calls)
+        backup = db.backup_get(self.ctxt, backup_id)
+        self.assertEqual('available', backup['status'])
+
+    @mock.patch('%s.%s' % (CONF.volume_driver, 'backup_volume'))
+    def test_init_host_resume_backup_cleanup_error(self,
+                                                   _mock_volume_backup):
+        """Make sure an interrupted backup that can't be cleaned up is
+        reset to error rather than run again
+        """
+        vol_id = self._create_volume_db_entry()
+        backup_id = self._create_backup_db_entry(
+            volume_id=vol_id, display_name='fail_on_delete')
+
+        self.backup_mgr.init_host()
+        self.backup_mgr.jobs.wait()
+
+        self.assertFalse(_mock_volume_backup.called)
+        backup = db.backup_get(self.ctxt, backup_id)
+        self.assertEqual('error', backup['status'])
+        vol = db.volume_get(self.ctxt, vol_id)
+        self.assertEqual('available', vol['status'])
+
     def test_create_backup_with_bad_volume_status(self):
         """Test error handling when creating a backup from a volume
         with a bad status
@@ -200,10 +276,8 @@ class BackupTestCase(BaseBackupTest):
         backup_id = self._create_backup_db_entry(volume_id=vol_id)
 
         _mock_volume_backup.side_effect = FakeBackupException('fake')
-        self.assertRaises(FakeBackupException,
-                          self.backup_mgr.create_backup,
-                          self.ctxt,
-                          backup_id)
+        self.backup_mgr.create_backup(self.ctxt, backup_id)
+        self.backup_mgr.jobs.wait()
         vol = db.volume_get(self.ctxt, vol_id)
         self.assertEqual(vol['status'], 'available')
         backup = db.backup_get(self.ctxt, backup_id)
@@ -218,6 +292,7 @@ class BackupTestCase(BaseBackupTest):
         backup_id = self._create_backup_db_entry(volume_id=vol_id)
 
         self.backup_mgr.create_backup(self.ctxt, backup_id)
+        self.backup_mgr.jobs.wait()
         vol = db.volume_get(self.ctxt, vol_id)
         self.assertEqual(vol['status'], 'available')
         backup = db.backup_get(self.ctxt, backup_id)
@@ -234,6 +309,7 @@ class BackupTestCase(BaseBackupTest):
         backup_id = self._create_backup_db_entry(volume_id=vol_id)
 
         self.backup_mgr.create_backup(self.ctxt, backup_id)
+        self.backup_mgr.jobs.wait()
         self.assertEqual(2, notify.call_count)
 
     def test_restore_backup_with_bad_volume_status(self):
@@ -277,11 +353,8 @@ class BackupTestCase(BaseBackupTest):
                                                  volume_id=vol_id)
 
         _mock_volume_restore.side_effect = FakeBackupException('fake')
-        self.assertRaises(FakeBackupException,
-                          self.backup_mgr.restore_backup,
-                          self.ctxt,
-                          backup_id,
-                          vol_id)
+        self.backup_mgr.restore_backup(self.ctxt, backup_id, vol_id)
+        self.backup_mgr.jobs.wait()
         vol = db.volume_get(self.ctxt, vol_id)
         self.assertEqual(vol['status'], 'error_restoring')
         backup = db.backup_get(self.ctxt, backup_id)
@@ -319,6 +392,7 @@ class BackupTestCase(BaseBackupTest):
                                                  volume_id=vol_id)
 
         self.backup_mgr.restore_backup(self.ctxt, backup_id, vol_id)
+        self.backup_mgr.jobs.wait()
         vol = db.volume_get(self.ctxt, vol_id)
         self.assertEqual(vol['status'], 'available')
         backup = db.backup_get(self.ctxt, backup_id)
@@ -336,6 +410,7 @@ class BackupTestCase(BaseBackupTest):
                                                  volume_id=vol_id)
 
         self.backup_mgr.restore_backup(self.ctxt, backup_id, vol_id)
+        self.backup_mgr.jobs.wait()
         self.assertEqual(2, notify.call_count)
 
     def test_delete_backup_with_bad_backup_status(self):
@@ -417,6 +492,13 @@ class BackupTestCase(BaseBackupTest):
         self.backup_mgr.delete_backup(self.ctxt, backup_id)
         self.assertEqual(2, notify.call_count)
 
+    @mock.patch('cinder.rpc.get_notifier')
+    def test_report_backup_jobs(self, mock_get_notifier):
+        """Test the notification of the backup job queue depth."""
+        self.backup_mgr._report_backup_jobs(self.ctxt)
+        mock_get_notifier.return_value.info.assert_called_once_with(
+            self.ctxt, 'backup.jobs.stats', self.backup_mgr.jobs.stats())
+
     def test_list_backup(self):
         backups = db.backup_get_all_by_project(self.ctxt, 'project1')
         self.assertEqual(len(backups), 0)
@@ -728,3 +810,73 @@ class BackupTestCaseWithVerify(BaseBackupTest):
                                      'error')
         backup = db.backup_get(self.ctxt, backup['id'])
         self.assertEqual(backup['status'], 'error')
+
+
+class BackupJobSchedulerTestCase(test.TestCase):
+    """Test Case for the backup job scheduler."""
+
+    def setUp(self):
+        super(BackupJobSchedulerTestCase, self).setUp()
+        self.started = []
+        self.events = {}
+
+    def _job(self, name):
+        self.started.append(name)
+        self.events.setdefault(name, event.Event()).wait()
+
+    def _finish(self, name):
+        self.events.setdefault(name, event.Event()).send()
+
+    def test_limits(self):
+        jobs = manager.BackupJobScheduler(1, 2)
+        jobs.submit('a', 'project', 'backend1', 'target', self._job, 'a')
+        jobs.submit('b', 'project', 'backend1', 'target', self._job, 'b')
+        jobs.submit('c', 'project', 'backend2', 'target', self._job, 'c')
+        jobs.submit('d', 'project', 'backend3', 'target', self._job, 'd')
+        eventlet.sleep(0)
+
+        self.assertEqual(['a', 'c'], self.started)
+        stats = jobs.stats()
+        self.assertEqual(2, stats['queued'])
+        self.assertEqual(2, stats['running'])
+        self.assertEqual({'backend1': 1, 'backend2': 1},
+                         stats['running_by_backend'])
+        self.assertEqual({'target': 2}, stats['running_by_target'])
+
+        for name in 'abcd':
+            self._finish(name)
+        jobs.wait()
+        self.assertEqual(['a', 'c', 'b', 'd'], self.started)
+        self.assertEqual(0, jobs.stats()['queued'])
+        self.assertEqual(0, jobs.stats()['running'])
+
+    def test_projects_take_turns(self):
+        jobs = manager.BackupJobScheduler(1, 1)
+        for name in ('p1-1', 'p1-2', 'p1-3'):
+            jobs.submit(name, 'p1', 'backend', 'target', self._job, name)
+        jobs.submit('p2-1', 'p2', 'backend', 'target', self._job, 'p2-1')
+        self.assertEqual({'p1': 2, 'p2': 1},
+                         jobs.stats()['queued_by_project'])
+
+        for name in ('p1-1', 'p1-2', 'p1-3', 'p2-1'):
+            self._finish(name)
+        jobs.wait()
+        self.assertEqual(['p1-1', 'p2-1', 'p1-2', 'p1-3'], self.started)
+
+    def test_submit_queued_job(self):
+        jobs = manager.BackupJobScheduler(1, 1)
+        jobs.submit('a', 'project', 'backend', 'target', self._job, 'a')
+        jobs.submit('a', 'project', 'backend', 'target', self._job, 'a')
+        self._finish('a')
+        jobs.wait()
+        self.assertEqual(['a'], self.started)
+
+    def test_failed_job(self):
+        jobs = manager.BackupJobScheduler(1, 1)
+        job = mock.Mock(side_effect=FakeBackupException('fake'))
+        jobs.submit('a', 'project', 'backend', 'target', job)
+        jobs.submit('b', 'project', 'backend', 'target', self._job, 'b')
+        self._finish('b')
+        jobs.wait()
+        self.assertTrue(job.called)
+        self.assertEqual(['b'], self.started)
@@ -23,6 +23,7 @@ import mock
 from oslo_concurrency import processutils
 from oslo_log import log as logging
 from oslo_serialization import jsonutils
+from oslo_utils import units
 import six
 
 from cinder.backup import driver
@@ -356,6 +357,54 @@ class BackupCephTestCase(test.TestCase):
             # Ensure the files are equal
             self.assertEqual(checksum.digest(), self.checksum.digest())
 
+    @common_mocks
+    def test_transfer_data_sparse(self):
+        self.service.chunk_size = self.chunk_size
+        src = six.StringIO('a' * self.chunk_size + '\0' * self.chunk_size +
+                           'b' * self.chunk_size)
+        progress = mock.Mock()
+
+        rbd_io = self._get_wrapped_rbd_io(self.service.rbd.Image())
+        self.service._transfer_data(src, 'src_foo', rbd_io, 'dest_foo',
+                                    3 * self.chunk_size, sparse=True,
+                                    progress=progress)
+
+        self.assertEqual([mock.call('a' * self.chunk_size, 0),
+                          mock.call('b' * self.chunk_size,
+                                    2 * self.chunk_size)],
+                         self.service.rbd.Image.return_value.write.mock_calls)
+        self.assertEqual([1, 2, 3], [c[0][0] // self.chunk_size
+                                     for c in progress.call_args_list])
+
+    @common_mocks
+    def test_transfer_data_read_error(self):
+        self.service.chunk_size = self.chunk_size
+        src = mock.Mock()
+        src.read.side_effect = ['a' * self.chunk_size, IOError]
+        dest = mock.Mock()
+
+        self.assertRaises(IOError, self.service._transfer_data, src,
+                          'src_foo', dest, 'dest_foo', 3 * self.chunk_size)
+        dest.write.assert_called_once_with('a' * self.chunk_size)
+
+    @common_mocks
+    @mock.patch.object(ceph.volume_utils, 'notify_about_backup_usage')
+    def test_backup_progress(self, mock_notify):
+        self.flags(backup_object_number_per_notification=2)
+        self.service.chunk_size = self.chunk_size
+        progress = self.service._backup_progress(self.backup,
+                                                 5 * self.chunk_size)
+        for chunk in xrange(1, 6):
+            progress(chunk * self.chunk_size, 1.234)
+
+        self.assertEqual([40, 80, 100],
+                         [c[1]['extra_usage_info']['backup_percent']
+                          for c in mock_notify.call_args_list])
+        mock_notify.assert_called_with(
+            self.ctxt, self.backup, 'createprogress',
+            extra_usage_info={'backup_percent': 100,
+                              'transfer_rate_mbps': 1.23})
+
     @common_mocks
     def test_backup_volume_from_file(self):
         checksum = hashlib.sha256()
@@ -394,6 +443,7 @@ class BackupCephTestCase(test.TestCase):
     @mock.patch('fcntl.fcntl', spec=True)
     @mock.patch('subprocess.Popen', spec=True)
     def test_backup_volume_from_rbd(self, mock_popen, mock_fnctl):
+        self.flags(backup_ceph_native_diff_transfer=False)
         backup_name = self.service._get_backup_base_name(self.backup_id,
                                                          diff_format=True)
 
@@ -908,6 +958,65 @@ class BackupCephTestCase(test.TestCase):
         self.assertEqual(self.callstack, ['popen_init', 'popen_init',
                                           'stdout_close', 'communicate'])
 
+    @common_mocks
+    @mock.patch('cinder.backup.drivers.ceph.tpool')
+    def test_copy_rbd_diff(self, mock_tpool):
+        mock_tpool.execute.side_effect = lambda func, *args: func(*args)
+        src_image = mock.Mock()
+        src_image.size.return_value = 10 * units.Mi
+        src_image.read.side_effect = lambda offset, length: 'x' * length
+
+        def diff_iterate(offset, length, from_snap, iter_cb):
+            self.assertEqual((0, 10 * units.Mi, 'snap1'),
+                             (offset, length, from_snap))
+            iter_cb(0, 5 * units.Mi, True)
+            iter_cb(8 * units.Mi, units.Mi, False)
+
+        src_image.diff_iterate.side_effect = diff_iterate
+        dest_image = mock.Mock()
+        dest_image.size.return_value = 5 * units.Mi
+        dest_image.list_snaps.return_value = [{'name': 'snap1'}]
+
+        self.service._copy_rbd_diff(src_image, dest_image, src_snap='snap2',
+                                    from_snap='snap1')
+
+        dest_image.resize.assert_called_once_with(10 * units.Mi)
+        self.assertEqual([mock.call('x' * 4 * units.Mi, 0),
+                          mock.call('x' * units.Mi, 4 * units.Mi)],
+                         dest_image.write.call_args_list)
+        dest_image.discard.assert_called_once_with(8 * units.Mi, units.Mi)
+        dest_image.create_snap.assert_called_once_with('snap2')
+
+    @common_mocks
+    def test_copy_rbd_diff_from_snap_missing(self):
+        dest_image = mock.Mock()
+        dest_image.list_snaps.return_value = []
+
+        self.assertRaises(exception.BackupRBDOperationFailed,
+                          self.service._copy_rbd_diff, mock.Mock(),
+                          dest_image, src_snap='snap2', from_snap='snap1')
+        self.assertFalse(dest_image.write.called)
+
+    @common_mocks
+    def test_rbd_diff_transfer_native(self):
+        self.mock_rbd.Error = MockException
+        self.mock_rados.Error = MockException
+        with mock.patch.object(self.service, '_open_rbd_image'), \
+                mock.patch.object(self.service,
+                                  '_copy_rbd_diff') as mock_copy:
+            self.service._rbd_diff_transfer('src', 'pool_src', 'dest',
+                                            'pool_dest', 'user_src',
+                                            'conf_src', 'user_dest',
+                                            'conf_dest', src_snap='snap2',
+                                            from_snap='snap1')
+            self.assertEqual('snap1', mock_copy.call_args[1]['from_snap'])
+
+            mock_copy.side_effect = MockException
+            self.assertRaises(exception.BackupRBDOperationFailed,
+                              self.service._rbd_diff_transfer, 'src',
+                              'pool_src', 'dest', 'pool_dest', 'user_src',
+                              'conf_src', 'user_dest', 'conf_dest')
+
     @common_mocks
     def test_restore_metdata(self):
         version = 2
@@ -25,6 +25,7 @@ import shutil
 import tempfile
 import zlib
 
+import eventlet
 import mock
 from oslo_config import cfg
 from oslo_log import log as logging
@@ -54,6 +55,42 @@ def fake_md5(arg):
     return ret
 
 
+class ExclusiveSwiftConnection(fake_swift_client2.FakeSwiftConnection2):
+    """Fails requests made while the connection serves another one."""
+
+    in_flight = 0
+    max_in_flight = 0
+
+    def __init__(self, *args, **kwargs):
+        super(ExclusiveSwiftConnection, self).__init__(*args, **kwargs)
+        self.busy = False
+
+    def _request(self, func, *args, **kwargs):
+        if self.busy:
+            raise AssertionError('concurrent request on a swift connection')
+        cls = ExclusiveSwiftConnection
+        self.busy = True
+        cls.in_flight += 1
+        cls.max_in_flight = max(cls.max_in_flight, cls.in_flight)
+        try:
+            # Let other greenthreads make requests meanwhile
+            eventlet.sleep(0)
+            return func(*args, **kwargs)
+        finally:
+            cls.in_flight -= 1
+            self.busy = False
+
+    def put_object(self, *args, **kwargs):
+        return self._request(
+            super(ExclusiveSwiftConnection, self).put_object,
+            *args, **kwargs)
+
+    def get_object(self, *args, **kwargs):
+        return self._request(
+            super(ExclusiveSwiftConnection, self).get_object,
+            *args, **kwargs)
+
+
 class BackupSwiftTestCase(test.TestCase):
     """Test Case for swift."""
 
@@ -146,6 +183,27 @@ class BackupSwiftTestCase(test.TestCase):
         backup = db.backup_get(self.ctxt, 123)
         service.backup(backup, self.volume_file)
 
+    def test_backup_pipelined(self):
+        self.flags(backup_swift_object_size=8 * 1024)
+        self.flags(backup_swift_block_size=1024)
+        self.flags(backup_pipeline_workers=2,
+                   backup_pipeline_writers=3,
+                   backup_pipeline_max_chunks=4)
+        self.stubs.Set(swift, 'Connection', ExclusiveSwiftConnection)
+        self.stubs.Set(ExclusiveSwiftConnection, 'max_in_flight', 0)
+
+        container_name = self.temp_dir.replace(tempfile.gettempdir() + '/',
+                                               '', 1)
+        self._create_backup_db_entry(container=container_name)
+        service = swift_dr.SwiftBackupDriver(self.ctxt)
+        self.volume_file.seek(0)
+        backup = db.backup_get(self.ctxt, 123)
+        service.backup(backup, self.volume_file)
+
+        backup = db.backup_get(self.ctxt, 123)
+        self.assertEqual(16, backup['object_count'])
+        self.assertLessEqual(len(service._idle_conns), 3)
+
     def test_backup_default_container(self):
         self._create_backup_db_entry(container=None)
         service = swift_dr.SwiftBackupDriver(self.ctxt)
@@ -515,6 +573,30 @@ class BackupSwiftTestCase(test.TestCase):
             self.assertTrue(filecmp.cmp(self.volume_file.name,
                             restored_file.name))
 
+    def test_restore_prefetch(self):
+        self.flags(backup_swift_object_size=8 * 1024)
+        self.flags(backup_swift_block_size=1024)
+        self.flags(backup_restore_prefetch=3)
+        self.stubs.Set(swift, 'Connection', ExclusiveSwiftConnection)
+        self.stubs.Set(ExclusiveSwiftConnection, 'max_in_flight', 0)
+
+        container_name = self.temp_dir.replace(tempfile.gettempdir() + '/',
+                                               '', 1)
+        self._create_backup_db_entry(container=container_name)
+        service = swift_dr.SwiftBackupDriver(self.ctxt)
+        self.volume_file.seek(0)
+        backup = db.backup_get(self.ctxt, 123)
+        service.backup(backup, self.volume_file)
+
+        with tempfile.NamedTemporaryFile() as restored_file:
+            backup = db.backup_get(self.ctxt, 123)
+            service.restore(backup, '1234-5678-1234-8888',
+                            restored_file)
+            self.assertTrue(filecmp.cmp(self.volume_file.name,
+                            restored_file.name))
+        # The objects were fetched concurrently, each on its own connection
+        self.assertEqual(3, ExclusiveSwiftConnection.max_in_flight)
+
     def test_restore_wraps_socket_error(self):
         container_name = 'socket_error_on_get'
         self._create_backup_db_entry(container=container_name)
@@ -546,6 +628,7 @@ class BackupSwiftTestCase(test.TestCase):
     def test_delete_wraps_socket_error(self):
         container_name = 'socket_error_on_delete'
         self._create_backup_db_entry(container=container_name)
+        db.backup_update(self.ctxt, 123, {'service_metadata': 'backup_123'})
         service = swift_dr.SwiftBackupDriver(self.ctxt)
         backup = db.backup_get(self.ctxt, 123)
         self.assertRaises(exception.SwiftConnectionFailed,
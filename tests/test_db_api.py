@@ -348,6 +348,40 @@ class DBAPIVolumeTestCase(BaseTest):
         self._assertEqualListsOfObjects(volumes[2:], db.volume_get_all(
                                         self.ctxt, 2, 2, ['id'], ['asc']))
 
+    def test_volume_get_all_loads_relationships(self):
+        for i in xrange(3):
+            db.volume_create(self.ctxt, {'id': str(i),
+                                         'metadata': {'a': str(i),
+                                                      'b': 'c'}})
+        volumes = db.volume_get_all(self.ctxt, '1', 2, ['id'], ['asc'])
+        self.assertEqual(['2'], [volume['id'] for volume in volumes])
+        # Relationships must be usable once the session is gone
+        self.assertEqual({'a': '2', 'b': 'c'},
+                         dict((item['key'], item['value'])
+                              for item in volumes[0]['volume_metadata']))
+        self.assertEqual([], volumes[0]['volume_attachment'])
+
+    def test_volume_get_all_fields(self):
+        for i in xrange(3):
+            db.volume_create(self.ctxt, {'id': str(i), 'project_id': 'p1',
+                                         'display_name': 'vol%d' % i,
+                                         'metadata': {'a': 'b'}})
+
+        volumes = db.volume_get_all(self.ctxt, None, None, ['id'], ['asc'],
+                                    fields=['id', 'display_name'])
+        self.assertEqual([{'id': '0', 'display_name': 'vol0'},
+                          {'id': '1', 'display_name': 'vol1'},
+                          {'id': '2', 'display_name': 'vol2'}], volumes)
+        volumes = db.volume_get_all_by_project(
+            self.ctxt, 'p1', '0', 1, ['id'], ['asc'],
+            filters={'display_name': ['vol1', 'vol2']},
+            fields=['id', 'display_name'])
+        self.assertEqual([{'id': '1', 'display_name': 'vol1'}], volumes)
+        for fields in (['id', 'fake'], ['id', 'volume_metadata'],
+                       ['id', 'name']):
+            self.assertRaises(exception.InvalidInput, db.volume_get_all,
+                              self.ctxt, None, None, fields=fields)
+
     def test_volume_get_all_by_host(self):
         volumes = []
         for i in xrange(3):
@@ -945,6 +979,76 @@ class DBAPISnapshotTestCase(BaseTest):
                                         db.snapshot_get_all(self.ctxt),
                                         ignored_keys=['metadata', 'volume'])
 
+    def test_snapshot_get_all_by_filter(self):
+        db.volume_create(self.ctxt, {'id': 1})
+        db.volume_create(self.ctxt, {'id': 2})
+        snapshot1 = db.snapshot_create(self.ctxt, {'id': 1, 'volume_id': 1,
+                                                   'status': 'available'})
+        snapshot2 = db.snapshot_create(self.ctxt, {'id': 2, 'volume_id': 2,
+                                                   'status': 'error'})
+        snapshot3 = db.snapshot_create(self.ctxt, {'id': 3, 'volume_id': 2,
+                                                   'status': 'available'})
+
+        self._assertEqualListsOfObjects(
+            [snapshot3, snapshot1],
+            db.snapshot_get_all(self.ctxt, filters={'status': 'available'}),
+            ignored_keys=['metadata', 'volume'])
+        self._assertEqualListsOfObjects(
+            [snapshot3, snapshot2],
+            db.snapshot_get_all(self.ctxt, filters={'volume_id': '2'}),
+            ignored_keys=['metadata', 'volume'])
+        self._assertEqualListsOfObjects(
+            [snapshot3],
+            db.snapshot_get_all(self.ctxt, filters={'volume_id': '2',
+                                                    'status': 'available'}),
+            ignored_keys=['metadata', 'volume'])
+        self._assertEqualListsOfObjects(
+            [snapshot2, snapshot1],
+            db.snapshot_get_all(self.ctxt, filters={'id': ['1', '2']}),
+            ignored_keys=['metadata', 'volume'])
+        # Invalid filter keys match nothing
+        self.assertEqual([], db.snapshot_get_all(self.ctxt,
+                                                 filters={'fake': 'x'}))
+        self.assertEqual([], db.snapshot_get_all(self.ctxt,
+                                                 filters={'volume': 'x'}))
+
+    def test_snapshot_get_all_by_project_paginate(self):
+        db.volume_create(self.ctxt, {'id': 1})
+        snapshots = [db.snapshot_create(self.ctxt,
+                                        {'id': i, 'volume_id': 1,
+                                         'project_id': 'project1'})
+                     for i in xrange(1, 6)]
+        db.snapshot_create(self.ctxt, {'id': 6, 'volume_id': 1,
+                                       'project_id': 'project2'})
+
+        result = db.snapshot_get_all_by_project(self.ctxt, 'project1',
+                                                sort_keys=['id'],
+                                                sort_dirs=['asc'])
+        self._assertEqualListsOfObjects(snapshots, result,
+                                        ignored_keys=['metadata', 'volume'])
+        # Walk the project's snapshots two at a time
+        pages = []
+        marker = None
+        while True:
+            page = db.snapshot_get_all_by_project(self.ctxt, 'project1',
+                                                  marker=marker, limit=2,
+                                                  sort_keys=['id'],
+                                                  sort_dirs=['asc'])
+            if not page:
+                break
+            pages.append([snapshot['id'] for snapshot in page])
+            marker = page[-1]['id']
+        self.assertEqual([['1', '2'], ['3', '4'], ['5']], pages)
+        # An offset skips ahead in the same ordering
+        result = db.snapshot_get_all_by_project(self.ctxt, 'project1',
+                                                limit=2, offset=1,
+                                                sort_keys=['id'],
+                                                sort_dirs=['desc'])
+        self.assertEqual(['4', '3'], [snapshot['id'] for snapshot in result])
+        self.assertRaises(exception.SnapshotNotFound,
+                          db.snapshot_get_all_by_project,
+                          self.ctxt, 'project1', marker='fake')
+
     def test_snapshot_get_by_host(self):
         db.volume_create(self.ctxt, {'id': 1, 'host': 'host1'})
         db.volume_create(self.ctxt, {'id': 2, 'host': 'host2'})
@@ -1193,6 +1297,31 @@ class DBAPIReservationTestCase(BaseTest):
                              self.ctxt,
                              'project1'))
 
+    def test_reservation_commit_deletes_reservations(self):
+        reservations = _quota_reserve(self.ctxt, 'project1')
+        db.reservation_commit(self.ctxt, reservations, 'project1')
+
+        rows = sqlalchemy_api.model_query(
+            self.ctxt, sqlalchemy_api.models.Reservation,
+            read_deleted="yes").\
+            filter(sqlalchemy_api.models.Reservation.uuid.in_(reservations)).\
+            all()
+        self.assertEqual(2, len(rows))
+        for row in rows:
+            self.assertTrue(row.deleted)
+            self.assertIsNotNone(row.deleted_at)
+
+        # Committing again leaves the usages alone
+        db.reservation_commit(self.ctxt, reservations, 'project1')
+        expected = {'project_id': 'project1',
+                    'volumes': {'reserved': 0, 'in_use': 1},
+                    'gigabytes': {'reserved': 0, 'in_use': 2},
+                    }
+        self.assertEqual(expected,
+                         db.quota_usage_get_all_by_project(
+                             self.ctxt,
+                             'project1'))
+
     def test_reservation_rollback(self):
         reservations = _quota_reserve(self.ctxt, 'project1')
         expected = {'project_id': 'project1',
@@ -13,6 +13,10 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import collections
+
+import mock
+
 from cinder import exception
 from cinder.scheduler.evaluator import evaluator
 from cinder import test
@@ -137,3 +141,26 @@ class EvaluatorTestCase(test.TestCase):
         self.assertRaises(exception.EvaluatorParseException,
                           evaluator.evaluate,
                           "7 / 0")
+
+    def test_expression_parsed_once(self):
+        self.stubs.Set(evaluator, '_expressions',
+                       collections.OrderedDict())
+        expression = ("(stats.free_capacity_gb / stats.total_capacity_gb) * "
+                      "100 + capabilities.weight")
+        with mock.patch.object(evaluator, '_parser') as mock_parser:
+            mock_parser.parseString.side_effect = (
+                evaluator._def_parser().parseString)
+            for i in range(500):
+                stats = {'free_capacity_gb': i, 'total_capacity_gb': 1000}
+                capabilities = {'weight': 1}
+                self.assertAlmostEqual(i / 10.0 + 1, evaluator.evaluate(
+                    expression, stats=stats, capabilities=capabilities))
+        self.assertEqual(1, mock_parser.parseString.call_count)
+
+    def test_expression_cache_is_bounded(self):
+        self.stubs.Set(evaluator, '_EXPRESSION_CACHE_SIZE', 2)
+        self.stubs.Set(evaluator, '_expressions',
+                       collections.OrderedDict())
+        for expression in ("1+1", "2+2", "1+1", "3+3"):
+            evaluator.evaluate(expression)
+        self.assertEqual(["1+1", "3+3"], list(evaluator._expressions))
@@ -0,0 +1,55 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Benchmark of the scheduler filter and goodness function evaluator.
+
+This is not run by default.  Set CINDER_EVALUATOR_BENCHMARK to the number
+of hosts to evaluate a goodness function for, for instance 10000, to
+compare parsing the function for every host with the cached parse tree.
+"""
+
+import collections
+
+from cinder.scheduler.evaluator import evaluator
+from cinder import test
+
+
+EXPRESSION = ("stats.free_capacity_gb > 10 ? "
+              "(stats.free_capacity_gb / stats.total_capacity_gb) * 100 + "
+              "capabilities.weight : 0")
+
+
+class EvaluatorBenchmark(test.BenchmarkTestCase):
+    """Times evaluating one goodness function for many hosts."""
+
+    BENCHMARK_ENV = 'CINDER_EVALUATOR_BENCHMARK'
+
+    def setUp(self):
+        super(EvaluatorBenchmark, self).setUp()
+        self.stubs.Set(evaluator, '_expressions', collections.OrderedDict())
+        self.hosts = [{'stats': {'free_capacity_gb': i % 1000,
+                                 'total_capacity_gb': 1000},
+                       'capabilities': {'weight': 1}}
+                      for i in range(self.benchmark_size)]
+
+    def _parse_per_host(self):
+        parser = evaluator._def_parser()
+        return [parser.parseString(EXPRESSION, parseAll=True)[0].eval(host)
+                for host in self.hosts]
+
+    def _evaluate(self):
+        return [evaluator.evaluate(EXPRESSION, **host) for host in self.hosts]
+
+    def test_evaluate(self):
+        parsed = self.timed('parse for every host', self._parse_per_host)
+        cached = self.timed('cached parse tree', self._evaluate)
+        self.assertEqual(parsed, cached)
@@ -0,0 +1,150 @@
+#    Copyright 2013 OpenStack Foundation
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import mock
+
+from cinder import test
+from cinder.volume import configuration as conf
+import cinder.volume.drivers.fh_rbd as driver
+
+
+class MockImageNotFoundException(Exception):
+    """Used as mock for rbd.ImageNotFound."""
+
+
+class FakeImage(object):
+    """Minimal librbd Image backed by a dict of image descriptions."""
+
+    def __init__(self, images, ioctx, name, read_only=False):
+        key = (ioctx.pool, name)
+        if key not in images:
+            raise MockImageNotFoundException()
+        self._desc = images[key]
+        self._snap = None
+
+    def list_snaps(self):
+        return [{'name': snap} for snap in self._desc.get('snaps', {})]
+
+    def parent_info(self):
+        if not self._desc.get('parent'):
+            raise MockImageNotFoundException()
+        return self._desc['parent']
+
+    def set_snap(self, snap):
+        self._snap = snap
+
+    def list_children(self):
+        return self._desc['snaps'][self._snap]
+
+    def close(self):
+        pass
+
+
+class FhRBDCloneGraphTestCase(test.TestCase):
+
+    def setUp(self):
+        super(FhRBDCloneGraphTestCase, self).setUp()
+        self.cfg = mock.Mock(spec=conf.Configuration)
+        self.cfg.rbd_pool = 'volumes'
+        self.cfg.rbd_user = None
+        self.cfg.rbd_ceph_conf = None
+        self.cfg.rbd_clone_graph_cache_ttl = 60
+
+        self.driver = driver.RBDDriver(execute=mock.Mock(),
+                                       configuration=self.cfg)
+        self.driver.rbd = mock.Mock()
+        self.driver.rados = mock.Mock()
+        self.driver.rbd.ImageNotFound = MockImageNotFoundException
+        self.driver.rados.ObjectNotFound = MockImageNotFoundException
+
+        # images -> volume-a@snapshot-1 -> volume-b@snap-b -> vms/x_disk
+        self.images = {
+            ('images', 'img'): {'snaps': {'snap': []}},
+            ('volumes', 'volume-a'): {
+                'parent': ('images', 'img', 'snap'),
+                'snaps': {'snapshot-1': [('volumes', 'volume-b')]}},
+            ('volumes', 'volume-b'): {
+                'parent': ('volumes', 'volume-a', 'snapshot-1'),
+                'snaps': {'snap-b': [('vms', 'x_disk')]}},
+            ('vms', 'x_disk'): {
+                'parent': ('volumes', 'volume-b', 'snap-b')},
+        }
+        self.images[('images', 'img')]['snaps']['snap'] = [
+            ('volumes', 'volume-a')]
+        self.driver.rbd.Image.side_effect = (
+            lambda ioctx, name, read_only=False:
+            FakeImage(self.images, ioctx, name, read_only))
+        self.driver.rbd.RBD.return_value.list.side_effect = (
+            lambda ioctx: [name for pool, name in self.images
+                           if pool == ioctx.pool])
+
+        def _ioctx(pool):
+            ioctx = mock.Mock()
+            ioctx.pool = pool
+            return ioctx
+
+        patcher = mock.patch.object(driver, 'RADOSClient')
+        self.mock_client = patcher.start()
+        self.addCleanup(patcher.stop)
+        client = self.mock_client.return_value.__enter__.return_value
+        client.ioctx = _ioctx('volumes')
+        client.cluster.open_ioctx.side_effect = _ioctx
+
+    def test_build_clone_graph(self):
+        graph = self.driver._build_clone_graph('volumes')
+        self.assertEqual(4, len(graph.snapshots))
+        self.assertEqual(('images', 'img', 'snap'),
+                         graph.get_parent('volumes', 'volume-a'))
+        self.assertEqual([('vms', 'x_disk')],
+                         graph.get_children('volumes', 'volume-b', 'snap-b'))
+        self.assertEqual(1, self.mock_client.call_count)
+
+    def test_volume_clone_chain_uses_single_connection(self):
+        chain = self.driver.get_volume_clone_chain({'id': 'b'})
+        self.assertEqual('img', chain['location']['volume_name'])
+        snap = chain['children'][0]
+        self.assertEqual('snap', snap['location']['snap_name'])
+        volume_a = snap['children'][0]
+        self.assertEqual('volume-a', volume_a['location']['volume_name'])
+        volume_b = volume_a['children'][0]['children'][0]
+        self.assertEqual('volume-b', volume_b['location']['volume_name'])
+        self.assertEqual(
+            'x_disk',
+            volume_b['children'][0]['children'][0]['location']['volume_name'])
+        self.assertEqual(1, self.mock_client.call_count)
+
+        # a second query is served from the cache
+        self.driver.get_volume_clone_chain({'id': 'a'})
+        self.assertEqual(1, self.mock_client.call_count)
+
+    @mock.patch('cinder.volume.drivers.rbd.RBDDriver.delete_snapshot')
+    def test_delete_snapshot_invalidates_clone_graph(self, mock_delete):
+        self.driver.get_volume_clone_chain({'id': 'a'})
+        self.assertTrue(self.driver._clone_graphs)
+        self.driver.delete_snapshot({'id': '1'})
+        self.assertEqual({}, self.driver._clone_graphs)
+        self.driver.get_volume_clone_chain({'id': 'a'})
+        self.assertEqual(2, self.mock_client.call_count)
+
+    def test_clone_graph_cache_disabled(self):
+        self.cfg.rbd_clone_graph_cache_ttl = 0
+        self.assertIsNone(self.driver._get_clone_graph())
+
+    def test_get_volumes_snapshots_uses_single_connection(self):
+        snapshots = self.driver.get_volumes_snapshots(
+            [{'id': 'a'}, {'id': 'b'}, {'id': 'missing'}])
+        self.assertEqual({'a': [{'type': 'volume_snap', 'uuid': '1'}],
+                          'b': [{'type': '', 'uuid': ''}],
+                          'missing': []}, snapshots)
+        self.assertEqual(1, self.mock_client.call_count)
@@ -15,8 +15,11 @@
 #    under the License.
 """Unit tests for image utils."""
 
+import hashlib
 import math
+import os
 
+import fixtures
 import mock
 from oslo_concurrency import processutils
 from oslo_utils import units
@@ -1031,6 +1034,146 @@ class TestFetchToVolumeFormat(test.TestCase):
                                              run_as_root=run_as_root)
 
 
+class TestStreamToVolume(test.TestCase):
+    def setUp(self):
+        super(TestStreamToVolume, self).setUp()
+        tmpdir = self.useFixture(fixtures.TempDir()).path
+        self.flags(image_conversion_dir=tmpdir)
+        self.dest = os.path.join(tmpdir, 'volume')
+        self.data = b'raw image data' * 200000
+        self.image_service = mock.Mock()
+        self.image_service.show.return_value = {
+            'disk_format': 'raw', 'container_format': 'bare',
+            'size': len(self.data),
+            'checksum': hashlib.md5(self.data).hexdigest()}
+
+        def fake_download(context, image_id, data=None):
+            for offset in range(0, len(self.data), 65536):
+                data.write(self.data[offset:offset + 65536])
+        self.image_service.download.side_effect = fake_download
+
+    @mock.patch('cinder.image.image_utils.fetch')
+    @mock.patch('cinder.image.image_utils.qemu_img_info')
+    def test_stream_raw_image(self, mock_info, mock_fetch):
+        mock_info.return_value.file_format = 'raw'
+        mock_info.return_value.backing_file = None
+
+        image_utils.fetch_to_volume_format(
+            mock.sentinel.context, self.image_service, mock.sentinel.image_id,
+            self.dest, 'raw', '1M', size=1, run_as_root=False)
+
+        self.assertFalse(mock_fetch.called)
+        self.assertEqual(1, mock_info.call_count)
+        with open(self.dest, 'rb') as f:
+            self.assertEqual(self.data, f.read())
+
+    @mock.patch('cinder.image.image_utils.qemu_img_info')
+    def test_stream_checksum_mismatch(self, mock_info):
+        mock_info.return_value.file_format = 'raw'
+        mock_info.return_value.backing_file = None
+        self.image_service.show.return_value['checksum'] = 'bad'
+
+        self.assertRaises(exception.ImageUnacceptable,
+                          image_utils.fetch_to_volume_format,
+                          mock.sentinel.context, self.image_service,
+                          mock.sentinel.image_id, self.dest, 'raw', '1M',
+                          run_as_root=False)
+
+    @mock.patch('cinder.image.image_utils.convert_image')
+    @mock.patch('cinder.image.image_utils.fetch')
+    @mock.patch('cinder.image.image_utils.qemu_img_info')
+    def test_stream_not_raw(self, mock_info, mock_fetch, mock_convert):
+        probe_data = mock.Mock(file_format='qcow2', backing_file=None)
+        data = mock.Mock(file_format='raw', backing_file=None,
+                         virtual_size=1)
+        mock_info.side_effect = [probe_data, data, data, data]
+
+        image_utils.fetch_to_volume_format(
+            mock.sentinel.context, self.image_service, mock.sentinel.image_id,
+            self.dest, 'raw', '1M', run_as_root=False)
+
+        # Nothing was written, the image went through qemu-img convert
+        self.assertFalse(os.path.exists(self.dest))
+        self.assertTrue(mock_fetch.called)
+        mock_convert.assert_called_once_with(mock.ANY, self.dest, 'raw',
+                                             run_as_root=False)
+
+    @mock.patch('cinder.image.image_utils.convert_image')
+    @mock.patch('cinder.image.image_utils.fetch')
+    @mock.patch('cinder.image.image_utils.qemu_img_info')
+    def test_stream_probe_error(self, mock_info, mock_fetch, mock_convert):
+        data = mock.Mock(file_format='raw', backing_file=None,
+                         virtual_size=1)
+        mock_info.side_effect = [processutils.ProcessExecutionError,
+                                 data, data, data]
+
+        image_utils.fetch_to_volume_format(
+            mock.sentinel.context, self.image_service, mock.sentinel.image_id,
+            self.dest, 'raw', '1M', run_as_root=False)
+
+        # A header qemu-img can't read is not streamed as raw
+        self.assertFalse(os.path.exists(self.dest))
+        self.assertTrue(mock_fetch.called)
+        mock_convert.assert_called_once_with(mock.ANY, self.dest, 'raw',
+                                             run_as_root=False)
+
+    @mock.patch('cinder.image.image_utils._stream_to_volume')
+    @mock.patch('cinder.image.image_utils.fetch')
+    @mock.patch('cinder.image.image_utils.qemu_img_info')
+    def test_stream_disabled(self, mock_info, mock_fetch, mock_stream):
+        self.flags(image_stream_to_volume=False)
+        mock_info.return_value.file_format = 'raw'
+        mock_info.return_value.backing_file = None
+        mock_info.return_value.virtual_size = 1
+
+        with mock.patch('cinder.image.image_utils.convert_image'):
+            image_utils.fetch_to_volume_format(
+                mock.sentinel.context, self.image_service,
+                mock.sentinel.image_id, self.dest, 'raw', '1M',
+                run_as_root=False)
+
+        self.assertFalse(mock_stream.called)
+        self.assertTrue(mock_fetch.called)
+
+    @mock.patch('cinder.image.image_utils._stream_to_volume')
+    @mock.patch('cinder.image.image_utils.fetch')
+    @mock.patch('cinder.image.image_utils.qemu_img_info')
+    def test_stream_throttled(self, mock_info, mock_fetch, mock_stream):
+        throttling.Throttle.set_default(throttling.Throttle(prefix=['cgcmd']))
+        self.addCleanup(throttling.Throttle.set_default, None)
+        mock_info.return_value.file_format = 'raw'
+        mock_info.return_value.backing_file = None
+        mock_info.return_value.virtual_size = 1
+
+        with mock.patch('cinder.image.image_utils.convert_image'):
+            image_utils.fetch_to_volume_format(
+                mock.sentinel.context, self.image_service,
+                mock.sentinel.image_id, self.dest, 'raw', '1M',
+                run_as_root=False)
+
+        # Only the temporary file path runs the throttled sub-commands
+        self.assertFalse(mock_stream.called)
+        self.assertTrue(mock_fetch.called)
+
+    @mock.patch('cinder.image.image_utils.eventlet.sleep')
+    @mock.patch('cinder.image.image_utils.qemu_img_info')
+    def test_stream_bps_limit(self, mock_info, mock_sleep):
+        mock_info.return_value.file_format = 'raw'
+        mock_info.return_value.backing_file = None
+
+        with mock.patch.object(throttling.Throttle, 'get_bps_limit',
+                               return_value=1024 * 1024):
+            image_utils.fetch_to_volume_format(
+                mock.sentinel.context, self.image_service,
+                mock.sentinel.image_id, self.dest, 'raw', '1M', size=1,
+                run_as_root=False)
+
+        # Writing 2.8 MB at 1 MB/s is held back after each buffer
+        self.assertTrue(mock_sleep.called)
+        with open(self.dest, 'rb') as f:
+            self.assertEqual(self.data, f.read())
+
+
 class TestXenserverUtils(test.TestCase):
     @mock.patch('cinder.image.image_utils.is_xenserver_format')
     def test_is_xenserver_image(self, mock_format):
@@ -817,6 +817,15 @@ class MigrationsMixin(test_migrations.WalkVersionsMixin):
         services = db_utils.get_table(engine, 'services')
         self.assertNotIn('modified_at', services.c)
 
+    def _check_042(self, engine, data):
+        backups = db_utils.get_table(engine, 'backups')
+        self.assertIsInstance(backups.c.restore_volume_id.type,
+                              sqlalchemy.types.VARCHAR)
+
+    def _post_downgrade_042(self, engine):
+        backups = db_utils.get_table(engine, 'backups')
+        self.assertNotIn('restore_volume_id', backups.c)
+
     def test_walk_versions(self):
         self.walk_versions(True, False)
 
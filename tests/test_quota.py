@@ -32,6 +32,7 @@ from cinder import quota
 from cinder import test
 import cinder.tests.image.fake
 from cinder import volume
+from cinder.volume import volume_types
 
 
 CONF = cfg.CONF
@@ -797,6 +798,44 @@ class VolumeTypeQuotaEngineTestCase(test.TestCase):
         db.volume_type_destroy(ctx, vtype['id'])
         db.volume_type_destroy(ctx, vtype2['id'])
 
+    @mock.patch('cinder.quota.time')
+    def test_resources_cached(self, mock_time):
+        self.flags(quota_resources_cache_ttl=60)
+        mock_time.time.return_value = 1000
+        ctx = context.get_admin_context()
+        engine = quota.VolumeTypeQuotaEngine()
+        self.stubs.Set(quota, 'QUOTAS', engine)
+
+        with mock.patch.object(db, 'volume_type_get_all',
+                               wraps=db.volume_type_get_all) as mock_vtga:
+            self.assertNotIn('volumes_type1', engine)
+            self.assertNotIn('volumes_type1', engine.resources)
+            self.assertEqual(1, mock_vtga.call_count)
+
+            # Changes made through volume_types refresh the cache
+            vtype = volume_types.create(ctx, 'type1')
+            self.assertIn('volumes_type1', engine)
+            volume_types.update(ctx, vtype['id'], 'type2', None)
+            self.assertIn('volumes_type2', engine)
+            self.assertNotIn('volumes_type1', engine)
+            self.assertEqual(3, mock_vtga.call_count)
+
+            # Changes made elsewhere are seen once the cache expires
+            db.volume_type_destroy(ctx, vtype['id'])
+            self.assertIn('volumes_type2', engine)
+            mock_time.time.return_value = 1060
+            self.assertNotIn('volumes_type2', engine)
+            self.assertEqual(4, mock_vtga.call_count)
+
+    def test_resources_not_cached(self):
+        self.flags(quota_resources_cache_ttl=0)
+        engine = quota.VolumeTypeQuotaEngine()
+        with mock.patch.object(db, 'volume_type_get_all',
+                               return_value={}) as mock_vtga:
+            engine.resources
+            engine.resources
+        self.assertEqual(2, mock_vtga.call_count)
+
 
 class DbQuotaDriverTestCase(test.TestCase):
     def setUp(self):
@@ -1096,7 +1135,8 @@ class DbQuotaDriverTestCase(test.TestCase):
 
     def _stub_quota_reserve(self):
         def fake_quota_reserve(context, resources, quotas, deltas, expire,
-                               until_refresh, max_age, project_id=None):
+                               until_refresh, max_age, project_id=None,
+                               async_refresh=False):
             self.calls.append(('quota_reserve', expire, until_refresh,
                                max_age))
             return ['resv-1', 'resv-2', 'resv-3']
@@ -1258,8 +1298,10 @@ class QuotaReserveSqlAlchemyTestCase(test.TestCase):
         def fake_get_session():
             return FakeSession()
 
-        def fake_get_quota_usages(context, session, project_id):
-            return self.usages.copy()
+        def fake_get_quota_usages(context, session, project_id,
+                                  resources=None):
+            return dict((k, v) for k, v in self.usages.items()
+                        if resources is None or k in resources)
 
         def fake_quota_usage_create(context, project_id, resource, in_use,
                                     reserved, until_refresh, session=None,
@@ -1457,6 +1499,54 @@ class QuotaReserveSqlAlchemyTestCase(test.TestCase):
                                        usage_id=self.usages['gigabytes'],
                                        delta=2 * 1024), ])
 
+    @mock.patch.object(sqa_api.greenthread, 'spawn_n')
+    def test_quota_reserve_until_refresh_async(self, mock_spawn):
+        self.init_usage('test_project', 'volumes', 3, 0, until_refresh=1)
+        self.init_usage('test_project', 'gigabytes', 3, 0, until_refresh=1)
+        context = FakeContext('test_project', 'test_class')
+        quotas = dict(volumes=5, gigabytes=10 * 1024, )
+        deltas = dict(volumes=2, gigabytes=2 * 1024, )
+        result = sqa_api.quota_reserve(context, self.resources, quotas,
+                                       deltas, self.expire, 5, 0,
+                                       async_refresh=True)
+
+        self.assertEqual(self.sync_called, set())
+        self.compare_usage(self.usages, [dict(resource='volumes',
+                                              project_id='test_project',
+                                              in_use=3,
+                                              reserved=2,
+                                              until_refresh=5),
+                                         dict(resource='gigabytes',
+                                              project_id='test_project',
+                                              in_use=3,
+                                              reserved=2 * 1024,
+                                              until_refresh=5), ])
+        self.assertEqual(self.usages_created, {})
+        self.assertEqual(2, len(result))
+        mock_spawn.assert_called_once_with(
+            sqa_api._quota_usage_refresh, mock.ANY, 'test_project',
+            self.resources, set(['volumes', 'gigabytes']), 5)
+
+        # The deferred refresh runs the syncs it was handed
+        sqa_api._quota_usage_refresh(context.elevated(), 'test_project',
+                                     self.resources, set(['volumes']), 5)
+        self.assertEqual(self.sync_called, set(['volumes']))
+        self.assertEqual(2, self.usages['volumes'].in_use)
+
+    @mock.patch.object(sqa_api.greenthread, 'spawn_n')
+    def test_quota_reserve_negative_in_use_async(self, mock_spawn):
+        self.init_usage('test_project', 'volumes', -1, 0, until_refresh=1)
+        self.init_usage('test_project', 'gigabytes', -1, 0, until_refresh=1)
+        context = FakeContext('test_project', 'test_class')
+        quotas = dict(volumes=5, gigabytes=10 * 1024, )
+        deltas = dict(volumes=2, gigabytes=2 * 1024, )
+        sqa_api.quota_reserve(context, self.resources, quotas, deltas,
+                              self.expire, 5, 0, async_refresh=True)
+
+        # Desynced usages are always healed before reserving
+        self.assertEqual(self.sync_called, set(['volumes', 'gigabytes']))
+        self.assertFalse(mock_spawn.called)
+
     def test_quota_reserve_max_age(self):
         max_age = 3600
         record_created = (timeutils.utcnow() -
@@ -140,6 +140,10 @@ class RBDTestCase(test.TestCase):
         self.cfg.rbd_user = None
         self.cfg.volume_dd_blocksize = '1M'
         self.cfg.rbd_store_chunk_size = 4
+        self.cfg.rados_connect_timeout = -1
+        self.cfg.rados_connection_pool_size = 4
+        self.cfg.rados_connection_idle_timeout = 300
+        self.cfg.rados_connection_health_check_interval = 60
 
         mock_exec = mock.Mock()
         mock_exec.return_value = ('', '')
@@ -881,6 +885,98 @@ class RBDTestCase(test.TestCase):
         self.assertTrue(self.mock_rados.Rados.return_value.open_ioctx.called)
         self.mock_rados.Rados.return_value.shutdown.assert_called_once_with()
 
+    @common_mocks
+    def test_connect_to_rados_reuses_pooled_connection(self):
+        client, ioctx = self.driver._connect_to_rados()
+        self.driver._disconnect_from_rados(client, ioctx)
+        self.assertFalse(client.shutdown.called)
+        self.assertFalse(ioctx.close.called)
+
+        self.mock_rados.Rados.reset_mock()
+        ret = self.driver._connect_to_rados()
+        self.assertEqual((client, ioctx), ret)
+        self.assertFalse(self.mock_rados.Rados.called)
+
+    @common_mocks
+    def test_disconnect_from_rados_discard(self):
+        client, ioctx = self.driver._connect_to_rados()
+        self.driver._disconnect_from_rados(client, ioctx, discard=True)
+        ioctx.close.assert_called_once_with()
+        client.shutdown.assert_called_once_with()
+
+
+class RADOSConnectionPoolTestCase(test.TestCase):
+
+    class FakeError(Exception):
+        pass
+
+    def setUp(self):
+        super(RADOSConnectionPoolTestCase, self).setUp()
+        self.connect = mock.Mock(side_effect=lambda: mock.Mock())
+        self.pool = driver.RADOSConnectionPool(self.connect, self.FakeError,
+                                               max_idle=2, idle_timeout=300,
+                                               health_check_interval=60)
+
+    def test_get_opens_ioctx_once_per_pool(self):
+        client, ioctx = self.pool.get('rbd')
+        self.pool.put(client, ioctx)
+        client2, ioctx2 = self.pool.get('rbd')
+        self.assertEqual(client, client2)
+        self.assertEqual(ioctx, ioctx2)
+        client.open_ioctx.assert_called_once_with('rbd')
+        self.assertEqual(1, self.connect.call_count)
+
+    def test_concurrent_gets_use_separate_connections(self):
+        first = self.pool.get('rbd')
+        second = self.pool.get('rbd')
+        self.assertNotEqual(first[0], second[0])
+        self.assertEqual(2, self.connect.call_count)
+
+    def test_put_discard_closes_connection(self):
+        client, ioctx = self.pool.get('rbd')
+        self.pool.put(client, ioctx, discard=True)
+        ioctx.close.assert_called_once_with()
+        client.shutdown.assert_called_once_with()
+        self.pool.get('rbd')
+        self.assertEqual(2, self.connect.call_count)
+
+    def test_max_idle(self):
+        conns = [self.pool.get('rbd') for i in range(3)]
+        for client, ioctx in conns:
+            self.pool.put(client, ioctx)
+        self.assertEqual(2, len(self.pool._idle))
+        conns[0][0].shutdown.assert_called_once_with()
+
+    @mock.patch('time.time')
+    def test_idle_connections_evicted(self, mock_time):
+        mock_time.return_value = 1000
+        client, ioctx = self.pool.get('rbd')
+        self.pool.put(client, ioctx)
+        mock_time.return_value = 1200
+        self.pool._evict()
+        self.assertFalse(client.shutdown.called)
+        mock_time.return_value = 1400
+        self.pool._evict()
+        client.shutdown.assert_called_once_with()
+        self.assertEqual([], self.pool._idle)
+
+    @mock.patch('time.time')
+    def test_unhealthy_connection_replaced(self, mock_time):
+        mock_time.return_value = 1000
+        client, ioctx = self.pool.get('rbd')
+        self.pool.put(client, ioctx)
+        client.get_cluster_stats.side_effect = self.FakeError
+        mock_time.return_value = 1100
+        new_client, _ioctx = self.pool.get('rbd')
+        self.assertNotEqual(client, new_client)
+        client.shutdown.assert_called_once_with()
+
+    def test_open_ioctx_error_closes_connection(self):
+        self.connect.side_effect = None
+        self.connect.return_value.open_ioctx.side_effect = self.FakeError
+        self.assertRaises(self.FakeError, self.pool.get, 'rbd')
+        self.connect.return_value.shutdown.assert_called_once_with()
+
 
 class RBDImageIOWrapperTestCase(test.TestCase):
     def setUp(self):
@@ -65,6 +65,28 @@ class ExecuteTestCase(test.TestCase):
                                                 run_as_root=True,
                                                 root_helper=mock_helper)
 
+    @mock.patch('cinder.utils.get_root_daemon_execute')
+    @mock.patch('cinder.utils.processutils.execute')
+    def test_execute_root_daemon(self, mock_putils_exe, mock_get_daemon):
+        self.flags(use_rootwrap_daemon=True)
+        output = utils.execute('a', 1, foo='bar', run_as_root=True)
+        mock_daemon_exe = mock_get_daemon.return_value
+        self.assertEqual(mock_daemon_exe.return_value, output)
+        self.assertFalse(mock_putils_exe.called)
+        mock_daemon_exe.assert_called_once_with(
+            'a', 1, foo='bar', run_as_root=True,
+            root_helper=utils.get_root_helper())
+
+    @mock.patch('cinder.utils.get_root_daemon_execute')
+    @mock.patch('cinder.utils.processutils.execute')
+    def test_execute_root_daemon_other_helper(self, mock_putils_exe,
+                                              mock_get_daemon):
+        self.flags(use_rootwrap_daemon=True)
+        output = utils.execute('a', 1, run_as_root=True,
+                               root_helper='sudo')
+        self.assertEqual(mock_putils_exe.return_value, output)
+        self.assertFalse(mock_get_daemon.called)
+
 
 class GetFromPathTestCase(test.TestCase):
     def test_tolerates_nones(self):
@@ -63,6 +63,7 @@ import cinder.volume
 from cinder.volume import configuration as conf
 from cinder.volume import driver
 from cinder.volume.drivers import lvm
+from cinder.volume.flows.api import create_volume
 from cinder.volume import manager as vol_manager
 from cinder.volume import rpcapi as volume_rpcapi
 from cinder.volume.targets import tgt
@@ -627,6 +628,74 @@ class VolumeTestCase(BaseVolumeTestCase):
                                    'description')
         self.assertEqual(volume['availability_zone'], 'default-az')
 
+    @mock.patch('cinder.scheduler.rpcapi.SchedulerAPI.create_volumes')
+    def test_create_volumes(self, mock_create_volumes):
+        """Test creating a batch of volumes with one scheduler request."""
+        volume_api = cinder.volume.api.API()
+        volumes = volume_api.create_volumes(self.context, 2, 1, 'name',
+                                            'description')
+
+        self.assertEqual(2, len(volumes))
+        self.assertEqual([volume['id'] for volume in volumes],
+                         mock_create_volumes.call_args[0][2])
+
+    @mock.patch('cinder.scheduler.rpcapi.SchedulerAPI.create_volumes')
+    def test_create_volumes_failure(self, mock_create_volumes):
+        """Test that a failed batch create leaves no volume behind."""
+        get_flow_no_rpc = create_volume.get_flow_no_rpc
+        calls = []
+
+        def fake_get_flow_no_rpc(*args):
+            calls.append(args)
+            if len(calls) == 2:
+                raise test.TestingException()
+            return get_flow_no_rpc(*args)
+
+        volume_api = cinder.volume.api.API()
+        before = len(db.volume_get_all(self.context, None, None))
+        with mock.patch.object(create_volume, 'get_flow_no_rpc',
+                               side_effect=fake_get_flow_no_rpc):
+            self.assertRaises(exception.CinderException,
+                              volume_api.create_volumes, self.context, 3, 1,
+                              'name', 'description')
+
+        self.assertEqual(2, len(calls))
+        self.assertEqual(before,
+                         len(db.volume_get_all(self.context, None, None)))
+        self.assertFalse(mock_create_volumes.called)
+
+    def test_create_volumes_over_max_count(self):
+        """Test that a batch larger than the configured maximum fails."""
+        self.flags(max_volume_batch_count=2)
+        volume_api = cinder.volume.api.API()
+        with mock.patch.object(create_volume,
+                               'get_flow_no_rpc') as mock_get_flow:
+            self.assertRaises(exception.InvalidInput,
+                              volume_api.create_volumes, self.context, 3, 1,
+                              'name', 'description')
+        self.assertFalse(mock_get_flow.called)
+
+    @mock.patch.object(QUOTAS, 'rollback')
+    @mock.patch.object(QUOTAS, 'reserve')
+    def test_create_volumes_over_quota(self, mock_reserve, mock_rollback):
+        """Test that the quota is checked for the whole batch at once."""
+        usages = {'volumes': {'reserved': 0, 'in_use': 9},
+                  'gigabytes': {'reserved': 0, 'in_use': 9}}
+        mock_reserve.side_effect = exception.OverQuota(
+            overs=['volumes'], usages=usages,
+            quotas={'volumes': 10, 'gigabytes': 1000})
+        volume_api = cinder.volume.api.API()
+        with mock.patch.object(create_volume,
+                               'get_flow_no_rpc') as mock_get_flow:
+            self.assertRaises(exception.VolumeLimitExceeded,
+                              volume_api.create_volumes, self.context, 3, 2,
+                              'name', 'description')
+        self.assertEqual(1, mock_reserve.call_count)
+        self.assertEqual(3, mock_reserve.call_args[1]['volumes'])
+        self.assertEqual(6, mock_reserve.call_args[1]['gigabytes'])
+        self.assertFalse(mock_get_flow.called)
+        self.assertFalse(mock_rollback.called)
+
     def test_create_volume_with_volume_type(self):
         """Test volume creation with default volume type."""
         def fake_reserve(context, expire=None, project_id=None, **deltas):
@@ -5722,6 +5791,10 @@ class ISCSITestCase(DriverTestCase):
                        'get_volumes',
                        _fake_get_volumes)
 
+        self.stubs.Set(brick_lvm.LVM,
+                       '_get_lv_inventory',
+                       lambda obj, lv_name=None: [])
+
         self.volume.driver.vg = brick_lvm.LVM('cinder-volumes', 'sudo')
 
         self.volume.driver._update_volume_stats()
@@ -15,6 +15,10 @@
 
 """Tests For miscellaneous util methods used with volume."""
 
+import io
+import os
+
+import fixtures
 import mock
 from oslo_concurrency import processutils
 from oslo_config import cfg
@@ -23,6 +27,7 @@ from oslo_log import log as logging
 from cinder import exception
 from cinder import test
 from cinder import utils
+from cinder.volume import copy_engine
 from cinder.volume import throttling
 from cinder.volume import utils as volume_utils
 
@@ -524,6 +529,202 @@ class CopyVolumeTestCase(test.TestCase):
                                           'conv=fdatasync', run_as_root=True)
 
 
+class NativeCopyVolumeTestCase(test.TestCase):
+    def setUp(self):
+        super(NativeCopyVolumeTestCase, self).setUp()
+        self.flags(volume_copy_engine='native', volume_copy_io_depth=3)
+        tmpdir = self.useFixture(fixtures.TempDir()).path
+        self.src = os.path.join(tmpdir, 'src')
+        self.dest = os.path.join(tmpdir, 'dest')
+
+    def _make_sparse_source(self, size):
+        with open(self.src, 'wb') as f:
+            f.truncate(size)
+            f.seek(size // 3 + 100)
+            f.write(b'data' * 1024)
+            f.seek(size - 4096)
+            f.write(b'tail' * 1024)
+
+    @mock.patch('cinder.utils.execute')
+    def test_copy_volume_native(self, mock_exec):
+        self._make_sparse_source(3 * 1024 * 1024)
+        progress = mock.Mock()
+        volume_utils.copy_volume(self.src, self.dest, 4, '256K',
+                                 progress=progress)
+
+        self.assertFalse(mock_exec.called)
+        with open(self.src, 'rb') as src, open(self.dest, 'rb') as dest:
+            self.assertEqual(src.read(), dest.read())
+        progress.assert_called_with(3 * 1024 * 1024, 3 * 1024 * 1024)
+
+    def test_copy_volume_native_skips_holes(self):
+        self._make_sparse_source(3 * 1024 * 1024)
+        copy = copy_engine.VolumeCopy(self.src, self.dest, 3 * 1024 * 1024,
+                                      256 * 1024)
+        with mock.patch.object(copy, '_copy_block',
+                               wraps=copy._copy_block) as mock_copy:
+            self.assertEqual(3 * 1024 * 1024, copy.run())
+
+        if len(copy._extents) > 1:
+            # The file system reports holes, only blocks with data are read
+            self.assertEqual(2, mock_copy.call_count)
+        self.assertEqual(3 * 1024 * 1024, os.path.getsize(self.dest))
+        with open(self.src, 'rb') as src, open(self.dest, 'rb') as dest:
+            self.assertEqual(src.read(), dest.read())
+
+    def test_copy_volume_native_zero(self):
+        with open(self.dest, 'wb') as f:
+            f.write(b'x' * 4096)
+        volume_utils.copy_volume('/dev/zero', self.dest, 1, '1M', sync=True)
+        with open(self.dest, 'rb') as dest:
+            self.assertEqual(b'\0' * 1024 * 1024, dest.read())
+
+    def test_copy_block_unaligned_tail(self):
+        # A raw image whose size is not a multiple of the alignment
+        with open(self.src, 'wb') as f:
+            f.write(b'data' * 1024 + b'tail')
+        with open(self.dest, 'wb') as f:
+            f.write(b'\0' * 8192)
+        copy = copy_engine.VolumeCopy(self.src, self.dest, 8192, 8192,
+                                      io_depth=1)
+        copy._direct_dest = True
+        dest = mock.Mock()
+        dest.write.side_effect = len
+        buf = copy_engine.aligned_buffer(8192)
+
+        with io.FileIO(self.src, 'rb') as src:
+            self.assertEqual((4100, False),
+                             copy._copy_block(src, dest, buf, 0, 8192))
+
+        # Only the aligned part goes to the O_DIRECT target
+        dest.seek.assert_called_once_with(0)
+        self.assertEqual([4096], [len(call[0][0])
+                                  for call in dest.write.call_args_list])
+        with open(self.dest, 'rb') as f:
+            f.seek(4096)
+            self.assertEqual(b'tail', f.read(4))
+
+    @mock.patch('cinder.volume.utils._copy_volume')
+    def test_copy_volume_native_throttled(self, mock_copy):
+        fake_throttle = throttling.Throttle(['fake_throttle'])
+        volume_utils.copy_volume(self.src, self.dest, 1, '1M',
+                                 throttle=fake_throttle)
+        mock_copy.assert_called_once_with(['fake_throttle'], self.src,
+                                          self.dest, 1, '1M', sync=False,
+                                          execute=utils.execute, ionice=None)
+
+    @mock.patch('cinder.utils.execute')
+    def test_copy_volume_native_bps_limit(self, mock_exec):
+        self._make_sparse_source(1024 * 1024)
+        throttle = throttling.BlkioCgroup(1024 * 1024, 'fake_group')
+        mock_exec.reset_mock()
+        with mock.patch.object(copy_engine, 'VolumeCopy') as mock_copy:
+            mock_copy.return_value.zeroed = 0
+            volume_utils.copy_volume(self.src, self.dest, 1, '1M',
+                                     throttle=throttle)
+        # Applied by the engine rather than through a cgroup
+        self.assertFalse(mock_exec.called)
+        self.assertEqual(1024 * 1024,
+                         mock_copy.call_args[1]['bps_limit'])
+        mock_copy.return_value.run.assert_called_once_with()
+
+    @mock.patch('cinder.volume.copy_engine.eventlet.sleep')
+    @mock.patch.object(copy_engine, 'time')
+    def test_copy_limit_rate(self, mock_time, mock_sleep):
+        copy = copy_engine.VolumeCopy(self.src, self.dest, 8192, 4096,
+                                      bps_limit=1024)
+        copy._started = 100.0
+        mock_time.time.return_value = 100.0
+        copy._limit_rate(2048)
+        mock_sleep.assert_called_once_with(2.0)
+
+        mock_sleep.reset_mock()
+        mock_time.time.return_value = 104.0
+        copy._limit_rate(1024)
+        self.assertFalse(mock_sleep.called)
+
+    @mock.patch('cinder.utils.temporary_chown')
+    def test_copy_volume_native_chowns(self, mock_chown):
+        self._make_sparse_source(1024 * 1024)
+        with open(self.dest, 'wb') as f:
+            f.truncate(1024 * 1024)
+        with mock.patch('os.access', return_value=False):
+            volume_utils.copy_volume(self.src, self.dest, 1, '1M')
+
+        self.assertEqual([mock.call(self.src), mock.call(self.dest)],
+                         mock_chown.call_args_list)
+        with open(self.src, 'rb') as src, open(self.dest, 'rb') as dest:
+            self.assertEqual(src.read(), dest.read())
+
+    @mock.patch('cinder.volume.copy_engine.can_copy', return_value=False)
+    @mock.patch('cinder.volume.utils._copy_volume')
+    def test_copy_volume_native_needs_root(self, mock_copy, mock_can_copy):
+        volume_utils.copy_volume('/dev/abc', '/dev/def', 1, '1M')
+        mock_can_copy.assert_called_once_with('/dev/abc', '/dev/def')
+        mock_copy.assert_called_once_with([], '/dev/abc', '/dev/def', 1,
+                                          '1M', sync=False,
+                                          execute=utils.execute, ionice=None)
+
+
+class SparseCopyVolumeTestCase(test.TestCase):
+    def setUp(self):
+        super(SparseCopyVolumeTestCase, self).setUp()
+        self.flags(volume_copy_engine='native', volume_copy_sparse=True)
+        tmpdir = self.useFixture(fixtures.TempDir()).path
+        self.src = os.path.join(tmpdir, 'src')
+        self.dest = os.path.join(tmpdir, 'dest')
+
+    def test_copy_volume_sparse(self):
+        with open(self.src, 'wb') as f:
+            # Allocated zeroes followed by data
+            f.write(b'\0' * 2 * 1024 * 1024)
+            f.write(b'data' * 256 * 1024)
+        volume_utils.copy_volume(self.src, self.dest, 3, '1M')
+
+        with open(self.src, 'rb') as src, open(self.dest, 'rb') as dest:
+            self.assertEqual(src.read(), dest.read())
+
+    def test_copy_block_zeroes(self):
+        with open(self.src, 'wb') as f:
+            f.write(b'\0' * 4096 + b'data' * 1024)
+        copy = copy_engine.VolumeCopy(self.src, self.dest, 8192, 4096,
+                                      io_depth=1, sparse=True)
+        self.assertEqual(8192, copy.run())
+        self.assertEqual(4096, copy.zeroed)
+
+    @mock.patch('fcntl.ioctl')
+    def test_zero_range_fallback(self, mock_ioctl):
+        copy = copy_engine.VolumeCopy('/dev/zero', '/dev/fake', 8192, 4096,
+                                      sparse=True)
+        copy._dest_is_file = False
+        copy._zero_requests = (copy_engine.BLKDISCARD,
+                               copy_engine.BLKZEROOUT)
+        mock_ioctl.side_effect = [IOError, None, None]
+        dest = mock.Mock()
+
+        self.assertTrue(copy._write_zeroes(dest, 0, 4096))
+        self.assertTrue(copy._write_zeroes(dest, 4096, 4096))
+
+        self.assertEqual(set([copy_engine.BLKDISCARD]),
+                         copy._unsupported_requests)
+        self.assertEqual(
+            [mock.call(dest.fileno(), copy_engine.BLKDISCARD, mock.ANY),
+             mock.call(dest.fileno(), copy_engine.BLKZEROOUT, mock.ANY),
+             mock.call(dest.fileno(), copy_engine.BLKZEROOUT, mock.ANY)],
+            mock_ioctl.call_args_list)
+
+    @mock.patch('fcntl.ioctl', side_effect=IOError)
+    def test_zero_range_unsupported(self, mock_ioctl):
+        copy = copy_engine.VolumeCopy('/dev/zero', '/dev/fake', 8192, 4096,
+                                      sparse=True)
+        copy._dest_is_file = False
+        copy._zero_requests = (copy_engine.BLKZEROOUT,)
+
+        self.assertFalse(copy._write_zeroes(mock.Mock(), 0, 4096))
+        self.assertFalse(copy._write_zeroes(mock.Mock(), 4096, 4096))
+        self.assertEqual(1, mock_ioctl.call_count)
+
+
 class VolumeUtilsTestCase(test.TestCase):
     def test_null_safe_str(self):
         self.assertEqual('', volume_utils.null_safe_str(None))
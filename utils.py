@@ -44,6 +44,7 @@ from oslo_utils import timeutils
 import retrying
 import six
 
+from cinder.brick import executor
 from cinder.brick.initiator import connector
 from cinder import exception
 from cinder.i18n import _, _LE
@@ -140,6 +141,9 @@ def execute(*cmd, **kwargs):
     """Convenience wrapper around oslo's execute() method."""
     if 'run_as_root' in kwargs and 'root_helper' not in kwargs:
         kwargs['root_helper'] = get_root_helper()
+    if (CONF.use_rootwrap_daemon and kwargs.get('run_as_root') and
+            kwargs['root_helper'] == get_root_helper()):
+        return get_root_daemon_execute()(*cmd, **kwargs)
     return processutils.execute(*cmd, **kwargs)
 
 
@@ -544,6 +548,12 @@ def get_root_helper():
     return 'sudo cinder-rootwrap %s' % CONF.rootwrap_config
 
 
+def get_root_daemon_execute():
+    """Return an execute method running root commands through the daemon."""
+    return executor.RootwrapDaemonExecute(
+        'sudo cinder-rootwrap-daemon %s' % CONF.rootwrap_config)
+
+
 def brick_get_connector_properties(multipath=False, enforce_multipath=False):
     """wrapper for the brick calls to automatically set
     the root_helper needed for cinder.
@@ -564,7 +574,7 @@ def brick_get_connector_properties(multipath=False, enforce_multipath=False):
 
 
 def brick_get_connector(protocol, driver=None,
-                        execute=processutils.execute,
+                        execute=execute,
                         use_multipath=False,
                         device_scan_attempts=3,
                         *args, **kwargs):
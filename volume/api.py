@@ -64,11 +64,16 @@ az_cache_time_opt = cfg.IntOpt('az_cache_duration',
                                help='Cache volume availability zones in '
                                     'memory for the provided duration in '
                                     'seconds')
+batch_count_opt = cfg.IntOpt('max_volume_batch_count',
+                             default=100,
+                             help=_('Maximum number of volumes that a '
+                                    'single request can create'))
 
 CONF = cfg.CONF
 CONF.register_opt(volume_host_opt)
 CONF.register_opt(volume_same_az_opt)
 CONF.register_opt(az_cache_time_opt)
+CONF.register_opt(batch_count_opt)
 
 CONF.import_opt('glance_core_properties', 'cinder.image.glance')
 
@@ -264,6 +269,157 @@ class API(base.Base):
             flow_engine.run()
             return flow_engine.storage.fetch('volume')
 
+    def create_volumes(self, context, count, size, name, description,
+                       image_id=None, volume_type=None, metadata=None,
+                       availability_zone=None, scheduler_hints=None,
+                       multiattach=False):
+        """Create a batch of identical volumes with one scheduler request.
+
+        Every volume gets its own database entry and quota reservation, and
+        the batch is then cast to the scheduler as a whole so it is placed
+        in a single filter and weigh pass.  The quota for the whole batch is
+        checked before any entry is created.  If creating an entry fails,
+        the volumes created before it are deleted again and nothing is
+        scheduled.
+        """
+        if not utils.is_int_like(count) or int(count) <= 0:
+            msg = _('Invalid volume count provided for create request: %s '
+                    '(count argument must be an integer greater than '
+                    'zero).') % count
+            raise exception.InvalidInput(reason=msg)
+        if int(count) > CONF.max_volume_batch_count:
+            msg = _('Invalid volume count provided for create request: '
+                    '%(count)s (at most %(max)d volumes can be created at '
+                    'once).') % {'count': count,
+                                 'max': CONF.max_volume_batch_count}
+            raise exception.InvalidInput(reason=msg)
+        if not utils.is_int_like(size) or int(size) <= 0:
+            msg = _('Invalid volume size provided for create request: %s '
+                    '(size argument must be an integer (or string '
+                    'representation of an integer) and greater '
+                    'than zero).') % size
+            raise exception.InvalidInput(reason=msg)
+
+        self._check_batch_quota(context, int(count), int(size), volume_type)
+
+        raw_zones = self.list_availability_zones(enable_cache=True)
+        availability_zones = set([az['name'] for az in raw_zones])
+        if CONF.storage_availability_zone:
+            availability_zones.add(CONF.storage_availability_zone)
+
+        volumes = []
+        request_spec = None
+        try:
+            for _i in xrange(int(count)):
+                create_what = {
+                    'context': context,
+                    'raw_size': size,
+                    'name': name,
+                    'description': description,
+                    'snapshot': None,
+                    'image_id': image_id,
+                    'raw_volume_type': volume_type,
+                    'metadata': metadata,
+                    'raw_availability_zone': availability_zone,
+                    'source_volume': None,
+                    'scheduler_hints': scheduler_hints,
+                    'key_manager': self.key_manager,
+                    'source_replica': None,
+                    'optional_args': {'is_quota_committed': False},
+                    'consistencygroup': None,
+                    'cgsnapshot': None,
+                    'multiattach': multiattach,
+                }
+                try:
+                    flow_engine = create_volume.get_flow_no_rpc(
+                        self.db, self.image_service, availability_zones,
+                        create_what)
+                except Exception:
+                    msg = _('Failed to create api volume flow.')
+                    LOG.exception(msg)
+                    raise exception.CinderException(msg)
+
+                with flow_utils.DynamicLogListener(flow_engine, logger=LOG):
+                    flow_engine.run()
+                volumes.append(flow_engine.storage.fetch('volume'))
+                if request_spec is None:
+                    request_spec = self._batch_request_spec(flow_engine)
+        except Exception:
+            with excutils.save_and_reraise_exception():
+                for volume in volumes:
+                    try:
+                        self.delete(context, volume)
+                    except Exception:
+                        LOG.exception(_LE("Failed to delete volume %s of a "
+                                          "failed batch create."),
+                                      volume['id'])
+
+        filter_properties = {}
+        if scheduler_hints:
+            filter_properties['scheduler_hints'] = scheduler_hints
+        self.scheduler_rpcapi.create_volumes(
+            context,
+            CONF.volume_topic,
+            [volume['id'] for volume in volumes],
+            image_id=image_id,
+            request_spec=request_spec,
+            filter_properties=filter_properties)
+
+        return volumes
+
+    @staticmethod
+    def _check_batch_quota(context, count, size, volume_type):
+        # Each volume still reserves its own quota when its entry is
+        # created; this only refuses a batch that cannot fit as a whole.
+        if not volume_type:
+            volume_type = volume_types.get_default_volume_type()
+        reserve_opts = {'volumes': count, 'gigabytes': count * size}
+        QUOTAS.add_volume_type_opts(context, reserve_opts,
+                                    volume_type.get('id'))
+        try:
+            reservations = QUOTAS.reserve(context, **reserve_opts)
+        except exception.OverQuota as e:
+            overs = e.kwargs['overs']
+            usages = e.kwargs['usages']
+            quotas = e.kwargs['quotas']
+
+            def _consumed(name):
+                return (usages[name]['reserved'] + usages[name]['in_use'])
+
+            for over in overs:
+                if 'gigabytes' in over:
+                    msg = _LW("Quota exceeded for %(s_pid)s, tried to create "
+                              "%(s_count)d volumes of %(s_size)sG "
+                              "(%(d_consumed)dG of %(d_quota)dG already "
+                              "consumed).")
+                    LOG.warn(msg, {'s_pid': context.project_id,
+                                   's_count': count,
+                                   's_size': size,
+                                   'd_consumed': _consumed(over),
+                                   'd_quota': quotas[over]})
+                    raise exception.VolumeSizeExceedsAvailableQuota(
+                        requested=count * size,
+                        consumed=_consumed(over),
+                        quota=quotas[over])
+                elif 'volumes' in over:
+                    msg = _LW("Quota exceeded for %(s_pid)s, tried to create "
+                              "%(s_count)d volumes (%(d_consumed)d volumes "
+                              "already consumed).")
+                    LOG.warn(msg, {'s_pid': context.project_id,
+                                   's_count': count,
+                                   'd_consumed': _consumed(over)})
+                    raise exception.VolumeLimitExceeded(allowed=quotas[over])
+            raise
+        QUOTAS.rollback(context, reservations)
+
+    @staticmethod
+    def _batch_request_spec(flow_engine):
+        # Same keys as the request spec VolumeCastTask sends for one volume
+        keys = ('image_id', 'snapshot_id', 'source_volid', 'volume_id',
+                'volume_type', 'volume_properties', 'source_replicaid',
+                'consistencygroup_id', 'cgsnapshot_id')
+        return dict((key, flow_engine.storage.fetch(key)) for key in keys)
+
     @wrap_check_policy
     def delete(self, context, volume, force=False, unmanage_only=False):
         if context.is_admin and context.project_id != volume['project_id']:
@@ -392,7 +548,8 @@ class API(base.Base):
         return b
 
     def get_all(self, context, marker=None, limit=None, sort_keys=None,
-                sort_dirs=None, filters=None, viewable_admin_meta=False):
+                sort_dirs=None, filters=None, viewable_admin_meta=False,
+                fields=None):
         check_policy(context, 'get_all')
 
         if filters is None:
@@ -426,7 +583,8 @@ class API(base.Base):
             volumes = self.db.volume_get_all(context, marker, limit,
                                              sort_keys=sort_keys,
                                              sort_dirs=sort_dirs,
-                                             filters=filters)
+                                             filters=filters,
+                                             fields=fields)
         else:
             if viewable_admin_meta:
                 context = context.elevated()
@@ -435,7 +593,8 @@ class API(base.Base):
                                                         marker, limit,
                                                         sort_keys=sort_keys,
                                                         sort_dirs=sort_dirs,
-                                                        filters=filters)
+                                                        filters=filters,
+                                                        fields=fields)
 
         return volumes
 
@@ -447,31 +606,45 @@ class API(base.Base):
         rv = self.db.volume_get(context, volume_id)
         return dict(rv.iteritems())
 
-    def get_all_snapshots(self, context, search_opts=None):
+    def get_all_snapshots(self, context, search_opts=None, marker=None,
+                          limit=None, sort_keys=None, sort_dirs=None,
+                          offset=None):
         check_policy(context, 'get_all_snapshots')
 
         search_opts = search_opts or {}
 
+        try:
+            if limit is not None:
+                limit = int(limit)
+                if limit < 0:
+                    msg = _('limit param must be positive')
+                    raise exception.InvalidInput(reason=msg)
+        except ValueError:
+            msg = _('limit param must be an integer')
+            raise exception.InvalidInput(reason=msg)
+
         if (context.is_admin and 'all_tenants' in search_opts):
             # Need to remove all_tenants to pass the filtering below.
             del search_opts['all_tenants']
-            snapshots = self.db.snapshot_get_all(context)
+            all_tenants = True
         else:
-            snapshots = self.db.snapshot_get_all_by_project(
-                context, context.project_id)
+            all_tenants = False
 
         if search_opts:
             LOG.debug("Searching by: %s", search_opts)
 
-            results = []
-            not_found = object()
-            for snapshot in snapshots:
-                for opt, value in search_opts.iteritems():
-                    if snapshot.get(opt, not_found) != value:
-                        break
-                else:
-                    results.append(snapshot)
-            snapshots = results
+        if all_tenants:
+            snapshots = self.db.snapshot_get_all(context,
+                                                 filters=search_opts,
+                                                 marker=marker, limit=limit,
+                                                 sort_keys=sort_keys,
+                                                 sort_dirs=sort_dirs,
+                                                 offset=offset)
+        else:
+            snapshots = self.db.snapshot_get_all_by_project(
+                context, context.project_id, filters=search_opts,
+                marker=marker, limit=limit, sort_keys=sort_keys,
+                sort_dirs=sort_dirs, offset=offset)
         return snapshots
 
     @wrap_check_policy
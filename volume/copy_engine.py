@@ -0,0 +1,365 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""In-process volume copy engine.
+
+The engine copies between two paths with a number of copies in flight at
+once, each running in a native thread.  Block devices are opened with
+O_DIRECT so the copy doesn't thrash the page cache, which needs aligned
+buffers.  Holes in a sparse source file are not copied when the target is
+a regular file, since the target reads back zeroes there anyway.
+
+In sparse mode, blocks of zeroes aren't written either: a regular file
+target is left with a hole, and a block device target is zeroed with
+BLKDISCARD when the device reads discarded blocks back as zeroes, or
+with BLKZEROOUT otherwise.  Only when neither works are the zeroes
+written out.
+"""
+
+import bisect
+import ctypes
+import errno
+import fcntl
+import io
+import os
+import stat
+import struct
+import time
+
+import eventlet
+from eventlet import tpool
+from oslo_log import log as logging
+from six.moves import range
+
+from cinder.i18n import _LW
+
+
+LOG = logging.getLogger(__name__)
+
+# Alignment of the buffers and blocks of O_DIRECT I/O; it covers both 512
+# byte and 4k logical sector sizes.
+ALIGNMENT = 4096
+
+# Not exposed by the os module before Python 3.3.
+SEEK_DATA = getattr(os, 'SEEK_DATA', 3)
+SEEK_HOLE = getattr(os, 'SEEK_HOLE', 4)
+
+# Block device ioctls from linux/fs.h
+BLKDISCARD = 0x1277
+BLKDISCARDZEROES = 0x127c
+BLKZEROOUT = 0x127f
+
+_ZERO_DEVICE = '/dev/zero'
+
+
+def aligned_buffer(size, alignment=ALIGNMENT):
+    """Return a writable memoryview of size bytes aligned to alignment."""
+    raw = bytearray(size + alignment)
+    address = ctypes.addressof(ctypes.c_char.from_buffer(raw))
+    offset = -address % alignment
+    return memoryview(raw)[offset:offset + size]
+
+
+def data_extents(fd, length):
+    """Return the (start, end) ranges of fd holding data below length.
+
+    Falls back to a single extent covering everything when the file
+    system can't report holes.
+    """
+    extents = []
+    offset = 0
+    while offset < length:
+        try:
+            start = os.lseek(fd, offset, SEEK_DATA)
+        except OSError as e:
+            if e.errno == errno.ENXIO:
+                # No data past offset
+                break
+            return [(0, length)]
+        if start >= length:
+            break
+        end = min(os.lseek(fd, start, SEEK_HOLE), length)
+        extents.append((start, end))
+        offset = end
+    return extents
+
+
+def discard_zeroes_data(fd):
+    """Check whether discarded blocks of a block device read as zeroes."""
+    try:
+        result = fcntl.ioctl(fd, BLKDISCARDZEROES, struct.pack('I', 0))
+    except (IOError, OSError):
+        return False
+    return struct.unpack('I', result)[0] == 1
+
+
+def _is_device(path):
+    try:
+        mode = os.stat(path).st_mode
+    except OSError:
+        return False
+    return stat.S_ISBLK(mode) or stat.S_ISCHR(mode)
+
+
+def can_copy(src, dest):
+    """Check that this process may copy src to dest without root helper.
+
+    Existing paths it can't access are left to the caller, which can chown
+    them for the copy; a missing target has to be created by this process.
+    """
+    if not os.path.exists(src):
+        return False
+    if os.path.exists(dest):
+        return True
+    return os.access(os.path.dirname(os.path.abspath(dest)), os.W_OK)
+
+
+class VolumeCopy(object):
+    """Copy length bytes from src to dest.
+
+    The range is split in blocks of blocksize bytes which are handed out
+    round robin to io_depth workers, so up to io_depth blocks are read and
+    written at the same time.  progress, if given, is called with the
+    number of bytes done and length after each block.  With sparse set,
+    blocks of zeroes are not written out.  bps_limit, if given, caps the
+    bytes read and written per second.
+    """
+
+    def __init__(self, src, dest, length, blocksize, io_depth=4, sync=False,
+                 progress=None, sparse=False, bps_limit=0):
+        self.src = src
+        self.dest = dest
+        self.length = length
+        # O_DIRECT needs every block to start on an aligned offset
+        self.blocksize = max(ALIGNMENT,
+                             -(-blocksize // ALIGNMENT) * ALIGNMENT)
+        self.io_depth = max(1, io_depth)
+        self.sync = sync
+        self.progress = progress
+        self.sparse = sparse
+        self.bps_limit = bps_limit
+        self.done = 0
+        # Bytes that were skipped or zeroed rather than written
+        self.zeroed = 0
+        self._zero_source = os.path.realpath(src) == _ZERO_DEVICE
+        self._direct_src = (not self._zero_source and _is_device(src))
+        self._dest_is_file = not _is_device(dest)
+        self._direct_dest = not self._dest_is_file
+        self._zero_requests = ()
+        # Zeroing ioctls that failed.  Workers in several native threads
+        # add to it, which unlike reassigning _zero_requests is atomic.
+        self._unsupported_requests = set()
+        self._zeroes = None
+        self._end = None
+        self._extents = None
+        self._extent_starts = None
+        self._started = None
+        self._transferred = 0
+
+    def _open(self, path, flags, direct):
+        if direct:
+            try:
+                return os.open(path, flags | getattr(os, 'O_DIRECT', 0))
+            except OSError as e:
+                if e.errno != errno.EINVAL:
+                    raise
+                LOG.warning(_LW("O_DIRECT is not supported on %s, falling "
+                                "back to buffered I/O."), path)
+                if path == self.dest:
+                    self._direct_dest = False
+                else:
+                    self._direct_src = False
+        return os.open(path, flags)
+
+    def _prepare(self):
+        """Set up the target and find the source ranges worth copying."""
+        if self.sparse:
+            self._zeroes = bytes(bytearray(self.blocksize))
+        if not self._dest_is_file:
+            if self.sparse:
+                fd = os.open(self.dest, os.O_WRONLY)
+                try:
+                    if discard_zeroes_data(fd):
+                        self._zero_requests = (BLKDISCARD, BLKZEROOUT)
+                    else:
+                        self._zero_requests = (BLKZEROOUT,)
+                finally:
+                    os.close(fd)
+            return
+        # Like dd, start a regular file target from scratch, after which
+        # anything not written reads back as zeroes
+        os.close(os.open(self.dest, os.O_WRONLY | os.O_CREAT | os.O_TRUNC,
+                         0o644))
+        if self._zero_source or self._direct_src:
+            return
+        fd = os.open(self.src, os.O_RDONLY)
+        try:
+            if stat.S_ISREG(os.fstat(fd).st_mode):
+                # Like dd, stop at the end of the source
+                self.length = min(self.length, os.fstat(fd).st_size)
+            self._extents = data_extents(fd, self.length)
+        finally:
+            os.close(fd)
+        self._extent_starts = [start for start, _end in self._extents]
+
+    def _has_data(self, offset, end):
+        if self._extents is None:
+            return True
+        index = bisect.bisect_left(self._extent_starts, end) - 1
+        return index >= 0 and self._extents[index][1] > offset
+
+    def _zero_range(self, dest, offset, size):
+        """Zero a range of a block device target without writing it.
+
+        Returns False when the device supports neither ioctl.
+        """
+        for request in self._zero_requests:
+            if request in self._unsupported_requests:
+                continue
+            try:
+                fcntl.ioctl(dest.fileno(), request,
+                            struct.pack('QQ', offset, size))
+                return True
+            except (IOError, OSError):
+                # Don't try this one again
+                self._unsupported_requests.add(request)
+        return False
+
+    def _write_zeroes(self, dest, offset, size):
+        """Zero a range of the target the cheapest way available."""
+        if self._dest_is_file:
+            # Left as a hole of the truncated target
+            return True
+        return self._zero_range(dest, offset, size)
+
+    def _copy_block(self, src, dest, buf, offset, size):
+        """Copy one block.
+
+        Returns the number of bytes copied and whether they were zeroes
+        that didn't need writing.
+        """
+        view = buf[:size]
+        if src is None:
+            count = size
+        else:
+            src.seek(offset)
+            count = 0
+            while count < size:
+                read = src.readinto(view[count:])
+                if not read:
+                    break
+                count += read
+        if self.sparse and count and (
+                src is None or
+                view[:count].tobytes() == self._zeroes[:count]) and \
+                self._write_zeroes(dest, offset, count):
+            return count, True
+        dest.seek(offset)
+        # O_DIRECT only takes whole aligned blocks
+        direct = count - count % ALIGNMENT if self._direct_dest else count
+        written = 0
+        while written < direct:
+            written += dest.write(view[written:direct])
+        if written < count:
+            # Like dd, write the unaligned end of a short source without
+            # O_DIRECT
+            self._write_tail(offset + written, view[written:count])
+        return count, False
+
+    def _write_tail(self, offset, data):
+        fd = os.open(self.dest, os.O_WRONLY)
+        try:
+            os.lseek(fd, offset, os.SEEK_SET)
+            data = data.tobytes()
+            written = 0
+            while written < len(data):
+                written += os.write(fd, data[written:])
+            if self.sync:
+                os.fdatasync(fd)
+        finally:
+            os.close(fd)
+
+    def _copy_stripe(self, worker):
+        src = None
+        if not self._zero_source:
+            src = io.FileIO(self._open(self.src, os.O_RDONLY,
+                                       self._direct_src), 'rb')
+        try:
+            dest = io.FileIO(self._open(self.dest, os.O_WRONLY,
+                                        self._direct_dest), 'wb')
+            try:
+                buf = aligned_buffer(self.blocksize)
+                stride = self.blocksize * self.io_depth
+                for offset in range(self.blocksize * worker, self.length,
+                                    stride):
+                    size = min(self.blocksize, self.length - offset)
+                    if self._has_data(offset, offset + size):
+                        copied, zeroes = tpool.execute(self._copy_block,
+                                                       src, dest, buf,
+                                                       offset, size)
+                        self._limit_rate(copied)
+                    else:
+                        copied, zeroes = size, True
+                    if zeroes:
+                        self.zeroed += copied
+                    self.done += copied
+                    if self.progress:
+                        self.progress(self.done, self.length)
+                    if copied < size:
+                        # End of the source
+                        end = offset + copied
+                        self._end = end if self._end is None else \
+                            min(self._end, end)
+                        break
+                if self.sync and not self._direct_dest:
+                    tpool.execute(os.fdatasync, dest.fileno())
+            finally:
+                dest.close()
+        finally:
+            if src is not None:
+                src.close()
+
+    def _limit_rate(self, count):
+        """Hold the calling worker back to keep within bps_limit."""
+        if not self.bps_limit:
+            return
+        self._transferred += count
+        delay = (self._started + float(self._transferred) / self.bps_limit -
+                 time.time())
+        if delay > 0:
+            eventlet.sleep(delay)
+
+    def run(self):
+        """Do the copy and return the number of bytes copied."""
+        self._prepare()
+        self._started = time.time()
+        pool = eventlet.GreenPool(self.io_depth)
+        workers = [pool.spawn(self._copy_stripe, worker)
+                   for worker in range(self.io_depth)]
+        errors = []
+        for worker in workers:
+            try:
+                worker.wait()
+            except Exception as e:
+                errors.append(e)
+        if errors:
+            raise errors[0]
+        if self._dest_is_file:
+            # Trailing holes may have been skipped, give the target its
+            # full size
+            fd = os.open(self.dest, os.O_WRONLY)
+            try:
+                os.ftruncate(fd, self.length if self._end is None
+                             else self._end)
+            finally:
+                os.close(fd)
+        return self.done
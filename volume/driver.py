@@ -136,6 +136,25 @@ volume_opts = [
                default=0,
                help='The upper limit of bandwidth of volume copy. '
                     '0 => unlimited'),
+    cfg.StrOpt('volume_copy_engine',
+               default='dd',
+               choices=['dd', 'native'],
+               help='How to copy and clear volumes. dd runs dd through '
+                    'the root helper; native copies in the volume service '
+                    'with several blocks in flight, applying '
+                    'volume_copy_bps_limit itself, and falls back to dd '
+                    'when the target can\'t be created by the service or '
+                    'the copy is run with ionice.'),
+    cfg.IntOpt('volume_copy_io_depth',
+               default=4,
+               help='Number of blocks the native copy engine reads and '
+                    'writes at the same time'),
+    cfg.BoolOpt('volume_copy_sparse',
+                default=False,
+                help='Let the native copy engine skip writing blocks of '
+                     'zeroes. Regular file targets are left sparse and '
+                     'block device targets are zeroed with BLKDISCARD or '
+                     'BLKZEROOUT, which also applies to clearing volumes.'),
     cfg.StrOpt('iscsi_write_cache',
                default='on',
                choices=['on', 'off'],
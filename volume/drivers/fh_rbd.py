@@ -13,30 +13,226 @@
 #    under the License.
 """FiberHome RADOS Block Device Driver"""
 
-from cinder.i18n import _LI
+import collections
+import functools
+import time
+
+from cinder.i18n import _, _LI
+from oslo_config import cfg
 from oslo_utils import encodeutils
 from oslo_utils import uuidutils
 from oslo_log import log as logging
 
+from .rbd import RADOSClient
 from .rbd import RBDDriver
 from .rbd import RBDVolumeProxy
 
 LOG = logging.getLogger(__name__)
 
+fh_rbd_opts = [
+    cfg.IntOpt('rbd_clone_graph_cache_ttl',
+               default=60,
+               help=_('Number of seconds the clone graph of the rbd pool '
+                      'is cached for clone chain queries. Changes made '
+                      'through this driver invalidate it immediately; the '
+                      'TTL bounds how long changes made by other clients go '
+                      'unnoticed. Set to 0 to disable the cache.')),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(fh_rbd_opts)
+
+
+class CloneGraph(object):
+    """Parent/child/snapshot graph of the rbd images reachable from a pool.
+
+    Images are keyed by (pool, image) and snapshots by (pool, image, snap).
+    """
+    def __init__(self, pool_name):
+        self.pool_name = pool_name
+        self.created_at = time.time()
+        # (pool, image) -> list of snapshots as returned by list_snaps()
+        self.snapshots = {}
+        # (pool, image) -> (pool, image, snap) of its parent, if any
+        self.parents = {}
+        # (pool, image, snap) -> list of (pool, image) cloned from it
+        self.children = {}
+
+    def has_image(self, pool_name, volume_name):
+        return (pool_name, volume_name) in self.snapshots
+
+    def has_snapshot(self, pool_name, volume_name, snap_name):
+        return (pool_name, volume_name, snap_name) in self.children
+
+    def get_snapshots(self, pool_name, volume_name):
+        return self.snapshots[(pool_name, volume_name)]
+
+    def get_parent(self, pool_name, volume_name):
+        return self.parents.get((pool_name, volume_name))
+
+    def get_children(self, pool_name, volume_name, snap_name):
+        return self.children[(pool_name, volume_name, snap_name)]
+
+
+def _invalidates_clone_graph(func):
+    """Drop the cached clone graph once the decorated operation is done."""
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        try:
+            return func(self, *args, **kwargs)
+        finally:
+            self._invalidate_clone_graph()
+    return wrapper
+
 
 class RBDDriver(RBDDriver):
     def __init__(self, *args, **kwargs):
         super(RBDDriver, self).__init__(*args, **kwargs)
+        self.configuration.append_config_values(fh_rbd_opts)
+        self._clone_graphs = {}
+        self._clone_graph_generation = 0
 
-    # ----------------------------- added by zhangjun --------------------------
-    def get_volume_snapshots(self, volume):
+    @_invalidates_clone_graph
+    def create_volume(self, volume):
+        return super(RBDDriver, self).create_volume(volume)
+
+    @_invalidates_clone_graph
+    def create_cloned_volume(self, volume, src_vref):
+        return super(RBDDriver, self).create_cloned_volume(volume, src_vref)
+
+    @_invalidates_clone_graph
+    def create_volume_from_snapshot(self, volume, snapshot):
+        return super(RBDDriver, self).create_volume_from_snapshot(volume,
+                                                                  snapshot)
+
+    @_invalidates_clone_graph
+    def delete_volume(self, volume):
+        return super(RBDDriver, self).delete_volume(volume)
+
+    @_invalidates_clone_graph
+    def create_snapshot(self, snapshot):
+        return super(RBDDriver, self).create_snapshot(snapshot)
+
+    @_invalidates_clone_graph
+    def delete_snapshot(self, snapshot):
+        return super(RBDDriver, self).delete_snapshot(snapshot)
+
+    @_invalidates_clone_graph
+    def clone_image(self, *args, **kwargs):
+        return super(RBDDriver, self).clone_image(*args, **kwargs)
+
+    @_invalidates_clone_graph
+    def _flatten(self, pool, volume_name):
+        return super(RBDDriver, self)._flatten(pool, volume_name)
+
+    @_invalidates_clone_graph
+    def manage_existing(self, volume, existing_ref):
+        return super(RBDDriver, self).manage_existing(volume, existing_ref)
+
+    def _invalidate_clone_graph(self):
+        self._clone_graph_generation += 1
+        self._clone_graphs = {}
+
+    def _build_clone_graph(self, pool_name):
+        """Build the clone graph of a pool over a single connection.
+
+        Every image in the pool is visited, then the graph is extended
+        breadth-first to the parents and clones of those images wherever
+        they live, so chain queries never need to go back to the cluster.
         """
-        get all snapshots created on the volume.
+        LOG.debug('building clone graph for pool %s', pool_name)
+        graph = CloneGraph(pool_name)
+        with RADOSClient(self, pool_name) as client:
+            ioctxs = {pool_name: client.ioctx}
+            try:
+                queue = collections.deque(
+                    (pool_name, name)
+                    for name in self.rbd.RBD().list(client.ioctx))
+                visited = set()
+                while queue:
+                    key = queue.popleft()
+                    if key in visited:
+                        continue
+                    visited.add(key)
+                    pool, name = key
+                    if pool not in ioctxs:
+                        try:
+                            ioctxs[pool] = client.cluster.open_ioctx(
+                                encodeutils.safe_encode(pool))
+                        except self.rados.ObjectNotFound:
+                            LOG.info(_LI("error connecting to ceph pool %s"),
+                                     pool)
+                            ioctxs[pool] = None
+                    if ioctxs[pool] is None:
+                        continue
+                    queue.extend(self._add_image_to_clone_graph(
+                        graph, ioctxs[pool], pool, name))
+            finally:
+                for pool, ioctx in ioctxs.items():
+                    if pool != pool_name and ioctx is not None:
+                        ioctx.close()
+
+        LOG.debug('clone graph for pool %(pool)s has %(count)d images',
+                  {'pool': pool_name, 'count': len(graph.snapshots)})
+        return graph
+
+    def _add_image_to_clone_graph(self, graph, ioctx, pool_name, volume_name):
+        """Record one image in the graph and return its neighbours."""
+        try:
+            image = self.rbd.Image(ioctx, encodeutils.safe_encode(volume_name),
+                                   read_only=True)
+        except self.rbd.ImageNotFound:
+            LOG.info(_LI("volume %s no longer exists in backend"), volume_name)
+            return []
+
+        neighbours = []
+        try:
+            snaps = list(image.list_snaps())
+            try:
+                parent = image.parent_info()
+            except self.rbd.ImageNotFound:
+                parent = None
+            for snap in snaps:
+                image.set_snap(snap['name'])
+                children = [tuple(child) for child in image.list_children()]
+                graph.children[(pool_name, volume_name, snap['name'])] = \
+                    children
+                neighbours.extend(children)
+        finally:
+            image.close()
+
+        graph.snapshots[(pool_name, volume_name)] = snaps
+        if parent is not None and len(parent) == 3:
+            graph.parents[(pool_name, volume_name)] = tuple(parent)
+            neighbours.append((parent[0], parent[1]))
+        return neighbours
+
+    def _get_clone_graph(self, build=True):
+        """Return the clone graph of the configured pool.
+
+        If there is no fresh graph cached one is built, unless build is
+        False in which case None is returned.
         """
-        LOG.debug('get_volume_snapshot starts')
+        ttl = self.configuration.rbd_clone_graph_cache_ttl
+        if ttl <= 0:
+            return None
         pool_name = self.configuration.rbd_pool
-        volume_name = 'volume-%s' % encodeutils.safe_encode(volume["id"])
-        snaps_on_vol = self._get_volume_snapshots(pool_name, volume_name)
+        graph = self._clone_graphs.get(pool_name)
+        if graph is not None and time.time() - graph.created_at < ttl:
+            return graph
+        if not build:
+            return None
+
+        generation = self._clone_graph_generation
+        graph = self._build_clone_graph(pool_name)
+        # do not cache a graph that an operation finished during the build
+        # may already have made stale.
+        if generation == self._clone_graph_generation:
+            self._clone_graphs[pool_name] = graph
+        return graph
+
+    # ----------------------------- added by zhangjun --------------------------
+    def _describe_volume_snapshots(self, snaps_on_vol):
         snapshots = list()
         if snaps_on_vol is not None:
             for snap in snaps_on_vol:
@@ -60,11 +256,61 @@ class RBDDriver(RBDDriver):
                     item["type"] = ""
                     item["uuid"] = ""
                 snapshots.append(item)
+        return snapshots
+
+    def get_volume_snapshots(self, volume):
+        """
+        get all snapshots created on the volume.
+        """
+        LOG.debug('get_volume_snapshot starts')
+        pool_name = self.configuration.rbd_pool
+        volume_name = 'volume-%s' % encodeutils.safe_encode(volume["id"])
+        snaps_on_vol = self._get_volume_snapshots(pool_name, volume_name)
+        snapshots = self._describe_volume_snapshots(snaps_on_vol)
 
         LOG.debug('volume snapshots: %s', snapshots)
         LOG.debug('get_volume_snapshots finished.')
         return snapshots
 
+    def get_volumes_snapshots(self, volumes):
+        """
+        get the snapshots of many volumes over a single connection.
+
+        returns a dict of snapshot lists keyed by volume id.
+        """
+        LOG.debug('get_volumes_snapshots starts')
+        pool_name = self.configuration.rbd_pool
+        graph = self._get_clone_graph(build=False)
+        result = dict()
+        with RADOSClient(self, pool_name) as client:
+            for volume in volumes:
+                volume_name = \
+                    'volume-%s' % encodeutils.safe_encode(volume["id"])
+                if graph is not None and graph.has_image(pool_name,
+                                                         volume_name):
+                    snaps_on_vol = graph.get_snapshots(pool_name,
+                                                       volume_name)
+                else:
+                    snaps_on_vol = self._list_snaps(client.ioctx,
+                                                    volume_name)
+                result[volume["id"]] = \
+                    self._describe_volume_snapshots(snaps_on_vol)
+
+        LOG.debug('get_volumes_snapshots finished for %d volumes.',
+                  len(result))
+        return result
+
+    def _list_snaps(self, ioctx, volume_name):
+        try:
+            image = self.rbd.Image(ioctx, volume_name, read_only=True)
+        except self.rbd.ImageNotFound:
+            LOG.info(_LI("volume %s no longer exists in backend"), volume_name)
+            return None
+        try:
+            return list(image.list_snaps())
+        finally:
+            image.close()
+
     def get_snapshot_children(self, snapshot):
         """
         get all cloned volumes created on the snapshot.
@@ -132,6 +378,9 @@ class RBDDriver(RBDDriver):
         return obj
 
     def _get_volume_snapshots(self, pool_name, volume_name):
+        graph = self._get_clone_graph(build=False)
+        if graph is not None and graph.has_image(pool_name, volume_name):
+            return graph.get_snapshots(pool_name, volume_name)
         try:
             with RBDVolumeProxy(self, volume_name, pool=pool_name) as volume:
                 return volume.list_snaps()
@@ -143,6 +392,10 @@ class RBDDriver(RBDDriver):
             return None
 
     def _get_snapshot_children(self, pool_name, volume_name, snap_name):
+        graph = self._get_clone_graph(build=False)
+        if graph is not None and graph.has_snapshot(pool_name, volume_name,
+                                                    snap_name):
+            return graph.get_children(pool_name, volume_name, snap_name)
         try:
             with RBDVolumeProxy(self, volume_name, pool=pool_name) as volume:
                 try:
@@ -162,6 +415,9 @@ class RBDDriver(RBDDriver):
             return None
 
     def _get_parent_info(self, pool_name, volume_name):
+        graph = self._get_clone_graph(build=False)
+        if graph is not None and graph.has_image(pool_name, volume_name):
+            return graph.get_parent(pool_name, volume_name)
         try:
             with RBDVolumeProxy(self, volume_name, pool=pool_name) as volume:
                 try:
@@ -221,6 +477,8 @@ class RBDDriver(RBDDriver):
         get full clone chain of a volume or snapshot.
         """
         full_clone_chain = dict()
+        # make sure the lookups below are served from the clone graph.
+        self._get_clone_graph()
         # get children clone chain.
         obj = self._generate_chain_obj(pool_name, volume_name, snap_name)
         self._get_children_chain(obj["children"], pool_name, volume_name,
@@ -19,6 +19,8 @@ import json
 import math
 import os
 import tempfile
+import threading
+import time
 import urllib
 
 from oslo_config import cfg
@@ -79,7 +81,18 @@ rbd_opts = [
     cfg.IntOpt('rados_connect_timeout', default=-1,
                help=_('Timeout value (in seconds) used when connecting to '
                       'ceph cluster. If value < 0, no timeout is set and '
-                      'default librados value is used.'))
+                      'default librados value is used.')),
+    cfg.IntOpt('rados_connection_pool_size', default=4,
+               help=_('Maximum number of idle connections to the ceph '
+                      'cluster kept open for reuse. Set to 0 to open a new '
+                      'connection for every operation.')),
+    cfg.IntOpt('rados_connection_idle_timeout', default=300,
+               help=_('Number of seconds an idle pooled connection to the '
+                      'ceph cluster is kept before it is closed.')),
+    cfg.IntOpt('rados_connection_health_check_interval', default=60,
+               help=_('Number of seconds a pooled connection to the ceph '
+                      'cluster may stay idle before it is health checked '
+                      'again prior to reuse.')),
 ]
 
 CONF = cfg.CONF
@@ -194,6 +207,161 @@ class RBDImageIOWrapper(io.RawIOBase):
         pass
 
 
+class _RADOSConnection(object):
+    """A connected librados client and the ioctxs opened on it."""
+    def __init__(self, client):
+        self.client = client
+        self.ioctxs = {}
+        self.last_used = time.time()
+        self.last_checked = self.last_used
+
+    def open_ioctx(self, pool):
+        ioctx = self.ioctxs.get(pool)
+        if ioctx is None:
+            ioctx = self.client.open_ioctx(pool)
+            self.ioctxs[pool] = ioctx
+        return ioctx
+
+    def close(self):
+        # closing an ioctx cannot raise an exception
+        for ioctx in self.ioctxs.values():
+            ioctx.close()
+        self.ioctxs = {}
+        # shutdown cannot raise an exception
+        self.client.shutdown()
+
+
+class RADOSConnectionPool(object):
+    """Pool of long-lived connections to a ceph cluster.
+
+    Connecting to the monitors is far more expensive than most rbd operations
+    so connections, and the ioctx opened for each pool on them, are handed
+    back here when a caller is done with them instead of being shut down.
+    A connection is only used by one caller at a time. Idle connections are
+    health checked before reuse, dropped after errors and evicted once they
+    have been idle for longer than idle_timeout.
+
+    connect is a callable returning a new, connected librados client. It
+    must shut the client down itself if connecting fails.
+    """
+    def __init__(self, connect, rados_error, max_idle=4, idle_timeout=300,
+                 health_check_interval=60):
+        self._connect = connect
+        self._rados_error = rados_error
+        self.max_idle = max_idle
+        self.idle_timeout = idle_timeout
+        self.health_check_interval = health_check_interval
+        self._lock = threading.Lock()
+        # idle connections, least recently used first
+        self._idle = []
+        self._in_use = {}
+
+    def _is_healthy(self, conn):
+        now = time.time()
+        if now - conn.last_checked < self.health_check_interval:
+            return True
+        try:
+            conn.client.get_cluster_stats()
+        except self._rados_error:
+            LOG.warning(_LW("Pooled connection to ceph cluster failed "
+                            "health check, reconnecting."))
+            return False
+        conn.last_checked = now
+        return True
+
+    def _checkout(self):
+        while True:
+            with self._lock:
+                if not self._idle:
+                    return None
+                conn = self._idle.pop()
+            if self._is_healthy(conn):
+                return conn
+            conn.close()
+
+    def _evict(self):
+        deadline = time.time() - self.idle_timeout
+        with self._lock:
+            expired = [conn for conn in self._idle
+                       if conn.last_used < deadline]
+            self._idle = [conn for conn in self._idle
+                          if conn.last_used >= deadline]
+            excess = max(len(self._idle) - max(self.max_idle, 0), 0)
+            expired.extend(self._idle[:excess])
+            del self._idle[:excess]
+        for conn in expired:
+            conn.close()
+
+    def get(self, pool):
+        """Return a (client, ioctx) tuple for the given pool.
+
+        Raises the rados error if the cluster or pool cannot be opened.
+        """
+        conn = self._checkout()
+        if conn is None:
+            conn = _RADOSConnection(self._connect())
+        try:
+            ioctx = conn.open_ioctx(pool)
+        except self._rados_error:
+            conn.close()
+            raise
+        with self._lock:
+            self._in_use[id(conn.client)] = conn
+        return conn.client, ioctx
+
+    def put(self, client, ioctx, discard=False):
+        """Hand a connection obtained from get() back to the pool.
+
+        If discard is True the connection is closed rather than reused, e.g.
+        because an operation on it failed with a rados error.
+        """
+        with self._lock:
+            conn = self._in_use.pop(id(client), None)
+        if conn is None:
+            # not one of ours so just tear it down
+            ioctx.close()
+            client.shutdown()
+            return
+
+        if discard or self.max_idle <= 0:
+            conn.close()
+        else:
+            conn.last_used = time.time()
+            with self._lock:
+                self._idle.append(conn)
+        self._evict()
+
+    def close(self):
+        """Close all idle connections."""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+
+_BACKEND_POOLS = {}
+_BACKEND_POOLS_LOCK = threading.Lock()
+
+
+def get_connection_pool(key, connect, rados_error):
+    """Return the process wide connection pool registered under key.
+
+    Used by callers which are not themselves long-lived, such as the backup
+    drivers, so that connections survive across driver instances.
+    """
+    with _BACKEND_POOLS_LOCK:
+        pool = _BACKEND_POOLS.get(key)
+        if pool is None:
+            pool = RADOSConnectionPool(
+                connect, rados_error,
+                max_idle=CONF.rados_connection_pool_size,
+                idle_timeout=CONF.rados_connection_idle_timeout,
+                health_check_interval=(
+                    CONF.rados_connection_health_check_interval))
+            _BACKEND_POOLS[key] = pool
+        return pool
+
+
 class RBDVolumeProxy(object):
     """Context manager for dealing with an existing rbd volume.
 
@@ -229,12 +397,22 @@ class RBDVolumeProxy(object):
         try:
             self.volume.close()
         finally:
-            self.driver._disconnect_from_rados(self.client, self.ioctx)
+            self.driver._disconnect_from_rados(
+                self.client, self.ioctx,
+                discard=_is_rados_error(self.driver, type_))
 
     def __getattr__(self, attrib):
         return getattr(self.volume, attrib)
 
 
+def _is_rados_error(driver, exc_type):
+    """Whether a connection should be dropped after exc_type was raised."""
+    if exc_type is None:
+        return False
+    return (issubclass(exc_type, driver.rados.Error) and
+            not issubclass(exc_type, driver.rados.ObjectNotFound))
+
+
 class RADOSClient(object):
     """Context manager to simplify error handling for connecting to ceph."""
     def __init__(self, driver, pool=None):
@@ -245,7 +423,9 @@ class RADOSClient(object):
         return self
 
     def __exit__(self, type_, value, traceback):
-        self.driver._disconnect_from_rados(self.cluster, self.ioctx)
+        self.driver._disconnect_from_rados(
+            self.cluster, self.ioctx,
+            discard=_is_rados_error(self.driver, type_))
 
     @property
     def features(self):
@@ -275,6 +455,8 @@ class RBDDriver(driver.VolumeDriver):
             if val is not None:
                 setattr(self.configuration, attr, encodeutils.safe_encode(val))
 
+        self._rados_pool = None
+
     def check_for_setup_error(self):
         """Returns an error if prerequisites aren't met."""
         if rados is None:
@@ -295,36 +477,50 @@ class RBDDriver(driver.VolumeDriver):
             args.extend(['--conf', self.configuration.rbd_ceph_conf])
         return args
 
+    def _new_rados_client(self):
+        client = self.rados.Rados(rados_id=self.configuration.rbd_user,
+                                  conffile=self.configuration.rbd_ceph_conf)
+        try:
+            if self.configuration.rados_connect_timeout >= 0:
+                client.connect(timeout=
+                               self.configuration.rados_connect_timeout)
+            else:
+                client.connect()
+        except self.rados.Error:
+            # shutdown cannot raise an exception
+            client.shutdown()
+            raise
+        return client
+
+    def _get_rados_pool(self):
+        if self._rados_pool is None:
+            conf = self.configuration
+            self._rados_pool = RADOSConnectionPool(
+                self._new_rados_client, self.rados.Error,
+                max_idle=conf.rados_connection_pool_size,
+                idle_timeout=conf.rados_connection_idle_timeout,
+                health_check_interval=(
+                    conf.rados_connection_health_check_interval))
+        return self._rados_pool
+
     def _connect_to_rados(self, pool=None):
         LOG.debug("opening connection to ceph cluster (timeout=%s)." %
                   (self.configuration.rados_connect_timeout))
 
-        client = self.rados.Rados(rados_id=self.configuration.rbd_user,
-                                  conffile=self.configuration.rbd_ceph_conf)
         if pool is not None:
             pool = encodeutils.safe_encode(pool)
         else:
             pool = self.configuration.rbd_pool
 
         try:
-            if self.configuration.rados_connect_timeout >= 0:
-                client.connect(timeout=
-                               self.configuration.rados_connect_timeout)
-            else:
-                client.connect()
-            ioctx = client.open_ioctx(pool)
-            return client, ioctx
+            return self._get_rados_pool().get(pool)
         except self.rados.Error:
             msg = _("Error connecting to ceph cluster.")
             LOG.exception(msg)
-            # shutdown cannot raise an exception
-            client.shutdown()
             raise exception.VolumeBackendAPIException(data=msg)
 
-    def _disconnect_from_rados(self, client, ioctx):
-        # closing an ioctx cannot raise an exception
-        ioctx.close()
-        client.shutdown()
+    def _disconnect_from_rados(self, client, ioctx, discard=False):
+        self._get_rados_pool().put(client, ioctx, discard=discard)
 
     def _get_backup_snaps(self, rbd_image):
         """Get list of any backup snapshots that exist on this volume.
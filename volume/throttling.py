@@ -45,6 +45,14 @@ class Throttle(object):
     def __init__(self, prefix=None):
         self.prefix = prefix or []
 
+    def get_bps_limit(self):
+        """Return the bandwidth limit of copies done in process.
+
+        0 means unlimited, and None that the limit can only be applied to a
+        sub-command.
+        """
+        return None if self.prefix else 0
+
     @contextlib.contextmanager
     def subcommand(self, srcpath, dstpath):
         """Throttle disk I/O bandwidth used by a sub-command, such as 'dd',
@@ -71,6 +79,9 @@ class BlkioCgroup(Throttle):
                       {'name': cgroup_name})
             raise
 
+    def get_bps_limit(self):
+        return self.bps_limit
+
     def _get_device_number(self, path):
         try:
             return utils.get_blkdev_major_minor(path)
@@ -15,7 +15,9 @@
 """Volume-related Utilities and helpers."""
 
 
+import contextlib
 import math
+import os
 
 from Crypto.Random import random
 from oslo_concurrency import processutils
@@ -30,6 +32,7 @@ from cinder import exception
 from cinder.i18n import _, _LI
 from cinder import rpc
 from cinder import utils
+from cinder.volume import copy_engine
 from cinder.volume import throttling
 
 
@@ -312,6 +315,41 @@ def _copy_volume(prefix, srcstr, deststr, size_in_m, blocksize, sync=False,
     # Perform the copy
     start_time = timeutils.utcnow()
     execute(*cmd, run_as_root=True)
+    _log_copy_details(srcstr, deststr, size_in_m, start_time)
+
+
+@contextlib.contextmanager
+def _temporary_access(path, mode):
+    """Chown an existing path this process can't access for a copy."""
+    if os.path.exists(path) and not os.access(path, mode):
+        with utils.temporary_chown(path):
+            yield
+    else:
+        yield
+
+
+def _copy_volume_native(srcstr, deststr, size_in_m, blocksize, sync=False,
+                        progress=None, bps_limit=0):
+    blocksize, count = _calculate_count(size_in_m, blocksize)
+    bs = strutils.string_to_bytes('%sB' % blocksize)
+
+    start_time = timeutils.utcnow()
+    copy = copy_engine.VolumeCopy(srcstr, deststr, count * bs, bs,
+                                  io_depth=CONF.volume_copy_io_depth,
+                                  sync=sync, progress=progress,
+                                  sparse=CONF.volume_copy_sparse,
+                                  bps_limit=bps_limit)
+    with _temporary_access(srcstr, os.R_OK), \
+            _temporary_access(deststr, os.W_OK):
+        copy.run()
+    if copy.zeroed:
+        LOG.debug("Skipped writing %(zeroed)d bytes of zeroes copying "
+                  "%(src)s to %(dest)s.",
+                  {'zeroed': copy.zeroed, 'src': srcstr, 'dest': deststr})
+    _log_copy_details(srcstr, deststr, size_in_m, start_time)
+
+
+def _log_copy_details(srcstr, deststr, size_in_m, start_time):
     duration = timeutils.delta_seconds(start_time, timeutils.utcnow())
 
     # NOTE(jdg): use a default of 1, mostly for unit test, but in
@@ -329,10 +367,39 @@ def _copy_volume(prefix, srcstr, deststr, size_in_m, blocksize, sync=False,
     LOG.info(mesg % {'size_in_m': size_in_m, 'mbps': mbps})
 
 
+def _use_native_copy(srcstr, deststr, bps_limit, ionice):
+    if CONF.volume_copy_engine != 'native':
+        return False
+    # ionice, and throttles that aren't a bandwidth limit, only apply to a
+    # sub-command
+    if bps_limit is None or ionice is not None:
+        LOG.debug("Using dd to copy %(src)s to %(dest)s because the copy "
+                  "is throttled.", {'src': srcstr, 'dest': deststr})
+        return False
+    if not copy_engine.can_copy(srcstr, deststr):
+        LOG.debug("Using dd to copy %(src)s to %(dest)s because the "
+                  "target can't be created without root helper.",
+                  {'src': srcstr, 'dest': deststr})
+        return False
+    return True
+
+
 def copy_volume(srcstr, deststr, size_in_m, blocksize, sync=False,
-                execute=utils.execute, ionice=None, throttle=None):
+                execute=utils.execute, ionice=None, throttle=None,
+                progress=None):
+    """Copy size_in_m MB from srcstr to deststr.
+
+    progress is only called by the native copy engine, with the number of
+    bytes copied so far and the total.
+    """
     if not throttle:
         throttle = throttling.Throttle.get_default()
+    bps_limit = throttle.get_bps_limit()
+    if _use_native_copy(srcstr, deststr, bps_limit, ionice):
+        _copy_volume_native(srcstr, deststr, size_in_m, blocksize,
+                            sync=sync, progress=progress,
+                            bps_limit=bps_limit)
+        return
     with throttle.subcommand(srcstr, deststr) as throttle_cmd:
         _copy_volume(throttle_cmd['prefix'], srcstr, deststr,
                      size_in_m, blocksize, sync=sync,